@@ -1,33 +1,35 @@
-import json
-from datetime import datetime
+import argparse
+import bisect
+import time
+from datetime import datetime, timezone
 from pathlib import Path
 
+import tasmota_rollups
+import tasmota_series
 
-def _safe_float(value):
-    if value is None:
-        return None
-    if isinstance(value, (int, float)):
-        return float(value)
-    if isinstance(value, str):
-        value = value.strip()
-        if not value or value.upper() == "N/A":
-            return None
+
+def _load_columnar_series(data_dir: Path):
     try:
-        return float(value)
-    except (TypeError, ValueError):
-        return None
+        import tasmota_columnar
+    except ImportError:
+        print("numpy is missing. Install with: pip install -r requirements.txt")
+        return []
+    return tasmota_columnar.load_cost_series(data_dir, data_dir / "_columns")
 
 
-def _parse_iso_ts(value):
-    if not value:
-        return None
+def _load_sqlite_series(data_dir: Path, days=None):
+    import tasmota_sqlite
+
+    since = datetime.fromtimestamp(time.time() - days * 86400, timezone.utc) if days else None
+    conn = tasmota_sqlite.connect(data_dir / "tasmota.sqlite3")
     try:
-        return datetime.fromisoformat(str(value))
-    except ValueError:
-        return None
+        return tasmota_sqlite.load_cost_series(conn, since=since)
+    finally:
+        conn.close()
 
 
-def generate_cost_plot_per_device(data_dir: Path, output_png: Path):
+def generate_cost_plot_per_device(data_dir: Path, output_png: Path, backend: str = "auto", days=None,
+                                  max_points=None, downsample="minmax"):
     try:
         import matplotlib.pyplot as plt
         import matplotlib.dates as mdates
@@ -39,49 +41,39 @@ def generate_cost_plot_per_device(data_dir: Path, output_png: Path):
         print(f"data folder not found: {data_dir}")
         return None
 
-    series_by_device = []  # list of (label, times[], eur[])
-
-    for path in sorted(data_dir.glob("*.json")):
-        try:
-            device_log = json.loads(path.read_text(encoding="utf-8"))
-        except Exception:
-            continue
-
-        dev = device_log.get("device") or {}
-        label = dev.get("hostname") or dev.get("name") or path.stem
-        baseline_kwh = _safe_float(dev.get("baseline_total_kwh"))
-        points = []
-
-        for e in device_log.get("entries") or []:
-            ts = _parse_iso_ts(e.get("ts"))
-            if ts is None:
-                continue
-            cost_since = _safe_float(e.get("cost_since_first_seen_eur"))
-            if cost_since is None:
-                total_kwh = _safe_float(e.get("total_kwh"))
-                price = _safe_float(e.get("price_eur_per_kwh"))
-                if baseline_kwh is not None and total_kwh is not None and price is not None:
-                    cost_since = max(total_kwh - baseline_kwh, 0.0) * price
-
-            if cost_since is None:
-                continue
-
-            points.append((ts, cost_since))
-
-        if not points:
-            continue
-
-        points.sort(key=lambda x: x[0])
-        times = [p[0] for p in points]
-        eur = [p[1] for p in points]
-        series_by_device.append((str(label), times, eur))
+    since = time.time() - days * 86400 if days else None
+    if backend == "auto":
+        backend = "rollups" if tasmota_rollups.prefer_rollups(data_dir, since) else "json"
+
+    # list of (label, times[], eur[])
+    if backend == "rollups":
+        series_by_device = [
+            (label, tasmota_series.to_plot_times(times), eur)
+            for label, times, eur in tasmota_rollups.cost_series(data_dir, since)
+        ]
+    elif backend == "columnar":
+        series_by_device = _load_columnar_series(data_dir)
+    elif backend == "sqlite":
+        series_by_device = _load_sqlite_series(data_dir, days)
+    else:
+        series_by_device = []
+        for label, times, eur in tasmota_series.load_cost_series_cached(data_dir):
+            if since is not None:
+                start = bisect.bisect_left(times, since)  # epoch seconds, sorted
+                times, eur = times[start:], eur[start:]
+            if len(times):
+                series_by_device.append((label, tasmota_series.to_plot_times(times), eur))
 
     if not series_by_device:
         print(f"No plottable cost data in: {data_dir}")
         return None
 
+    dpi = 150
     fig, ax = plt.subplots(figsize=(12, 6))
+    if max_points is None:
+        max_points = int(fig.get_figwidth() * dpi)  # one point per pixel column
     for label, times, eur in series_by_device:
+        times, eur = tasmota_series.downsample_series(times, eur, max_points, downsample)
         ax.plot(times, eur, linewidth=2, label=label)
 
     ax.set_ylabel("EUR")
@@ -93,7 +85,7 @@ def generate_cost_plot_per_device(data_dir: Path, output_png: Path):
 
     output_png.parent.mkdir(parents=True, exist_ok=True)
     fig.tight_layout()
-    fig.savefig(output_png, dpi=150)
+    fig.savefig(output_png, dpi=dpi)
     print(f"Plot saved: {output_png}")
 
     try:
@@ -105,7 +97,20 @@ def generate_cost_plot_per_device(data_dir: Path, output_png: Path):
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Plot cost over time from the device logs.")
+    parser.add_argument("--backend", choices=("auto", "json", "rollups", "columnar", "sqlite"), default="auto",
+                        help="read the JSON logs, the hourly/daily rollups, the columnar store (data/_columns) "
+                             "or data/tasmota.sqlite3 (auto: rollups for spans over a week, else JSON)")
+    parser.add_argument("--days", type=float, default=None,
+                        help="plot just the last N days (json, rollups and sqlite backends)")
+    parser.add_argument("--max-points", type=int, default=None,
+                        help="points per device line (default: PNG width in pixels, 0: draw all)")
+    parser.add_argument("--downsample", choices=tasmota_series.DOWNSAMPLE_METHODS, default="minmax",
+                        help="minmax: keep min+max per pixel column, lttb: Largest-Triangle-Three-Buckets")
+    args = parser.parse_args()
+
     root = Path(__file__).resolve().parent
     data_dir = root / "data"
     out = root / "tasmota_cost_plot.png"
-    generate_cost_plot_per_device(data_dir, out)
+    generate_cost_plot_per_device(data_dir, out, backend=args.backend, days=args.days,
+                                  max_points=args.max_points, downsample=args.downsample)
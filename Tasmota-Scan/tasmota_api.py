@@ -0,0 +1,281 @@
+import argparse
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import requests
+
+import tasmota_http
+import tasmota_registry
+import tasmota_scan
+
+# Local caching API for the switch-control page (and anything else that wants
+# the state of the whole fleet).
+#
+# Browsers never talk to the plugs: every client reads one cached JSON list,
+# so device load doesn't grow with the number of open tabs. The cache is fed
+# by the logger loop after every poll; entries older than CACHE_TTL are
+# refreshed on demand with one concurrent `State` round (single flight: other
+# requests wait for the running refresh instead of starting their own), and
+# an offline plug only costs its adaptive timeout / open circuit, not a stalled
+# page. Toggles are proxied to the device and update the cache.
+#
+#   GET  /                                 Tasmota_switch_control.html
+#   GET  /api/devices                      {"ttl_s": 5, "devices": [{mac, ip, hostname, power_state, ...}]}
+#   GET  /api/devices/<mac|ip|hostname>    one device
+#   POST /api/devices/<mac|ip|hostname>/power?state=toggle|on|off
+#
+#   python tasmota_api.py --port 8780
+#   (or inside the logger loop: tasmota_logger_loop.main(api_port=8780))
+
+API_PORT = 8780
+CACHE_TTL = 5.0
+REFRESH_CONCURRENCY = 16
+REFRESH_TIMEOUT = 2.0
+POWER_STATES = {"toggle": "Toggle", "on": "On", "off": "Off"}
+
+
+def _power_state(reply):
+    """POWER (or POWER1 on multi-relay devices) from a State/Power reply."""
+    return reply.get("POWER", reply.get("POWER1"))
+
+
+def _set_power_state(entry, power):
+    """New relay state; the cached power draw only stays valid if it didn't change."""
+    if power != entry["power_state"]:
+        entry["power_w"] = 0.0 if power == "OFF" else None
+    entry["power_state"] = power
+
+
+class DeviceCache:
+    """Last known state per device, keyed by MAC (IP if the MAC is unknown)."""
+
+    def __init__(self, ttl=CACHE_TTL, clock=time.monotonic):
+        self.ttl = ttl
+        self.clock = clock
+        self.refreshes = 0
+        self._devices = {}
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+
+    def _entry(self, mac, ip):
+        key = mac or ip
+        if mac and ip in self._devices:
+            self._devices.setdefault(key, self._devices.pop(ip))  # IP-only entry, MAC now known
+        entry = self._devices.setdefault(key, {"mac": mac, "ip": ip, "hostname": None, "power_state": None,
+                                               "power_w": None, "online": None, "error": None, "fetched": None})
+        entry["mac"] = entry["mac"] or mac
+        return entry
+
+    def add_known(self, registry):
+        """Add registry devices that aren't cached yet (state unknown until the first refresh)."""
+        with self._lock:
+            for mac, d in registry["devices"].items():
+                entry = self._entry(mac, d.get("ip"))
+                entry["ip"] = entry["ip"] or d.get("ip")
+                entry["hostname"] = entry["hostname"] or d.get("hostname")
+
+    def update(self, devices):
+        """Record scan results (dicts as returned by tasmota_scan.scan_network)."""
+        now = self.clock()
+        with self._lock:
+            for d in devices:
+                if not d.get("ip"):
+                    continue
+                entry = self._entry(d.get("mac"), d["ip"])
+                entry.update(ip=d["ip"], hostname=d.get("hostname") or entry["hostname"],
+                             power_state=d.get("power_state"), power_w=d.get("power_w"),
+                             online=True, error=None, fetched=now)
+
+    def find(self, ident):
+        ident = unquote(str(ident)).strip()
+        mac = ident.upper().replace("-", ":")
+        with self._lock:
+            for entry in self._devices.values():
+                entry_mac = entry["mac"] or ""
+                if mac in (entry_mac, entry_mac.replace(":", "")) or ident == entry["ip"] \
+                        or ident.casefold() == str(entry["hostname"] or "").casefold():
+                    return entry
+        return None
+
+    def _stale(self, max_age):
+        now = self.clock()
+        with self._lock:
+            return [e for e in self._devices.values()
+                    if e["ip"] and (e["fetched"] is None or now - e["fetched"] >= max_age)]
+
+    def _poll(self, entry):
+        try:
+            state = tasmota_http.send_command(entry["ip"], "State", timeout=REFRESH_TIMEOUT)
+            update = {"online": True, "error": None}
+            if state.get("Hostname"):
+                update["hostname"] = state["Hostname"]
+        except (requests.RequestException, ValueError) as exc:
+            state = None
+            update = {"online": False, "error": type(exc).__name__}
+        update["fetched"] = self.clock()
+        with self._lock:
+            entry.update(update)
+            if state is not None:
+                _set_power_state(entry, _power_state(state))
+
+    def refresh(self, max_age=None):
+        """Poll every device older than `max_age` (default: the TTL); one refresh at a time."""
+        max_age = self.ttl if max_age is None else max_age
+        if not self._stale(max_age):
+            return 0
+        generation = self.refreshes
+        with self._refresh_lock:
+            if self.refreshes != generation:
+                return 0  # waited for a refresh that ran meanwhile: use its result
+            stale = self._stale(max_age)
+            if stale:
+                with ThreadPoolExecutor(max_workers=max(1, min(REFRESH_CONCURRENCY, len(stale)))) as executor:
+                    list(executor.map(self._poll, stale))
+                self.refreshes += 1
+            return len(stale)
+
+    def snapshot(self, entries=None):
+        """Copies of all cached devices (or of `entries`) with their age instead of the fetch time."""
+        now = self.clock()
+        with self._lock:
+            devices = [dict(e) for e in (self._devices.values() if entries is None else entries)]
+        for d in devices:
+            fetched = d.pop("fetched")
+            d["age_s"] = None if fetched is None else round(now - fetched, 1)
+        devices.sort(key=lambda d: (str(d["hostname"] or "").casefold(), str(d["ip"] or "")))
+        return devices
+
+    def devices(self):
+        self.refresh()
+        return self.snapshot()
+
+    def set_power(self, entry, state="toggle"):
+        """Proxy `Power <state>` to the device; returns the new POWER value.
+
+        A toggle is sent once: a re-sent request after a dropped connection
+        could switch the relay back.
+        """
+        reply = tasmota_http.send_command(entry["ip"], f"Power {POWER_STATES[state]}", timeout=REFRESH_TIMEOUT,
+                                          retries=0 if state == "toggle" else tasmota_http.RETRIES)
+        power = _power_state(reply)
+        with self._lock:
+            entry.update(online=True, error=None, fetched=self.clock())
+            _set_power_state(entry, power)
+        return power
+
+
+# Process-wide cache: the logger loop feeds it, the API serves it.
+CACHE = DeviceCache()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = "TasmotaAPI/1"
+
+    def _send(self, status, body, content_type="application/json"):
+        if not isinstance(body, bytes):
+            body = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", f"{content_type}; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Cache-Control", "no-store")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _route(self):
+        url = urlsplit(self.path)
+        parts = [p for p in url.path.split("/") if p]
+        return parts, parse_qs(url.query)
+
+    def do_GET(self):
+        cache = self.server.cache
+        parts, _query = self._route()
+        if not parts or parts == ["Tasmota_switch_control.html"]:
+            try:
+                self._send(200, tasmota_scan.SWITCH_CONTROL_HTML.read_bytes(), "text/html")
+            except OSError:
+                self._send(404, {"error": "switch-control page not found"})
+        elif parts == ["api", "devices"]:
+            self._send(200, {"ttl_s": cache.ttl, "devices": cache.devices()})
+        elif len(parts) == 3 and parts[:2] == ["api", "devices"]:
+            entry = cache.find(parts[2])
+            if entry is None:
+                self._send(404, {"error": f"unknown device: {unquote(parts[2])}"})
+                return
+            cache.refresh()
+            self._send(200, cache.snapshot([entry])[0])
+        else:
+            self._send(404, {"error": "not found"})
+
+    def do_POST(self):
+        cache = self.server.cache
+        parts, query = self._route()
+        if len(parts) != 4 or parts[:2] != ["api", "devices"] or parts[3] != "power":
+            self._send(404, {"error": "not found"})
+            return
+        state = (query.get("state") or ["toggle"])[0].lower()
+        if state not in POWER_STATES:
+            self._send(400, {"error": f"state must be one of {', '.join(POWER_STATES)}"})
+            return
+        entry = cache.find(parts[2])
+        if entry is None or not entry["ip"]:
+            self._send(404, {"error": f"unknown device: {unquote(parts[2])}"})
+            return
+        try:
+            power = cache.set_power(entry, state)
+        except (requests.RequestException, ValueError) as exc:
+            self._send(502, {"error": f"{entry['ip']}: {type(exc).__name__}"})
+            return
+        self._send(200, {"mac": entry["mac"], "ip": entry["ip"], "hostname": entry["hostname"], "POWER": power})
+
+    def log_message(self, *args):
+        pass
+
+
+class ApiServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, cache):
+        super().__init__(address, _Handler)
+        self.cache = cache
+
+
+def start_api(port=API_PORT, host="127.0.0.1", cache=None):
+    """Serve the API from a daemon thread; returns the server (its cache is `server.cache`)."""
+    server = ApiServer((host, port), CACHE if cache is None else cache)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Cached device state + toggle proxy for the switch-control page.")
+    parser.add_argument("--host", default="127.0.0.1", help="listen address (default: %(default)s)")
+    parser.add_argument("--port", type=int, default=API_PORT)
+    parser.add_argument("--ttl", type=float, default=CACHE_TTL, help="seconds a cached state is served")
+    args = parser.parse_args(argv)
+
+    tasmota_scan._ensure_utf8_stdout()
+    CACHE.ttl = args.ttl
+    CACHE.add_known(tasmota_registry.load_registry())
+    try:
+        server = ApiServer((args.host, args.port), CACHE)
+    except OSError as exc:
+        print(f"❌ Cannot listen on {args.host}:{args.port}: {exc}")
+        return 2
+    print(f"🌐 Switch control: http://{args.host}:{args.port}/ ({len(CACHE.snapshot())} known device(s), "
+          f"cache {args.ttl:g} s)")
+    print("⛔ Stop with Ctrl+C")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
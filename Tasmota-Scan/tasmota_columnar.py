@@ -0,0 +1,215 @@
+import argparse
+import sys
+import time
+from array import array
+from pathlib import Path
+
+import tasmota_scan
+
+# Optional columnar snapshot store: one binary file per column per device.
+#
+#   data/_columns/<stem>/ts.i8                 int64 epoch seconds (UTC)
+#   data/_columns/<stem>/<metric>.f8           float64, NaN = missing
+#
+# Files are little-endian and append-only, so writing a snapshot appends a few
+# bytes per column. Readers map them with numpy.memmap: loading years of
+# 10-minute data costs a handful of page faults instead of parsing dicts.
+# A torn write (crash between columns) is tolerated by trimming all columns
+# to the shortest one on read; the next append truncates the files to that
+# length first, so new rows land at the same offset in every column.
+
+COLUMNS_DIR = tasmota_scan.DATA_DIR / "_columns"
+
+TIME_COLUMN = "ts"
+METRIC_COLUMNS = (
+    "total_kwh",
+    "today_kwh",
+    "yesterday_kwh",
+    "power_w",
+    "voltage_v",
+    "current_a",
+    "price_eur_per_kwh",
+    "cost_total_eur",
+    "cost_since_first_seen_eur",
+    "wifi_signal_dbm",
+    "power_on",
+)
+
+_NAN = float("nan")
+
+
+def _column_path(device_dir: Path, name: str):
+    return device_dir / (f"{name}.i8" if name == TIME_COLUMN else f"{name}.f8")
+
+
+def _entry_epoch(entry):
+    epoch = tasmota_scan._entry_epoch(entry)
+    return int(epoch) if epoch is not None else None
+
+
+def _entry_value(entry, name):
+    if name == "power_on":
+        state = str(entry.get("power_state") or "").upper()
+        return 1.0 if state == "ON" else 0.0 if state == "OFF" else _NAN
+    value = tasmota_scan._safe_float(entry.get(name))
+    return _NAN if value is None else value
+
+
+def _align_columns(device_dir: Path):
+    """Truncate all column files to the row count of the shortest one (torn tail)."""
+    paths = [_column_path(device_dir, name) for name in (TIME_COLUMN,) + METRIC_COLUMNS]
+    sizes = [p.stat().st_size if p.exists() else 0 for p in paths]
+    rows = min(size // 8 for size in sizes)
+    for path, size in zip(paths, sizes):
+        if size != rows * 8:
+            with path.open("r+b") as f:
+                f.truncate(rows * 8)
+    return rows
+
+
+def append_entries(stem: str, entries, columns_dir: Path = COLUMNS_DIR):
+    """Append snapshot entries (dicts as built by log_device_snapshot)."""
+    rows = [(e, _entry_epoch(e)) for e in entries]
+    rows = [(e, epoch) for e, epoch in rows if epoch is not None]
+    if not rows:
+        return 0
+
+    device_dir = columns_dir / stem
+    device_dir.mkdir(parents=True, exist_ok=True)
+    _align_columns(device_dir)
+
+    columns = {TIME_COLUMN: array("q", (epoch for _e, epoch in rows))}
+    for name in METRIC_COLUMNS:
+        columns[name] = array("d", (_entry_value(e, name) for e, _epoch in rows))
+
+    for name, values in columns.items():
+        if sys.byteorder != "little":
+            values.byteswap()
+        with _column_path(device_dir, name).open("ab") as f:
+            values.tofile(f)
+    return len(rows)
+
+
+def device_stems(columns_dir: Path = COLUMNS_DIR):
+    if not columns_dir.exists():
+        return []
+    return sorted(p.name for p in columns_dir.iterdir() if p.is_dir())
+
+
+def load_device_columns(stem: str, names=None, columns_dir: Path = COLUMNS_DIR):
+    """Map the columns of one device read-only (numpy.memmap), equal length."""
+    import numpy as np
+
+    device_dir = columns_dir / stem
+    names = [TIME_COLUMN] + [n for n in (names or METRIC_COLUMNS) if n != TIME_COLUMN]
+    paths = {name: _column_path(device_dir, name) for name in names}
+    sizes = {name: (p.stat().st_size if p.exists() else 0) for name, p in paths.items()}
+    rows = min(size // 8 for size in sizes.values())
+
+    columns = {}
+    for name, path in paths.items():
+        dtype = "<i8" if name == TIME_COLUMN else "<f8"
+        if rows == 0:
+            columns[name] = np.empty(0, dtype=dtype)
+        else:
+            columns[name] = np.memmap(path, dtype=dtype, mode="r", shape=(rows,))
+    return columns
+
+
+def load_cost_series(data_dir: Path = None, columns_dir: Path = COLUMNS_DIR):
+    """(label, times[datetime64], eur[]) per device, like the JSON plot loader.
+
+    Missing cost values fall back to (total_kwh - baseline) * price, with the
+    baseline from the device header in `data_dir`.
+    """
+    import numpy as np
+
+    import tasmota_cost
+
+    data_dir = data_dir or tasmota_scan.DATA_DIR
+    series = []
+    for stem in device_stems(columns_dir):
+        cols = load_device_columns(stem, ("cost_since_first_seen_eur", "total_kwh", "price_eur_per_kwh"), columns_dir)
+        if not len(cols[TIME_COLUMN]):
+            continue
+
+        header = tasmota_scan.load_device_log(data_dir / f"{stem}.json", with_entries=False)
+        dev = header.get("device") or {}
+        label = tasmota_scan._clean_str(dev.get("hostname") or dev.get("name") or stem, default=stem)
+
+        eur = np.array(cols["cost_since_first_seen_eur"], dtype="f8")
+        baseline_kwh = tasmota_scan._safe_float(dev.get("baseline_total_kwh"))
+        missing = np.isnan(eur)
+        if baseline_kwh is not None and missing.any():
+            fallback = tasmota_cost.cost_since_baseline(cols["total_kwh"], cols["price_eur_per_kwh"], baseline_kwh)
+            eur[missing] = fallback[missing]
+
+        keep = ~np.isnan(eur)
+        times = np.asarray(cols[TIME_COLUMN])[keep]
+        eur = eur[keep]
+        if not len(times):
+            continue
+        order = np.argsort(times, kind="stable")
+        series.append((label, times[order].astype("datetime64[s]"), eur[order]))
+    return series
+
+
+def import_device_logs(data_dir: Path = None, columns_dir: Path = COLUMNS_DIR):
+    """(Re)build the columnar store from the JSON/JSONL device logs."""
+    data_dir = data_dir or tasmota_scan.DATA_DIR
+    imported = {}
+    for path in sorted(data_dir.glob("*.json")):
+        device_dir = columns_dir / path.stem
+        if device_dir.exists():
+            for column in device_dir.iterdir():
+                column.unlink()
+        entries = tasmota_scan.load_device_log(path).get("entries") or []
+        imported[path.stem] = append_entries(path.stem, entries, columns_dir)
+    return imported
+
+
+def print_report(columns_dir: Path = COLUMNS_DIR):
+    """Per-device row count, time span, latest total and cost (memmap reads)."""
+    import numpy as np
+
+    started = time.perf_counter()
+    total_bytes = 0
+    lines = []
+    for stem in device_stems(columns_dir):
+        cols = load_device_columns(stem, ("total_kwh", "cost_since_first_seen_eur"), columns_dir)
+        ts = cols[TIME_COLUMN]
+        total_bytes += sum(c.nbytes for c in cols.values())
+        if not len(ts):
+            continue
+        first = np.datetime64(int(ts.min()), "s")
+        last = np.datetime64(int(ts.max()), "s")
+        total = cols["total_kwh"][~np.isnan(cols["total_kwh"])]
+        cost = cols["cost_since_first_seen_eur"][~np.isnan(cols["cost_since_first_seen_eur"])]
+        lines.append(
+            f"  {stem:<28} {len(ts):>8} rows  {first} .. {last}  "
+            f"total {float(total[-1]) if len(total) else 0.0:.3f} kWh  "
+            f"cost {float(cost[-1]) if len(cost) else 0.0:.2f} EUR"
+        )
+    elapsed = time.perf_counter() - started
+    print(f"📊 Columnar store: {columns_dir}")
+    print("\n".join(lines) if lines else "  (empty)")
+    print(f"⏱️  {elapsed * 1000:.1f} ms, {total_bytes / 1e6:.2f} MB mapped")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Columnar (memory-mapped) snapshot store.")
+    parser.add_argument("command", choices=("import", "report"),
+                        help="import: rebuild from data/*.json logs, report: summary per device")
+    args = parser.parse_args(argv)
+
+    tasmota_scan._ensure_utf8_stdout()
+    if args.command == "import":
+        imported = import_device_logs()
+        print(f"📦 Imported {sum(imported.values())} rows for {len(imported)} device(s) into {COLUMNS_DIR}")
+    else:
+        print_report()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
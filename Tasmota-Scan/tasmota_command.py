@@ -0,0 +1,209 @@
+import argparse
+import json
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from urllib3.exceptions import NewConnectionError
+
+import tasmota_http
+import tasmota_registry
+import tasmota_scan
+
+# Send one console command (or a Backlog sequence) to many devices at once.
+#
+# Targets are registry devices selected by hostname glob, MAC or group
+# (data/_meta/groups.json), or plain IPs. All devices are addressed
+# concurrently (COMMAND_CONCURRENCY requests in flight, one per device), so
+# switching off 50 plugs takes about one round trip. Every device gets its
+# own result and retries:
+# - commands that are safe to repeat are retried after connection errors
+# - a toggle ("Power Toggle", "Power2 2") only if the connection failed
+#   before the request was sent (connect timeout, refused): after a timeout
+#   or a reset/disconnect mid-request it may have been executed, so it is
+#   reported, not re-sent
+#
+#   python tasmota_command.py "Power Off" --host "kitchen-*"
+#   python tasmota_command.py "EnergyToday 0" "EnergyYesterday 0" --all     (one Backlog)
+#   python tasmota_command.py --define-group office --host "desk-*" --mac 84:CC:A8:12:34:56
+
+COMMAND_CONCURRENCY = 32
+COMMAND_TIMEOUT = 3.0
+COMMAND_RETRIES = 2
+# Tasmota executes at most 30 commands per Backlog.
+BACKLOG_MAX = 30
+# Commands that flip state: sending them twice undoes the first one.
+_TOGGLE_RE = re.compile(r"toggle|\bpower\d*\s+2\b", re.IGNORECASE)
+
+
+def backlog(commands):
+    """Console command(s) for `commands`: one command, or Backlog chunks of at most BACKLOG_MAX."""
+    commands = [c.strip() for c in commands if c and c.strip()]
+    if len(commands) == 1:
+        return commands
+    return ["Backlog " + "; ".join(commands[i:i + BACKLOG_MAX]) for i in range(0, len(commands), BACKLOG_MAX)]
+
+
+def _repeatable(command):
+    """False for toggles ("Power Toggle", "Power<N> 2", also inside a Backlog)."""
+    return _TOGGLE_RE.search(command) is None
+
+
+def select_targets(registry, hosts=(), macs=(), groups=(), ips=(), all_devices=False, group_defs=None):
+    """Devices to address as dicts (mac, ip, hostname), in hostname order.
+
+    Unknown group names raise KeyError; registry devices without an IP are skipped.
+    """
+    patterns = list(hosts) + list(macs)
+    if groups:
+        group_defs = tasmota_registry.load_groups() if group_defs is None else group_defs
+        for name in groups:
+            patterns += group_defs[name]
+    selected = list(registry["devices"]) if all_devices else tasmota_registry.match_devices(registry, patterns)
+
+    targets = {}
+    for mac in selected:
+        d = registry["devices"][mac]
+        if d.get("ip"):
+            targets[d["ip"]] = {"mac": mac, "ip": d["ip"], "hostname": d.get("hostname")}
+    for ip in ips:
+        targets.setdefault(ip, {"mac": None, "ip": ip, "hostname": None})
+    return sorted(targets.values(), key=lambda t: (str(t["hostname"] or "").casefold(), t["ip"]))
+
+
+def _never_sent(exc):
+    """True if the request failed while connecting, i.e. the device never saw it."""
+    if isinstance(exc, requests.ConnectTimeout):
+        return True
+    reason = exc.args[0] if exc.args else None
+    reason = getattr(reason, "reason", reason)  # urllib3 MaxRetryError -> cause
+    return isinstance(reason, (NewConnectionError, ConnectionRefusedError))
+
+
+def _deliver(ip, command, timeout, retries):
+    """(JSON reply, error, attempts) of one command to one device."""
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            return tasmota_http.send_command(ip, command, timeout=timeout, retries=0), None, attempt
+        except tasmota_http.CircuitOpenError:
+            return None, "circuit open (device failing), skipped", attempt
+        except (requests.ConnectTimeout, requests.ConnectionError) as exc:
+            error = type(exc).__name__
+            if not _repeatable(command) and not _never_sent(exc):
+                # e.g. RemoteDisconnected / reset after the request was written
+                return None, f"{error} (not repeated: the command may have run)", attempt
+        except requests.Timeout as exc:
+            error = type(exc).__name__
+            if not _repeatable(command):
+                return None, f"{error} (not repeated: the command may have run)", attempt
+        except (requests.RequestException, ValueError) as exc:
+            return None, type(exc).__name__, attempt  # the device answered: retrying won't help
+        if attempt > retries:
+            return None, error, attempt
+        time.sleep(tasmota_http.RETRY_BACKOFF * (2 ** (attempt - 1)))
+
+
+def _send(target, commands, timeout, retries):
+    """Deliver `commands` (in order) to one device; returns its result dict."""
+    result = dict(target, ok=False, responses=[], error=None, attempts=0)
+    started = time.perf_counter()
+    for command in commands:
+        response, error, attempts = _deliver(target["ip"], command, timeout, retries)
+        result["attempts"] += attempts
+        if error is not None:
+            result["error"] = error
+            break  # later Backlog chunks depend on the earlier ones
+        result["responses"].append(response)
+    result["ok"] = result["error"] is None
+    result["seconds"] = time.perf_counter() - started
+    return result
+
+
+def send_to_fleet(targets, commands, concurrency=COMMAND_CONCURRENCY, timeout=COMMAND_TIMEOUT,
+                  retries=COMMAND_RETRIES, on_result=None):
+    """Send console `commands` (list; several become a Backlog) to every target concurrently.
+
+    Returns one result per target: mac, ip, hostname, ok, responses (JSON
+    replies), error, attempts, seconds. `on_result(result)` is called as each
+    device finishes.
+    """
+    commands = backlog(commands)
+    if not targets or not commands:
+        return []
+
+    def _one(target):
+        result = _send(target, commands, timeout, retries)
+        if on_result is not None:
+            on_result(result)
+        return result
+
+    with ThreadPoolExecutor(max_workers=max(1, min(int(concurrency), len(targets)))) as executor:
+        return list(executor.map(_one, targets))
+
+
+def _print_result(result):
+    name = result["hostname"] or result["ip"]
+    if result["ok"]:
+        reply = json.dumps(result["responses"][-1], ensure_ascii=False, separators=(",", ":"))
+        print(f"✅ {name:<24} {result['ip']:<15} {reply[:80]}")
+    else:
+        tries = f" after {result['attempts']} attempt(s)" if result["attempts"] > 1 else ""
+        print(f"❌ {name:<24} {result['ip']:<15} {result['error']}{tries}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Send a Tasmota console command (several: one Backlog) to many devices at once.")
+    parser.add_argument("commands", nargs="*", help='e.g. "Power Off" or "EnergyToday 0" "EnergyYesterday 0"')
+    parser.add_argument("--host", action="append", default=[], help="hostname glob, e.g. 'kitchen-*' (repeatable)")
+    parser.add_argument("--mac", action="append", default=[], help="device MAC (repeatable)")
+    parser.add_argument("--group", action="append", default=[], help="group from data/_meta/groups.json")
+    parser.add_argument("--ip", action="append", default=[], help="address a device directly (repeatable)")
+    parser.add_argument("--all", action="store_true", help="every device in the registry")
+    parser.add_argument("--define-group", metavar="NAME",
+                        help="save the --host/--mac selectors as group NAME (nothing is sent)")
+    parser.add_argument("--list", action="store_true", help="only print the selected devices")
+    parser.add_argument("--concurrency", type=int, default=COMMAND_CONCURRENCY)
+    parser.add_argument("--timeout", type=float, default=COMMAND_TIMEOUT)
+    parser.add_argument("--retries", type=int, default=COMMAND_RETRIES)
+    args = parser.parse_args(argv)
+
+    tasmota_scan._ensure_utf8_stdout()
+    if args.define_group:
+        groups = tasmota_registry.load_groups()
+        groups[args.define_group] = args.host + args.mac
+        tasmota_registry.save_groups(groups)
+        print(f"👥 Group {args.define_group}: {', '.join(groups[args.define_group]) or '(empty)'}")
+        return 0
+
+    registry = tasmota_registry.load_registry()
+    try:
+        targets = select_targets(registry, hosts=args.host, macs=args.mac, groups=args.group, ips=args.ip,
+                                 all_devices=args.all)
+    except KeyError as exc:
+        print(f"❌ Unknown group: {exc.args[0]}")
+        return 2
+    if not targets:
+        print("❌ No devices selected (use --host, --mac, --group, --ip or --all).")
+        return 2
+    if args.list or not args.commands:
+        for t in targets:
+            print(f"📟 {t['hostname'] or '-':<24} {t['ip']:<15} {t['mac'] or ''}")
+        return 0
+
+    commands = backlog(args.commands)
+    print(f"📨 {' / '.join(commands)} -> {len(targets)} device(s)")
+    started = time.perf_counter()
+    results = send_to_fleet(targets, args.commands, concurrency=args.concurrency, timeout=args.timeout,
+                            retries=args.retries, on_result=_print_result)
+    ok = sum(1 for r in results if r["ok"])
+    print(f"{'🎯' if ok == len(results) else '⚠️ '} {ok}/{len(results)} device(s) OK "
+          f"in {time.perf_counter() - started:.2f} s")
+    return 0 if ok == len(results) else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,256 @@
+import argparse
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+
+import tasmota_rollups
+import tasmota_scan
+
+# Vectorised cost engine (numpy).
+#
+# Works on whole columns of a device history (timestamps, total_kwh, price)
+# instead of one entry dict at a time:
+#   - cost_fields():    the stored per-entry cost fields, for all entries at once
+#   - interval_costs(): kWh/EUR per interval and running sums (Tasmota counter
+#                       resets are handled)
+#   - recompute_fleet(): rewrite every stored cost field of every device log in
+#                        one pass, e.g. after the electricity price changed
+# Missing values are NaN in arrays and None in entries.
+
+COST_FIELDS = ("cost_total_eur", "cost_today_eur", "cost_yesterday_eur", "cost_since_first_seen_eur")
+
+_NUMERIC_FIELDS = ("total_kwh", "today_kwh", "yesterday_kwh", "price_eur_per_kwh")
+
+
+def _float_column(entries, key):
+    values = (tasmota_scan._safe_float(e.get(key)) for e in entries)
+    return np.fromiter((np.nan if v is None else v for v in values), dtype="f8", count=len(entries))
+
+
+def _epoch_column(entries):
+    epochs = (tasmota_scan._entry_epoch(e) for e in entries)
+    return np.fromiter((np.nan if v is None else v for v in epochs), dtype="f8", count=len(entries))
+
+
+def entry_columns(entries):
+    """Columns of a list of snapshot entries: ts (epoch) + numeric fields, NaN = missing."""
+    columns = {name: _float_column(entries, name) for name in _NUMERIC_FIELDS}
+    columns["ts"] = _epoch_column(entries)
+    return columns
+
+
+def cost_since_baseline(total_kwh, price, baseline_kwh):
+    """max(total_kwh - baseline, 0) * price, element-wise (NaN without baseline)."""
+    total_kwh = np.asarray(total_kwh, dtype="f8")
+    if baseline_kwh is None:
+        return np.full(total_kwh.shape, np.nan)
+    return np.maximum(total_kwh - baseline_kwh, 0.0) * price
+
+
+def cost_fields(columns, baseline_kwh):
+    """The per-entry cost fields of log_device_snapshot, for whole columns."""
+    price = columns["price_eur_per_kwh"]
+    return {
+        "cost_total_eur": columns["total_kwh"] * price,
+        "cost_today_eur": columns["today_kwh"] * price,
+        "cost_yesterday_eur": columns["yesterday_kwh"] * price,
+        "cost_since_first_seen_eur": cost_since_baseline(columns["total_kwh"], price, baseline_kwh),
+    }
+
+
+def _forward_fill(values):
+    valid = ~np.isnan(values)
+    idx = np.where(valid, np.arange(len(values)), 0)
+    np.maximum.accumulate(idx, out=idx)
+    return values[idx]
+
+
+def interval_costs(ts, total_kwh, price):
+    """Energy and cost per interval between snapshots, plus running sums.
+
+    Inputs are aligned arrays (any order; sorted by `ts` here). Each interval
+    is billed at the price of the snapshot that closes it. A drop of
+    total_kwh is a counter reset (Tasmota EnergyTotal 0, new firmware): the
+    new reading itself counts as the energy since the reset. Missing values
+    are bridged by the previous reading.
+    """
+    ts = np.asarray(ts, dtype="f8")
+    order = np.argsort(ts, kind="stable")
+    ts = ts[order]
+    total = _forward_fill(np.asarray(total_kwh, dtype="f8")[order])
+    price = _forward_fill(np.asarray(price, dtype="f8")[order])
+
+    delta_kwh = np.diff(total, prepend=total[:1])
+    reset = delta_kwh < 0
+    delta_kwh[reset] = total[reset]
+    delta_kwh[np.isnan(delta_kwh)] = 0.0
+    delta_eur = np.nan_to_num(delta_kwh * price)
+    return {
+        "ts": ts,
+        "delta_kwh": delta_kwh,
+        "delta_eur": delta_eur,
+        "cum_kwh": np.cumsum(delta_kwh),
+        "cum_eur": np.cumsum(delta_eur),
+    }
+
+
+def recompute_entries(entries, baseline_kwh, price=None, since=None):
+    """Recompute the cost fields of `entries` in place; returns #entries changed.
+
+    With `price`, entries at/after `since` (epoch seconds; None = all) get
+    that price first.
+    """
+    if not entries:
+        return 0
+    columns = entry_columns(entries)
+    if price is not None:
+        repriced = columns["ts"] >= since if since is not None else slice(None)
+        columns["price_eur_per_kwh"][repriced] = price
+
+    prices = [None if p != p else p for p in columns["price_eur_per_kwh"].tolist()]  # NaN -> None
+    fields = {name: values.tolist() for name, values in cost_fields(columns, baseline_kwh).items()}
+    changed = 0
+    for i, entry in enumerate(entries):
+        updated = {name: (None if fields[name][i] != fields[name][i] else fields[name][i]) for name in COST_FIELDS}
+        if price is not None and prices[i] == price:
+            updated["price_eur_per_kwh"] = price
+        if any(entry.get(name) != value for name, value in updated.items()):
+            entry.update(updated)
+            changed += 1
+    return changed
+
+
+def recompute_fleet(data_dir: Path = None, price=None, since=None, dry_run=False):
+    """Recompute the stored costs of every device log in `data_dir` in one pass.
+
+    Logs are rewritten atomically (schema 1 logs are migrated, keeping a
+    `.v1.bak`). Returns [(file name, entries, changed)].
+    """
+    data_dir = data_dir or tasmota_scan.DATA_DIR
+    results = []
+    for path in sorted(data_dir.glob("*.json")):
+        log = tasmota_scan.load_device_log(path)
+        entries = log.get("entries") or []
+        baseline_kwh = tasmota_scan._safe_float((log.get("device") or {}).get("baseline_total_kwh"))
+        changed = recompute_entries(entries, baseline_kwh, price=price, since=since)
+        results.append((path.name, len(entries), changed))
+
+        new_default = price is not None and since is None and log.get("price_eur_per_kwh_default") != price
+        if dry_run or not (changed or new_default):
+            continue
+        if new_default:
+            log["price_eur_per_kwh_default"] = price
+        if int(log.get("schema_version") or 1) < 2:
+            tasmota_scan.migrate_device_log(path, log)
+        else:
+            tasmota_scan.save_device_log(path, log)
+    return results
+
+
+def fleet_report(data_dir: Path = None, since=None, until=None, raw=False):
+    """Per device: kWh and cost in [since, until) (epoch seconds).
+
+    Read from the rollups: hourly rows for short ranges, daily rows beyond,
+    `since` rounded down to the start of its bucket. `raw=True` sums the
+    interval deltas of every snapshot instead.
+    """
+    data_dir = data_dir or tasmota_scan.DATA_DIR
+    if not raw:
+        return _rollup_report(data_dir, since, until)
+    lo = -np.inf if since is None else since
+    hi = np.inf if until is None else until
+    report = []
+    for path in sorted(data_dir.glob("*.json")):
+        log = tasmota_scan.load_device_log(path)
+        entries = log.get("entries") or []
+        if not entries:
+            continue
+        dev = log.get("device") or {}
+        label = tasmota_scan._clean_str(dev.get("hostname") or dev.get("name") or path.stem, default=path.stem)
+        columns = entry_columns(entries)
+        intervals = interval_costs(columns["ts"], columns["total_kwh"], columns["price_eur_per_kwh"])
+        # An interval belongs to the range of the snapshot that closes it.
+        in_range = (intervals["ts"] >= lo) & (intervals["ts"] < hi)
+        in_range[0] = False
+        if not in_range.any():
+            continue
+        report.append({
+            "label": label,
+            "samples": int(in_range.sum()),
+            "kwh": float(intervals["delta_kwh"][in_range].sum()),
+            "cost_eur": float(intervals["delta_eur"][in_range].sum()),
+        })
+    return report
+
+
+def _rollup_report(data_dir: Path, since, until):
+    period = tasmota_rollups.choose_period(since, until)
+    if since is not None:
+        since = tasmota_rollups.bucket(period, since)[0]
+    return [
+        {
+            "label": label,
+            "samples": sum(r["samples"] for r in rows),
+            "kwh": sum(r["kwh"] for r in rows),
+            "cost_eur": sum(r["cost_eur"] for r in rows),
+        }
+        for label, rows in tasmota_rollups.fleet_rollups(data_dir, period, since, until)
+    ]
+
+
+def _parse_since(value):
+    try:
+        ts = datetime.fromisoformat(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"not an ISO date/time: {value!r}")
+    if ts.tzinfo is None:
+        ts = ts.astimezone()  # local time, like the log timestamps
+    return ts.timestamp()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Vectorised cost engine for the device logs.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    recompute = sub.add_parser("recompute", help="recompute all stored cost fields (e.g. after a price change)")
+    recompute.add_argument("--price", type=float, default=None, help="new price in EUR/kWh (default: keep prices)")
+    recompute.add_argument("--since", type=_parse_since, default=None,
+                           help="only reprice snapshots from this ISO date/time on (default: all)")
+    recompute.add_argument("--dry-run", action="store_true", help="only report what would change")
+    report = sub.add_parser("report", help="kWh and cost per device (from the rollups)")
+    report.add_argument("--days", type=float, default=None, help="only the last N days (default: all)")
+    report.add_argument("--raw", action="store_true",
+                        help="walk every snapshot instead of the hourly/daily rollups")
+    args = parser.parse_args(argv)
+
+    tasmota_scan._ensure_utf8_stdout()
+    started = time.perf_counter()
+    if args.command == "recompute":
+        results = recompute_fleet(price=args.price, since=args.since, dry_run=args.dry_run)
+        entries = sum(r[1] for r in results)
+        changed = sum(r[2] for r in results)
+        verb = "would change" if args.dry_run else "changed"
+        print(f"💶 Recomputed {entries} snapshot(s) of {len(results)} device(s): {changed} {verb} "
+              f"({time.perf_counter() - started:.1f} s)")
+        for name, count, n in results:
+            if n:
+                print(f"  {name:<32} {n:>8} / {count}")
+        if changed and not args.dry_run:
+            print("ℹ️  Rebuild the optional stores: python tasmota_columnar.py import / python tasmota_sqlite.py import")
+    else:
+        since = time.time() - args.days * 86400 if args.days else None
+        rows = fleet_report(since=since, raw=args.raw)
+        title = f"last {args.days:g} day(s)" if args.days else "all data"
+        print(f"💸 Consumption and cost ({title}):")
+        for r in rows:
+            print(f"  {r['label']:<28} {r['samples']:>6} samples    {r['kwh']:>10.3f} kWh  {r['cost_eur']:>10.2f} EUR")
+        total = sum(r["cost_eur"] for r in rows)
+        print(f"  {'TOTAL':<28} {'':>16}  {'':>14}  {total:>10.2f} EUR")
+        if since is not None:
+            print(f"  since {datetime.fromtimestamp(since, timezone.utc).astimezone().isoformat(timespec='minutes')}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
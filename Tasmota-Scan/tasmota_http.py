@@ -0,0 +1,320 @@
+import threading
+import time
+from urllib.parse import quote, urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+from urllib3.connectionpool import HTTPConnectionPool
+
+# Shared HTTP layer for all device calls (status queries, probes, commands).
+#
+# ESP8266 based plugs only have a handful of sockets and are slow at TCP
+# setup, so every request goes through one pooled keep-alive session:
+# - POOL_MAXSIZE_PER_HOST caps the connections kept/opened per device
+#   (requests beyond that wait for a free connection instead of opening more)
+# - connection errors (e.g. a keep-alive socket the device already dropped)
+#   are retried with a short backoff; timeouts are not retried.
+# Per device the round-trip times are tracked (smoothed RTT + variance, as in
+# TCP): the caller's timeout becomes a ceiling and a device that usually
+# answers in 80 ms times out after about ADAPTIVE_MIN_TIMEOUT instead of 2 s.
+# RTT samples start when a pooled connection sends the request, so time spent
+# waiting for a free connection doesn't count as device latency.
+# After BREAKER_THRESHOLD failed calls in a row (each after its retries) a
+# device's circuit opens: requests
+# fail at once (CircuitOpenError) until a single trial request is let through
+# after BREAKER_BASE_S, doubling up to BREAKER_MAX_S while it stays dead.
+
+POOL_MAXSIZE_PER_HOST = 2
+POOL_HOSTS = 1024
+RETRIES = 1
+RETRY_BACKOFF = 0.2
+KEEPALIVE = True
+
+ADAPTIVE_TIMEOUTS = True
+ADAPTIVE_MIN_TIMEOUT = 0.5
+BREAKER_THRESHOLD = 3
+BREAKER_BASE_S = 30.0
+BREAKER_MAX_S = 30 * 60.0
+
+_session = None
+_session_lock = threading.Lock()
+_stats_lock = threading.Lock()
+_hosts_lock = threading.Lock()
+_hosts = {}  # host -> RTT estimate + circuit breaker state (kept across cycles)
+_local = threading.local()  # .sent: when this thread's last request left the pool
+
+
+class CircuitOpenError(requests.ConnectionError):
+    """The device failed repeatedly; it is skipped until its next trial."""
+
+
+def _new_stats():
+    return {
+        "requests": 0,
+        "connections": 0,
+        "errors": 0,
+        "timeouts": 0,
+        "retries": 0,
+        "skipped": 0,
+        "latency_total_s": 0.0,
+        "latency_max_s": 0.0,
+    }
+
+
+_stats = _new_stats()
+
+
+class _CountingConnection(HTTPConnection):
+    """HTTPConnection that counts every TCP connect (incl. reconnects)."""
+
+    def connect(self):
+        with _stats_lock:
+            _stats["connections"] += 1
+        return super().connect()
+
+    def request(self, *args, **kwargs):
+        _local.sent = time.perf_counter()  # the pool handed this connection out
+        return super().request(*args, **kwargs)
+
+
+class _CountingConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _CountingConnection
+
+
+def get_session():
+    """Return the shared pooled session (created on first use)."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=POOL_HOSTS,
+                pool_maxsize=POOL_MAXSIZE_PER_HOST,
+                pool_block=True,
+                max_retries=0,
+            )
+            adapter.poolmanager.pool_classes_by_scheme = dict(
+                adapter.poolmanager.pool_classes_by_scheme, http=_CountingConnectionPool
+            )
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            if not KEEPALIVE:
+                session.headers["Connection"] = "close"
+            _session = session
+        return _session
+
+
+def close_session():
+    """Close all pooled connections (a new session is created on next use)."""
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+
+
+def command_url(ip, cmnd):
+    return f"http://{ip}/cm?cmnd={quote(str(cmnd))}"
+
+
+def _new_host():
+    return {"srtt": None, "rttvar": 0.0, "rto_backoff": 1, "failures": 0,
+            "opens": 0, "open_until": None, "trial": False}
+
+
+def _admit(host, timeout):
+    """Timeout for the next request to `host`; raises CircuitOpenError if it is skipped."""
+    now = time.monotonic()
+    with _hosts_lock:
+        state = _hosts.setdefault(host, _new_host())
+        if state["open_until"] is not None:
+            if now < state["open_until"] or state["trial"]:
+                raise CircuitOpenError(f"circuit open for {host}")
+            state["trial"] = True  # half-open: this request decides
+        if not ADAPTIVE_TIMEOUTS or state["srtt"] is None:
+            return timeout
+        rto = max(ADAPTIVE_MIN_TIMEOUT, (state["srtt"] + 4 * state["rttvar"]) * state["rto_backoff"])
+        if isinstance(timeout, tuple):  # (connect, read) as in requests
+            return tuple(min(t, rto) for t in timeout)
+        return min(timeout, rto)
+
+
+def _host_result(host, elapsed, ok):
+    """Update the RTT estimate (ok) or the failure count / breaker (not ok)."""
+    with _hosts_lock:
+        state = _hosts.setdefault(host, _new_host())
+        state["trial"] = False
+        if ok:
+            if state["srtt"] is None:
+                state["srtt"], state["rttvar"] = elapsed, elapsed / 2
+            else:
+                state["rttvar"] = 0.75 * state["rttvar"] + 0.25 * abs(state["srtt"] - elapsed)
+                state["srtt"] = 0.875 * state["srtt"] + 0.125 * elapsed
+            state.update(rto_backoff=1, failures=0, opens=0, open_until=None)
+            return
+        state["failures"] += 1
+        state["rto_backoff"] = min(state["rto_backoff"] * 2, 8)
+        if state["failures"] >= BREAKER_THRESHOLD:
+            state["opens"] += 1
+            wait = min(BREAKER_BASE_S * 2 ** (state["opens"] - 1), BREAKER_MAX_S)
+            state["open_until"] = time.monotonic() + wait
+
+
+def host_states():
+    """{host: {"state": closed|open|half-open, "srtt_s", "timeout_s", "failures", "retry_in_s"}}."""
+    now = time.monotonic()
+    states = {}
+    with _hosts_lock:
+        for host, state in _hosts.items():
+            if state["open_until"] is None:
+                name = "closed"
+            elif state["trial"] or now >= state["open_until"]:
+                name = "half-open"
+            else:
+                name = "open"
+            srtt = state["srtt"]
+            states[host] = {
+                "state": name,
+                "srtt_s": srtt,
+                "timeout_s": None if srtt is None else max(ADAPTIVE_MIN_TIMEOUT, srtt + 4 * state["rttvar"]),
+                "failures": state["failures"],
+                "retry_in_s": max(state["open_until"] - now, 0.0) if state["open_until"] is not None else None,
+            }
+    return states
+
+
+def format_host_states(states=None):
+    """One summary line: adaptive timeouts and devices whose circuit is open."""
+    states = host_states() if states is None else states
+    timeouts = [s["timeout_s"] for s in states.values() if s["timeout_s"] is not None]
+    parts = []
+    if timeouts:
+        parts.append(f"timeouts {min(timeouts):.1f}-{max(timeouts):.1f} s")
+    opened = sorted((h, s) for h, s in states.items() if s["state"] != "closed")
+    if opened:
+        listed = ", ".join(f"{h} ({_retry_label(s)})" for h, s in opened[:5])
+        more = f" +{len(opened) - 5}" if len(opened) > 5 else ""
+        parts.append(f"{len(opened)} circuit(s) open: {listed}{more}")
+    return "; ".join(parts) or "no devices"
+
+
+def _retry_label(state):
+    if state["state"] == "half-open":
+        return "trial due"
+    return f"retry in {state['retry_in_s']:.0f} s"
+
+
+def reset_hosts():
+    """Forget all RTT estimates and breaker states."""
+    with _hosts_lock:
+        _hosts.clear()
+
+
+def get(url, timeout=2, retries=RETRIES, **kwargs):
+    """GET `url` through the shared session.
+
+    `timeout` is a ceiling: the actual timeout adapts to the device's
+    round-trip times. Raises requests.RequestException like requests.get();
+    CircuitOpenError (a ConnectionError) without a request if the device's
+    circuit is open.
+    """
+    session = get_session()
+    host = urlsplit(url).hostname
+    try:
+        effective_timeout = _admit(host, timeout)  # once per call: retries belong to it
+    except CircuitOpenError:
+        with _stats_lock:
+            _stats["skipped"] += 1
+        raise
+    attempt = 0
+    while True:
+        _local.sent = None
+        started = time.perf_counter()
+        try:
+            response = session.get(url, timeout=effective_timeout, **kwargs)
+        except requests.RequestException as exc:
+            _record(_elapsed(started), error=True, timeout=isinstance(exc, requests.Timeout))
+            retryable = isinstance(exc, requests.ConnectionError) and not isinstance(exc, requests.Timeout)
+            if not retryable or attempt >= retries:
+                _host_result(host, None, ok=False)  # one failure per call, not per attempt
+                raise
+        except Exception:
+            _host_result(host, None, ok=False)  # never leave a half-open trial pending
+            raise
+        else:
+            elapsed = _elapsed(started)
+            _record(elapsed, error=False)
+            _host_result(host, elapsed, ok=True)
+            return response
+        attempt += 1
+        with _stats_lock:
+            _stats["retries"] += 1
+        time.sleep(RETRY_BACKOFF * (2 ** (attempt - 1)))
+
+
+def _elapsed(started):
+    """Seconds since the request was sent (pool wait excluded), else since `started`."""
+    sent = getattr(_local, "sent", None)
+    return time.perf_counter() - (sent if sent is not None and sent >= started else started)
+
+
+def send_command(ip, cmnd, timeout=2, retries=RETRIES):
+    """Send a console command (`cm?cmnd=...`) and return the JSON response.
+
+    Raises requests.RequestException or ValueError (invalid JSON).
+    """
+    response = get(command_url(ip, cmnd), timeout=timeout, retries=retries)
+    response.raise_for_status()
+    return response.json()
+
+
+def _record(elapsed, error, timeout=False):
+    with _stats_lock:
+        _stats["requests"] += 1
+        if error:
+            _stats["errors"] += 1
+        if timeout:
+            _stats["timeouts"] += 1
+        _stats["latency_total_s"] += elapsed
+        if elapsed > _stats["latency_max_s"]:
+            _stats["latency_max_s"] = elapsed
+
+
+def reset_stats():
+    """Start a new measurement window (e.g. one scan cycle)."""
+    global _stats
+    with _stats_lock:
+        _stats = _new_stats()
+
+
+def add_stats(other):
+    """Add counters measured elsewhere (e.g. by a shard worker) to the window."""
+    with _stats_lock:
+        for key in ("requests", "connections", "errors", "timeouts", "retries", "skipped",
+                    "latency_total_s"):
+            _stats[key] += other.get(key) or 0
+        _stats["latency_max_s"] = max(_stats["latency_max_s"], other.get("latency_max_s") or 0.0)
+
+
+def get_stats():
+    """Request/connection/latency counters since the last reset_stats()."""
+    with _stats_lock:
+        stats = dict(_stats)
+    ok = stats["requests"] - stats["errors"]
+    stats["latency_avg_s"] = stats["latency_total_s"] / stats["requests"] if stats["requests"] else 0.0
+    stats["requests_per_connection"] = ok / stats["connections"] if stats["connections"] else 0.0
+    return stats
+
+
+def format_stats(stats=None):
+    stats = stats or get_stats()
+    return (
+        f"{stats['requests']} request(s) over {stats['connections']} connection(s) "
+        f"({stats['requests_per_connection']:.1f} req/conn), "
+        f"avg {stats['latency_avg_s'] * 1000:.0f} ms, max {stats['latency_max_s'] * 1000:.0f} ms, "
+        f"{stats['errors']} error(s)"
+        + (f" ({stats['timeouts']} timeout(s))" if stats.get("timeouts") else "")
+        + f", {stats['retries']} retr{'y' if stats['retries'] == 1 else 'ies'}"
+        + (f", {stats['skipped']} skipped (circuit open)" if stats.get("skipped") else "")
+    )
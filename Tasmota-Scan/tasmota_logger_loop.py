@@ -1,39 +1,204 @@
+import argparse
 import time
+from datetime import datetime, timezone
 from pathlib import Path
 
+import tasmota_api
+import tasmota_metrics
+import tasmota_registry
 import tasmota_scan
+import tasmota_scheduler
 
+# A device that missed this many polls in a row may have a new IP: sweep.
+SWEEP_AFTER_FAILURES = 2
+# After a failed cycle, wait this long before the next one (doubling per
+# failure in a row, up to the base interval).
+ERROR_RETRY_SECONDS = 30
 
-def _countdown(seconds: int):
-    for remaining in range(seconds, 0, -1):
-        mins, secs = divmod(remaining, 60)
-        # One-line countdown (overwrite same line)
-        print(f"⏳ Next scan in: {mins:02d}:{secs:02d}", end="\r", flush=True)
-        time.sleep(1)
+
+def _wait_until(due: float, clock=time.monotonic):
+    """Sleep until monotonic time `due` (one sleep, not a 1-second ticker)."""
+    wait_for = due - clock()
+    if wait_for <= 0:
+        return
+    at = datetime.fromtimestamp(time.time() + wait_for).strftime("%H:%M:%S")
+    print(f"⏳ Next poll at {at} (in {int(wait_for)} s)", end="\r", flush=True)
+    time.sleep(wait_for)
     print(" " * 60, end="\r", flush=True)
 
 
-def main(interval_seconds: int = 10 * 60):
+def _seconds_until_sweep(registry, full_sweep_every: int) -> float:
+    last = tasmota_scan._parse_iso_ts(registry.get("last_full_sweep"))
+    if last is None:
+        return 0.0
+    return max(full_sweep_every - (datetime.now(timezone.utc) - last).total_seconds(), 0.0)
+
+
+def _record_reading(scheduler, d):
+    scheduler.record(d["mac"], ok=True, power_w=d.get("power_w"), power_state=d.get("power_state"))
+
+
+def _sync_scheduler(scheduler, registry, found):
+    """Schedule devices new to the registry; devices already scheduled keep their due time.
+
+    Only new devices and devices backing off (found again, e.g. at a new IP)
+    take their reading from `found`.
+    """
+    tasmota_api.CACHE.update(found)
+    recovered = {mac for mac in registry["devices"] if mac not in scheduler or scheduler.failures(mac)}
+    for mac in recovered:
+        scheduler.add(mac)
+    for d in found:
+        if d.get("mac") in recovered:
+            _record_reading(scheduler, d)
+
+
+def _poll(scheduler, registry, macs):
+    """Poll the due devices at their last known IP; returns True if a sweep is needed."""
+    ips = {registry["devices"][mac]["ip"]: mac for mac in macs if registry["devices"].get(mac, {}).get("ip")}
+    found = tasmota_scan.scan_network(plot=False, targets=list(ips), rewrite_ui=False) if ips else []
+    for mac, old_ip, new_ip in tasmota_registry.update_registry(registry, found):
+        print(f"🔀 {registry['devices'][mac].get('hostname') or mac}: IP changed {old_ip} -> {new_ip}")
+    tasmota_registry.save_registry(registry)
+
+    answered = {d["mac"]: d for d in found if d.get("mac")}
+    sweep = False
+    for mac in macs:
+        if mac in answered:
+            _record_reading(scheduler, answered[mac])
+            continue
+        scheduler.record(mac, ok=False)
+        if scheduler.failures(mac) == SWEEP_AFTER_FAILURES:
+            sweep = True
+    # Devices that answered at a polled IP under another MAC.
+    _sync_scheduler(scheduler, registry, found)
+    return sweep
+
+
+def _sweep_for_missing(scheduler, registry, cidrs=None):
+    """Sweep for the devices that stopped answering at their IP.
+
+    The last IPs of all other known devices are skipped, so their scheduled
+    polls aren't doubled by off-schedule snapshots.
+    """
+    missing = sorted(mac for mac in registry["devices"] if scheduler.failures(mac) >= SWEEP_AFTER_FAILURES)
+    if not missing:
+        return []
+    print(f"🔎 {len(missing)} known device(s) not at their last IP ({', '.join(missing)}), sweeping...")
+    skip = {d["ip"] for mac, d in registry["devices"].items() if d.get("ip") and mac not in missing}
+    found = tasmota_scan.scan_network(plot=False, cidrs=cidrs, exclude=skip, rewrite_ui=False)
+    for mac, old_ip, new_ip in tasmota_registry.update_registry(registry, found):
+        print(f"🔀 {registry['devices'][mac].get('hostname') or mac}: IP changed {old_ip} -> {new_ip}")
+    tasmota_registry.save_registry(registry)
+    _sync_scheduler(scheduler, registry, found)
+    return found
+
+
+def _start_metrics(port):
+    """Serve /metrics (Prometheus text format) from this process; None disables it."""
+    if port is None:
+        return None
+    try:
+        server = tasmota_metrics.start_exporter(port)
+    except OSError as exc:
+        print(f"⚠️  Metrics endpoint not started (port {port}): {exc}")
+        return None
+    print(f"📈 Metrics: http://127.0.0.1:{port}/metrics")
+    return server
+
+
+def _start_api(port, registry):
+    """Serve the cached fleet state (tasmota_api.py) from this process; None disables it."""
+    if port is None:
+        return None
+    tasmota_api.CACHE.add_known(registry)
+    try:
+        server = tasmota_api.start_api(port)
+    except OSError as exc:
+        print(f"⚠️  Switch-control API not started (port {port}): {exc}")
+        return None
+    print(f"🌐 Switch control: http://127.0.0.1:{port}/")
+    return server
+
+
+def _record_schedule(stats):
+    for state in ("fast", "slow", "backoff"):
+        tasmota_metrics.set_gauge("tasmota_scheduled_devices", stats[state], {"state": state},
+                                  "Devices per poll schedule")
+
+
+def main(interval_seconds: int = 10 * 60, full_sweep_every: int = 6 * 60 * 60, cidrs=None,
+         metrics_port: int = tasmota_metrics.METRICS_PORT, api_port: int = None, stores=()):
     tasmota_scan._ensure_utf8_stdout()
+    tasmota_scan.enable_stores(stores)
 
     # Ensure data folder exists (per-device JSON logs)
     Path(tasmota_scan.DATA_DIR).mkdir(parents=True, exist_ok=True)
 
     print("🔁 Tasmota logger loop started")
-    print(f"🕒 Interval: {interval_seconds} seconds (every {interval_seconds // 60} minutes)")
+    print(f"🕒 Base interval: {interval_seconds} seconds per device "
+          f"({tasmota_scheduler.MIN_INTERVAL} s when power changes, "
+          f"{tasmota_scheduler.IDLE_INTERVAL // 60} min when idle/OFF, backoff when unreachable)")
+    print(f"🧭 Full network sweep: every {full_sweep_every // 60} minutes or when a known device goes missing")
+    if tasmota_scan.EXTRA_STORES:
+        print(f"🗄️  Extra stores: {', '.join(tasmota_scan.EXTRA_STORES)}")
+    _start_metrics(metrics_port)
     print("⛔ Stop with Ctrl+C\n")
 
+    # Known devices are polled directly; the registry is built from the logs on first start.
+    registry = tasmota_registry.load_registry()
+    scheduler = tasmota_scheduler.PollScheduler(base_interval=interval_seconds)
+    for mac in registry["devices"]:
+        scheduler.add(mac)
+    sweep_requested = not registry["devices"]
+    errors = 0
+    _start_api(api_port, registry)
+
     while True:
-        started = time.time()
+        due = []
         try:
-            tasmota_scan.scan_network(plot=False)
+            if tasmota_registry.full_sweep_due(registry, full_sweep_every):
+                found = tasmota_registry.run_cycle(registry, full_sweep_every, cidrs=cidrs)
+                _sync_scheduler(scheduler, registry, found)
+                sweep_requested = False
+            elif sweep_requested:
+                # Only look for the missing devices; the others keep their schedule.
+                _sweep_for_missing(scheduler, registry, cidrs)
+                sweep_requested = False
+            else:
+                due = scheduler.pop_due()
+                if due:
+                    sweep_requested = _poll(scheduler, registry, due)
+                    stats = scheduler.summary()
+                    _record_schedule(stats)
+                    print(f"🗓️  {stats['devices']} device(s) scheduled: {stats['fast']} fast, "
+                          f"{stats['slow']} idle, {stats['backoff']} backing off")
+            errors = 0
         except Exception as exc:
             print(f"⚠️  Scan error: {exc}")
+            tasmota_metrics.inc("tasmota_loop_errors_total", help_text="Failed loop cycles")
+            for mac in due:
+                scheduler.record(mac, ok=False)  # back into the queue
+            errors += 1
+
+        next_due = scheduler.next_due()
+        if next_due is None:
+            # Nothing known yet: look again at the base interval.
+            next_due = time.monotonic() + interval_seconds
+            sweep_requested = True
+        wake = min(next_due, time.monotonic() + _seconds_until_sweep(registry, full_sweep_every))
+        if errors:
+            # A failing sweep leaves last_full_sweep unset (always due): don't spin.
+            retry = min(ERROR_RETRY_SECONDS * 2 ** (errors - 1), max(interval_seconds, ERROR_RETRY_SECONDS))
+            wake = max(wake, time.monotonic() + retry)
+        _wait_until(wake)
 
-        elapsed = int(time.time() - started)
-        wait_for = max(interval_seconds - elapsed, 0)
-        _countdown(wait_for)
+def _parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Poll known Tasmota devices and sweep for new ones.")
+    tasmota_scan.add_store_argument(parser)
+    return parser.parse_args(argv)
 
 
 if __name__ == "__main__":
-    main()
+    args = _parse_args()
+    main(stores=args.store)
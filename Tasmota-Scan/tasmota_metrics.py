@@ -0,0 +1,187 @@
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Process-wide scan metrics and a Prometheus text-format exporter.
+#
+# scan_network() reports per-phase timings (discovery, fetch per device, log
+# write, sqlite batch, HTML rewrite, plot, whole cycle), the HTTP counters of
+# tasmota_http, the bytes written to the logs and the latest reading of every
+# device. The logger loop serves them on http://127.0.0.1:METRICS_PORT/metrics
+# so monitoring scrapes one process instead of every plug.
+
+METRICS_PORT = 9110
+
+_lock = threading.Lock()
+_metrics = {}  # name -> {"type", "help", "samples": {label tuple: value or [sum, count]}}
+
+# Latest reading per device -> gauge (entry field, metric name, help).
+_READING_GAUGES = (
+    ("power_w", "tasmota_power_watts", "Active power of the last snapshot"),
+    ("total_kwh", "tasmota_energy_total_kwh", "Energy counter (Total) of the last snapshot"),
+    ("today_kwh", "tasmota_energy_today_kwh", "Energy today of the last snapshot"),
+    ("voltage_v", "tasmota_voltage_volts", "Voltage of the last snapshot"),
+    ("current_a", "tasmota_current_amperes", "Current of the last snapshot"),
+    ("wifi_rssi_percent", "tasmota_wifi_rssi_percent", "WiFi RSSI of the last snapshot"),
+    ("cost_since_first_seen_eur", "tasmota_cost_since_first_seen_eur", "Cost since the device was first logged"),
+    ("ts_epoch", "tasmota_last_seen_timestamp_seconds", "Time of the last snapshot"),
+)
+
+
+def _labels(labels):
+    return tuple(sorted((k, str(v)) for k, v in (labels or {}).items() if v is not None))
+
+
+def _metric(name, kind, help_text):
+    metric = _metrics.get(name)
+    if metric is None:
+        metric = _metrics[name] = {"type": kind, "help": help_text, "samples": {}}
+    return metric
+
+
+def inc(name, value=1.0, labels=None, help_text=""):
+    """Add `value` to a counter."""
+    with _lock:
+        samples = _metric(name, "counter", help_text)["samples"]
+        key = _labels(labels)
+        samples[key] = samples.get(key, 0.0) + value
+
+
+def set_gauge(name, value, labels=None, help_text=""):
+    """Set a gauge (None removes the sample)."""
+    with _lock:
+        samples = _metric(name, "gauge", help_text)["samples"]
+        key = _labels(labels)
+        if value is None:
+            samples.pop(key, None)
+        else:
+            samples[key] = float(value)
+
+
+def observe(name, value, labels=None, help_text=""):
+    """Add one observation to a summary (exported as _sum and _count)."""
+    with _lock:
+        samples = _metric(name, "summary", help_text)["samples"]
+        total = samples.setdefault(_labels(labels), [0.0, 0])
+        total[0] += value
+        total[1] += 1
+
+
+def observe_phase(phase, seconds):
+    """Record one duration of `phase`: last value, sum and count."""
+    observe("tasmota_phase_seconds", seconds, {"phase": phase}, "Time spent per scan phase")
+    set_gauge("tasmota_phase_last_seconds", seconds, {"phase": phase}, "Duration of the last run per scan phase")
+
+
+@contextmanager
+def timed(phase):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_phase(phase, time.perf_counter() - started)
+
+
+def observe_device_fetch(ip, seconds, ok=True):
+    set_gauge("tasmota_device_fetch_seconds", seconds, {"ip": ip}, "Telemetry fetch time of the last poll")
+    if not ok:
+        inc("tasmota_device_fetch_failures_total", 1, {"ip": ip}, "Failed telemetry fetches")
+
+
+def add_storage_bytes(kind, count):
+    inc("tasmota_storage_written_bytes_total", count, {"kind": kind}, "Bytes written to the device logs")
+
+
+def record_http(stats):
+    """Add one cycle's tasmota_http counters to the totals."""
+    for key in ("requests", "connections", "errors", "timeouts", "retries", "skipped"):
+        inc(f"tasmota_http_{key}_total", stats.get(key) or 0, help_text=f"HTTP {key} to devices")
+    if stats.get("latency_max_s") is not None:
+        set_gauge("tasmota_http_latency_max_seconds", stats["latency_max_s"],
+                  help_text="Slowest device request of the last cycle")
+
+
+def record_reading(device, mac, entry):
+    """Latest values of one device (labels: log stem, MAC, IP)."""
+    labels = {"device": device, "mac": mac, "ip": entry.get("ip")}
+    for field, name, help_text in _READING_GAUGES:
+        set_gauge(name, entry.get(field), labels, help_text)
+    power_state = entry.get("power_state")
+    if power_state is not None:
+        set_gauge("tasmota_power_on", 1 if str(power_state).upper() == "ON" else 0, labels, "Relay state (1 = ON)")
+
+
+def record_cycle(devices):
+    inc("tasmota_scan_cycles_total", 1, help_text="Completed scan cycles")
+    set_gauge("tasmota_scan_devices", len(devices), help_text="Devices logged in the last cycle")
+    set_gauge("tasmota_scan_last_timestamp_seconds", time.time(), help_text="End of the last scan cycle")
+
+
+def record_hosts(states):
+    """Circuit breaker state per host (see tasmota_http.host_states)."""
+    with _lock:
+        _metric("tasmota_circuit_open", "gauge", "1 while requests to the device are skipped")["samples"].clear()
+    for host, state in states.items():
+        set_gauge("tasmota_circuit_open", 0 if state["state"] == "closed" else 1, {"host": host})
+        if state.get("timeout_s") is not None:
+            set_gauge("tasmota_device_timeout_seconds", state["timeout_s"], {"host": host},
+                      "Adaptive request timeout")
+
+
+def _sample(name, labels, value):
+    label_text = ",".join(f'{k}="{_escape(v)}"' for k, v in labels)
+    return f"{name}{{{label_text}}} {value!r}" if label_text else f"{name} {value!r}"
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def render():
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    with _lock:
+        for name in sorted(_metrics):
+            metric = _metrics[name]
+            if not metric["samples"]:
+                continue
+            if metric["help"]:
+                lines.append(f"# HELP {name} {metric['help']}")
+            lines.append(f"# TYPE {name} {metric['type']}")
+            for labels, value in sorted(metric["samples"].items()):
+                if metric["type"] == "summary":
+                    lines.append(_sample(f"{name}_sum", labels, value[0]))
+                    lines.append(_sample(f"{name}_count", labels, float(value[1])))
+                else:
+                    lines.append(_sample(name, labels, value))
+    return "\n".join(lines) + "\n"
+
+
+def reset():
+    with _lock:
+        _metrics.clear()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_exporter(port=METRICS_PORT, host="127.0.0.1"):
+    """Serve /metrics from a daemon thread; returns the server."""
+    server = ThreadingHTTPServer((host, port), _Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
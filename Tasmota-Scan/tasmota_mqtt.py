@@ -0,0 +1,325 @@
+import argparse
+import json
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import tasmota_scan
+
+# Push ingestion: log the telemetry Tasmota publishes over MQTT instead of
+# polling every device over HTTP.
+#
+# Every TelePeriod a device publishes
+#   tele/<topic>/STATE   POWER, Wifi, Uptime         -> state_data
+#   tele/<topic>/SENSOR  {"ENERGY": {...}}           -> energy_data + one snapshot
+# and, retained, tasmota/discovery/<MAC>/config (MAC, IP, name).
+# Devices without discovery get a `Status 0` request (cmnd/<topic>/STATUS 0);
+# the answer (stat/<topic>/STATUS0) is parsed like a scan's oneshot fetch.
+# Readings are buffered with their receive time and written every
+# FLUSH_SECONDS with one append per device (same entries, header, manifest
+# and optional stores as a scan).
+#
+# The broker client is optional: `pip install paho-mqtt`. MqttIngest itself
+# only needs handle_message() calls, so it can be fed from a recording
+# (--replay, the output of `mosquitto_sub -v` or `-F "%U %t %p"`).
+
+FLUSH_SECONDS = 30.0
+# Readings kept per device while its identity (MAC) is still unknown.
+MAX_PENDING = 1000
+# Minimum time between two `Status 0` requests to the same device.
+STATUS_RETRY_SECONDS = 60.0
+
+SUBSCRIPTIONS = ("tele/#", "stat/#", "tasmota/discovery/+/config")
+
+
+def _mac_with_colons(mac):
+    """'AABBCCDDEEFF' (discovery) -> 'AA:BB:CC:DD:EE:FF' (like StatusNET)."""
+    mac = tasmota_scan._normalize_mac(mac)
+    if mac and ":" not in mac and len(mac) == 12:
+        mac = ":".join(mac[i:i + 2] for i in range(0, 12, 2))
+    return mac
+
+
+def parse_replay_line(line):
+    """(topic, payload, received epoch or None) of one recorded line, or None."""
+    parts = line.rstrip("\r\n").split(" ", 2)
+    received = None
+    if len(parts) == 3:
+        try:
+            received = float(parts[0])
+            parts = parts[1:]
+        except ValueError:
+            parts = [parts[0], f"{parts[1]} {parts[2]}"]
+    if len(parts) < 2 or not parts[0]:
+        return None
+    return parts[0], parts[1], received
+
+
+class _Device:
+    def __init__(self, topic):
+        self.topic = topic
+        self.device_info = {"ip": None, "mac": None}
+        self.state_data = {}
+        self.has_energy = False
+        self.online = None
+        self.status_requested = None
+        self.pending = []  # (device_info, state_data, energy_data, received)
+
+    @property
+    def identified(self):
+        # The log name comes from the FriendlyName (as in a scan), the MAC pins the device.
+        return bool(tasmota_scan._normalize_mac(self.device_info.get("mac")))
+
+    def add_reading(self, energy_data, received):
+        self.pending.append((dict(self.device_info), dict(self.state_data), energy_data, received))
+        if len(self.pending) > MAX_PENDING:
+            del self.pending[0]
+
+
+class MqttIngest:
+    """Maps Tasmota MQTT messages onto device log snapshots, written in batches.
+
+    `publish(topic, payload)` (optional) is used to request `Status 0` from
+    devices whose MAC is unknown. Thread-safe: messages may arrive
+    on the client's network thread while flush() runs on another.
+    """
+
+    def __init__(self, publish=None, flush_seconds=FLUSH_SECONDS, clock=time.monotonic):
+        self.publish = publish
+        self.flush_seconds = float(flush_seconds)
+        self.clock = clock
+        self.devices = {}
+        self.stats = {"messages": 0, "readings": 0, "written": 0, "flushes": 0}
+        self._lock = threading.Lock()
+        self._last_flush = clock()
+
+    def _device(self, topic):
+        device = self.devices.get(topic)
+        if device is None:
+            device = self.devices[topic] = _Device(topic)
+        return device
+
+    def handle_message(self, topic, payload, received=None):
+        """Process one message; `received` (aware datetime) defaults to now."""
+        received = received or datetime.now(timezone.utc)
+        if isinstance(payload, bytes):
+            payload = payload.decode("utf-8", errors="replace")
+        parts = topic.split("/")
+        if len(parts) < 3:
+            return
+        with self._lock:
+            self.stats["messages"] += 1
+            if parts[0] == "tasmota" and parts[1] == "discovery":
+                self._on_discovery(_load_json(payload))
+                return
+            prefix, kind, device = parts[0], parts[-1].upper(), self._device("/".join(parts[1:-1]))
+            if prefix == "tele" and kind == "LWT":
+                device.online = payload.strip().lower() == "online"
+                return
+            data = _load_json(payload)
+            if data is None:
+                return
+            if prefix == "tele" and kind == "STATE":
+                self._on_state(device, data, received)
+            elif prefix == "tele" and kind == "SENSOR":
+                self._on_sensor(device, data, received)
+            elif prefix == "stat" and kind == "STATUS0":
+                self._on_status0(device, data)
+            else:
+                return
+            self._request_status(device)
+
+    def _on_discovery(self, config):
+        if not config or not config.get("t"):
+            return
+        device = self._device(config["t"])
+        info = device.device_info
+        info["mac"] = _mac_with_colons(config.get("mac")) or info.get("mac")
+        info["ip"] = config.get("ip") or info.get("ip")
+        friendly = [n for n in (config.get("fn") or []) if n]
+        info["name"] = (friendly[0] if friendly else None) or config.get("dn") or info.get("name")
+        info["module"] = config.get("md") or info.get("module")
+        info["version"] = config.get("sw") or info.get("version")
+
+    def _on_state(self, device, data, received):
+        device.state_data = dict(data)
+        wifi = data.get("Wifi") or {}
+        device.device_info["uptime"] = data.get("Uptime", device.device_info.get("uptime"))
+        device.device_info["wifi_ssid"] = wifi.get("SSId", device.device_info.get("wifi_ssid"))
+        device.device_info["wifi_rssi"] = wifi.get("RSSI", device.device_info.get("wifi_rssi"))
+        if not device.has_energy:
+            # Plain switch (no energy monitor): STATE is its only telemetry.
+            device.add_reading(tasmota_scan._fill_energy_data({}, {}), received)
+            self.stats["readings"] += 1
+
+    def _on_sensor(self, device, data, received):
+        energy = data.get("ENERGY")
+        if not isinstance(energy, dict):
+            return
+        if not device.has_energy:
+            # Drop switch-only readings buffered before the first ENERGY.
+            device.pending = []
+            device.has_energy = True
+        if data.get("Time"):
+            device.state_data["Time"] = data["Time"]
+        device.add_reading(tasmota_scan._fill_energy_data({}, energy), received)
+        self.stats["readings"] += 1
+
+    def _on_status0(self, device, data):
+        ip = (data.get("StatusNET") or {}).get("IPAddress") or device.device_info.get("ip")
+        device_info, state_data, energy_data = tasmota_scan.parse_full_status(ip, data)
+        if not data.get("Status"):
+            device_info.pop("name", None)  # "Unknown (<ip>)" placeholder
+        device.device_info.update({k: v for k, v in device_info.items() if v not in (None, "N/A")})
+        device.state_data.update(state_data)
+
+    def _request_status(self, device):
+        if device.identified or self.publish is None:
+            return
+        now = self.clock()
+        if device.status_requested is not None and now - device.status_requested < STATUS_RETRY_SECONDS:
+            return
+        device.status_requested = now
+        try:
+            self.publish(f"cmnd/{device.topic}/STATUS", "0")
+        except Exception as exc:
+            print(f"⚠️  Status request to {device.topic} failed: {exc}")
+
+    def flush_due(self):
+        return self.clock() - self._last_flush >= self.flush_seconds
+
+    def flush(self):
+        """Write all buffered readings of identified devices; returns #entries written."""
+        with self._lock:
+            self._last_flush = self.clock()
+            batch = []
+            for device in self.devices.values():
+                if device.pending and device.identified:
+                    batch.append((device.device_info, device.state_data, device.pending))
+                    device.pending = []
+        if not batch:
+            return 0
+
+        tasmota_scan.load_manifest()
+        snapshots = []
+        for device_info, state_data, readings in batch:
+            _hostname, _mac, stem = tasmota_scan._device_log_stem(device_info, state_data)
+            try:
+                _path, device_log, entries = tasmota_scan.append_snapshots(stem, readings)
+            except Exception as exc:
+                print(f"⚠️  Could not write {stem}: {exc}")
+                continue
+            snapshots.append((stem, device_log.get("device") or {}, entries))
+        tasmota_scan.save_manifest()
+
+        if "sqlite" in tasmota_scan.EXTRA_STORES and snapshots:
+            import tasmota_sqlite
+            tasmota_sqlite.append_snapshot_batch(snapshots, tasmota_scan.DATA_DIR / "tasmota.sqlite3")
+
+        written = sum(len(s[2]) for s in snapshots)
+        self.stats["written"] += written
+        self.stats["flushes"] += 1
+        return written
+
+    def status_line(self):
+        with self._lock:
+            devices = list(self.devices.values())
+        online = sum(1 for d in devices if d.online)
+        waiting = sum(1 for d in devices if d.pending and not d.identified)
+        return (f"{len(devices)} topic(s), {online} online, {waiting} waiting for Status 0; "
+                f"{self.stats['messages']} message(s), {self.stats['written']} snapshot(s) written")
+
+
+def _load_json(payload):
+    try:
+        data = json.loads(payload)
+    except (TypeError, ValueError):
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def replay(ingest, path: Path):
+    """Feed a recorded message file into `ingest` and flush; returns #entries written."""
+    with path.open("r", encoding="utf-8") as f:
+        for line in f:
+            parsed = parse_replay_line(line)
+            if parsed is None:
+                continue
+            topic, payload, received = parsed
+            when = datetime.fromtimestamp(received, timezone.utc) if received is not None else None
+            ingest.handle_message(topic, payload, received=when)
+    return ingest.flush()
+
+
+def run(host="localhost", port=1883, username=None, password=None, flush_seconds=FLUSH_SECONDS):
+    """Subscribe to the broker and ingest until Ctrl+C."""
+    try:
+        import paho.mqtt.client as mqtt
+    except ImportError:
+        print("❌ MQTT ingestion needs paho-mqtt: pip install paho-mqtt")
+        return 2
+
+    api = getattr(mqtt, "CallbackAPIVersion", None)
+    client = mqtt.Client(api.VERSION2) if api is not None else mqtt.Client()
+    if username:
+        client.username_pw_set(username, password)
+    ingest = MqttIngest(publish=lambda topic, payload: client.publish(topic, payload), flush_seconds=flush_seconds)
+
+    def _on_connect(client, userdata, flags, reason_code, *args):
+        # Same signature for the v1 (rc) and v2 (reason_code, properties) callback APIs.
+        print(f"🔌 Connected to {host}:{port} ({reason_code})")
+        for topic in SUBSCRIPTIONS:
+            client.subscribe(topic)
+
+    def _on_message(client, userdata, msg):
+        ingest.handle_message(msg.topic, msg.payload)
+
+    client.on_connect = _on_connect
+    client.on_message = _on_message
+    client.connect(host, port)
+    client.loop_start()
+    try:
+        while True:
+            time.sleep(1.0)
+            if ingest.flush_due():
+                written = ingest.flush()
+                if written:
+                    print(f"💾 {datetime.now().strftime('%H:%M:%S')} {ingest.status_line()}")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        client.loop_stop()
+        client.disconnect()
+        ingest.flush()
+        print(f"⛔ Stopped: {ingest.status_line()}")
+    return 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Log Tasmota MQTT telemetry (tele/<topic>/SENSOR + STATE).")
+    parser.add_argument("--host", default="localhost", help="MQTT broker (default: localhost)")
+    parser.add_argument("--port", type=int, default=1883)
+    parser.add_argument("--username", default=None)
+    parser.add_argument("--password", default=None)
+    parser.add_argument("--flush", type=float, default=FLUSH_SECONDS, help="seconds between log writes")
+    parser.add_argument("--replay", type=Path, default=None,
+                        help="ingest a recorded file (mosquitto_sub -v output) instead of a broker")
+    tasmota_scan.add_store_argument(parser)
+    args = parser.parse_args(argv)
+
+    tasmota_scan._ensure_utf8_stdout()
+    tasmota_scan.enable_stores(args.store)
+    Path(tasmota_scan.DATA_DIR).mkdir(parents=True, exist_ok=True)
+    if args.replay is not None:
+        ingest = MqttIngest()
+        written = replay(ingest, args.replay)
+        print(f"💾 Replayed {args.replay}: {ingest.status_line()} ({written} written)")
+        return 0
+    print(f"📡 MQTT ingestion: {args.host}:{args.port}, writing every {args.flush:g} s")
+    print("⛔ Stop with Ctrl+C\n")
+    return run(args.host, args.port, args.username, args.password, args.flush)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
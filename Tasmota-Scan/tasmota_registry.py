@@ -0,0 +1,197 @@
+import fnmatch
+import json
+from datetime import datetime, timezone
+from pathlib import Path
+
+import tasmota_scan
+
+# Known-device registry: MAC -> last IP / hostname / last seen.
+#
+# Lets the logger loop poll the known fleet directly instead of sweeping the
+# whole address space every cycle. It is (re)built from the per-device logs
+# and updated after every cycle.
+#
+# Device groups (name -> hostname patterns and/or MACs) are kept in their own
+# file, so the loop rewriting the registry never drops a group edited meanwhile.
+
+REGISTRY_PATH = tasmota_scan.META_DIR / "registry.json"
+GROUPS_PATH = tasmota_scan.META_DIR / "groups.json"
+
+
+def _empty_registry():
+    return {
+        "schema_version": 1,
+        "last_full_sweep": None,
+        "devices": {},
+    }
+
+
+def load_registry(path: Path = REGISTRY_PATH):
+    """Load the registry; build it from the device logs if it doesn't exist yet."""
+    if not path.exists():
+        return build_registry_from_logs(tasmota_scan.DATA_DIR)
+    try:
+        with path.open("r", encoding="utf-8") as f:
+            registry = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return build_registry_from_logs(tasmota_scan.DATA_DIR)
+    registry.setdefault("schema_version", 1)
+    registry.setdefault("last_full_sweep", None)
+    registry.setdefault("devices", {})
+    return registry
+
+
+def save_registry(registry, path: Path = REGISTRY_PATH):
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + ".tmp")
+        with tmp.open("w", encoding="utf-8") as f:
+            json.dump(registry, f, ensure_ascii=False, indent=2)
+            f.write("\n")
+        tmp.replace(path)
+    except OSError:
+        pass
+
+
+def build_registry_from_logs(data_dir: Path):
+    """Create a registry from the `device` blocks of all per-device logs."""
+    registry = _empty_registry()
+    if not data_dir.exists():
+        return registry
+
+    for path in sorted(data_dir.glob("*.json")):
+        dev = tasmota_scan.load_device_log(path, with_entries=False).get("device") or {}
+        mac = tasmota_scan._normalize_mac(dev.get("mac"))
+        ip_history = dev.get("ip_history") or []
+        if not mac or not ip_history:
+            continue
+        known = registry["devices"].get(mac)
+        last_seen = dev.get("last_seen")
+        if known and tasmota_scan._max_iso(known.get("last_seen"), last_seen) == known.get("last_seen"):
+            continue
+        registry["devices"][mac] = {
+            "ip": ip_history[-1],
+            "hostname": dev.get("hostname") or dev.get("name"),
+            "last_seen": last_seen,
+            "log": path.name,
+            "missed": 0,
+        }
+    return registry
+
+
+def load_groups(path: Path = GROUPS_PATH):
+    """{group name: [hostname pattern or MAC, ...]}."""
+    try:
+        with path.open("r", encoding="utf-8") as f:
+            groups = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return {}
+    return {str(name): list(members) for name, members in groups.items()}
+
+
+def save_groups(groups, path: Path = GROUPS_PATH):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    with tmp.open("w", encoding="utf-8") as f:
+        json.dump(groups, f, ensure_ascii=False, indent=2, sort_keys=True)
+        f.write("\n")
+    tmp.replace(path)
+
+
+def _mac_digits(value):
+    return str(value).upper().replace(":", "").replace("-", "")
+
+
+def match_devices(registry, patterns):
+    """MACs of registry devices matching any hostname glob (case-insensitive) or MAC in `patterns`."""
+    macs = []
+    for mac, d in registry["devices"].items():
+        hostname = str(d.get("hostname") or "").casefold()
+        for pattern in patterns:
+            pattern = str(pattern)
+            if _mac_digits(pattern) == _mac_digits(mac) or fnmatch.fnmatchcase(hostname, pattern.casefold()):
+                macs.append(mac)
+                break
+    return sorted(macs)
+
+
+def known_ips(registry):
+    return sorted({d["ip"] for d in registry["devices"].values() if d.get("ip")})
+
+
+def full_sweep_due(registry, every_seconds, now=None):
+    """True if the registry is empty or the last full sweep is too old."""
+    if not registry["devices"]:
+        return True
+    last = tasmota_scan._parse_iso_ts(registry.get("last_full_sweep"))
+    if last is None:
+        return True
+    now = now or datetime.now(timezone.utc)
+    return (now - last).total_seconds() >= every_seconds
+
+
+def missing_devices(registry, found):
+    """MACs expected at their last IP that did not answer (or answered as another MAC).
+
+    Devices already missed in a previous full sweep are not reported again,
+    so a plug that stays unplugged doesn't force a sweep every cycle.
+    """
+    found_macs = {d.get("mac") for d in found if d.get("mac")}
+    return sorted(
+        mac for mac, d in registry["devices"].items()
+        if mac not in found_macs and not d.get("missed")
+    )
+
+
+def update_registry(registry, found, full_sweep=False, now_iso=None):
+    """Record devices found in a cycle; returns IP changes as (mac, old_ip, new_ip)."""
+    now_iso = now_iso or tasmota_scan._now_iso_local()
+    changes = []
+    found_macs = set()
+    for d in found:
+        mac = d.get("mac")
+        if not mac:
+            continue
+        found_macs.add(mac)
+        entry = registry["devices"].setdefault(mac, {})
+        old_ip = entry.get("ip")
+        if old_ip and d.get("ip") and old_ip != d.get("ip"):
+            changes.append((mac, old_ip, d.get("ip")))
+        entry["ip"] = d.get("ip") or old_ip
+        entry["hostname"] = d.get("hostname") or entry.get("hostname")
+        entry["log"] = d.get("log") or entry.get("log")
+        entry["last_seen"] = now_iso
+        entry["missed"] = 0
+
+    if full_sweep:
+        registry["last_full_sweep"] = now_iso
+        for mac, entry in registry["devices"].items():
+            if mac not in found_macs:
+                entry["missed"] = int(entry.get("missed") or 0) + 1
+    return changes
+
+
+def run_cycle(registry, full_sweep_every, cidrs=None, force_sweep=False):
+    """One logger cycle: poll known devices, sweep only when needed.
+
+    A full sweep runs when it's due (`full_sweep_every` seconds), when the
+    registry is empty, or when a known MAC didn't answer at its last IP.
+    """
+    if force_sweep or full_sweep_due(registry, full_sweep_every):
+        found = tasmota_scan.scan_network(plot=False, cidrs=cidrs, rewrite_ui=False)
+        changes = update_registry(registry, found, full_sweep=True)
+    else:
+        found = tasmota_scan.scan_network(plot=False, targets=known_ips(registry), rewrite_ui=False)
+        missing = missing_devices(registry, found)
+        if missing:
+            print(f"🔎 {len(missing)} known device(s) not at their last IP ({', '.join(missing)}), sweeping...")
+            polled = {d.get("ip") for d in found if d.get("ip")}
+            found = found + tasmota_scan.scan_network(plot=False, cidrs=cidrs, exclude=polled, rewrite_ui=False)
+        changes = update_registry(registry, found, full_sweep=bool(missing))
+
+    for mac, old_ip, new_ip in changes:
+        hostname = registry["devices"][mac].get("hostname") or mac
+        print(f"🔀 {hostname}: IP changed {old_ip} -> {new_ip}")
+    save_registry(registry)
+    tasmota_scan._update_switch_ui(found)
+    return found
@@ -0,0 +1,338 @@
+import argparse
+import json
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+# Hourly / daily / monthly rollups per device, maintained at ingest.
+#
+# log_device_snapshot() adds every snapshot to the open bucket of each period
+# (local time): kWh and cost of the interval the snapshot closes, min/max/avg
+# power and the sample count. A bucket that is left behind is appended to
+# "<stem>.rollups.jsonl" next to the entries file; the open buckets and the
+# last counter reading live in the log header ("rollups"). So a year of
+# history is ~9k hourly, 365 daily or 12 monthly rows instead of ~50k raw
+# snapshots, and updating them is O(1) per snapshot.
+#
+# Energy is counted like tasmota_cost.interval_costs(): the delta of
+# total_kwh to the previous reading, billed at the price of the closing
+# snapshot; a drop of total_kwh is a counter reset and the new reading is the
+# energy since the reset. A gap (device offline) is booked in the bucket of
+# the snapshot that ends it. Snapshots older than the last rolled-up reading
+# (late arrivals) are logged but not rolled up; rebuild() recomputes all
+# buckets from the raw entries (done on every full log rewrite).
+#
+# Each bucket also keeps its last snapshot ("last_sample": time, total_kwh,
+# price, cost_since_first_seen_eur), so a plot from rollups draws the same
+# values as one from the raw log, just one point per bucket.
+
+ROLLUP_VERSION = 2
+PERIODS = ("hour", "day", "month")
+# Reports/plots: hourly rows up to this span, daily rows beyond.
+HOURLY_MAX_SPAN_S = 31 * 86400
+# Plots of shorter spans draw the raw snapshots.
+RAW_PLOT_MAX_SPAN_S = 7 * 86400
+
+
+def _num(value):
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return None if value != value else value  # NaN
+
+
+def bucket(period, epoch):
+    """(start epoch, end epoch, start ISO) of the local-time `period` containing `epoch`."""
+    t = datetime.fromtimestamp(epoch)
+    if period == "hour":
+        start = t.replace(minute=0, second=0, microsecond=0)
+        end = start + timedelta(hours=1)
+    elif period == "day":
+        start = t.replace(hour=0, minute=0, second=0, microsecond=0)
+        end = start + timedelta(days=1)
+    elif period == "month":
+        start = t.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        end = (start + timedelta(days=32)).replace(day=1)
+    else:
+        raise ValueError(f"unknown period: {period!r}")
+    start, end = start.astimezone(), end.astimezone()
+    return int(start.timestamp()), int(end.timestamp()), start.isoformat(timespec="seconds")
+
+
+def _new_row(period, epoch):
+    start_epoch, end_epoch, start = bucket(period, epoch)
+    return {
+        "period": period,
+        "start": start,
+        "start_epoch": start_epoch,
+        "end_epoch": end_epoch,
+        "kwh": 0.0,
+        "cost_eur": 0.0,
+        "samples": 0,
+        "power_samples": 0,
+        "power_sum_w": 0.0,
+        "power_min_w": None,
+        "power_max_w": None,
+        "power_avg_w": None,
+        "last_sample": None,
+    }
+
+
+def new_state(file_name=None):
+    """Rollup state for a log header (`file_name`: rows file, default "<stem>.rollups.jsonl")."""
+    return {"version": ROLLUP_VERSION, "file": file_name, "last": None, "open": {}}
+
+
+def current(state):
+    """True if `state` (a header's "rollups") was built by this version (else: rebuild)."""
+    return bool(state) and state.get("version") == ROLLUP_VERSION
+
+
+def add_snapshot(state, entry):
+    """Roll snapshot `entry` into `state`; returns the buckets it closed (rows to append)."""
+    epoch = _num(entry.get("ts_epoch"))
+    if epoch is None:
+        return []
+    last = state.get("last")
+    if last and epoch <= last["ts_epoch"]:
+        return []  # late or duplicate snapshot
+
+    total = _num(entry.get("total_kwh"))
+    last_total = last.get("total_kwh") if last else None
+    if total is None or last_total is None:
+        kwh = 0.0
+    elif total < last_total:
+        kwh = total  # counter reset
+    else:
+        kwh = total - last_total
+    price = _num(entry.get("price_eur_per_kwh"))
+    cost = kwh * price if price is not None else 0.0
+    power = _num(entry.get("power_w"))
+    sample = {"ts_epoch": int(epoch), "total_kwh": total, "price_eur_per_kwh": price,
+              "cost_since_first_seen_eur": _num(entry.get("cost_since_first_seen_eur"))}
+
+    closed = []
+    open_rows = state.setdefault("open", {})
+    for period in PERIODS:
+        row = open_rows.get(period)
+        if row is None or not row["start_epoch"] <= epoch < row["end_epoch"]:
+            if row is not None:
+                closed.append(row)
+            row = open_rows[period] = _new_row(period, epoch)
+        row["kwh"] += kwh
+        row["cost_eur"] += cost
+        row["samples"] += 1
+        row["last_sample"] = sample
+        if power is not None:
+            row["power_samples"] += 1
+            row["power_sum_w"] += power
+            row["power_min_w"] = power if row["power_min_w"] is None else min(row["power_min_w"], power)
+            row["power_max_w"] = power if row["power_max_w"] is None else max(row["power_max_w"], power)
+            row["power_avg_w"] = row["power_sum_w"] / row["power_samples"]
+    state["last"] = {"ts_epoch": int(epoch), "total_kwh": total if total is not None else last_total}
+    return closed
+
+
+def rebuild(entries, file_name=None, epoch_of=None):
+    """Rollups of a whole history: (state, closed rows). Entries may be unsorted."""
+    epoch_of = epoch_of or (lambda e: e.get("ts_epoch"))
+    state = new_state(file_name)
+    rows = []
+    timed = [(epoch, e) for e in entries if (epoch := _num(epoch_of(e))) is not None]
+    timed.sort(key=lambda pair: pair[0])
+    for epoch, entry in timed:
+        rows += add_snapshot(state, dict(entry, ts_epoch=epoch))
+    return state, rows
+
+
+def rows_path(log_path: Path, state=None):
+    """Path of the closed-rows file that belongs to log header `log_path`."""
+    name = (state or {}).get("file") or (log_path.stem + ".rollups.jsonl")
+    return log_path.with_name(name)
+
+
+def _row_line(row):
+    return json.dumps(row, ensure_ascii=False) + "\n"
+
+
+def append_rows(path: Path, rows):
+    """Append closed rows; returns the bytes written."""
+    text = "".join(_row_line(r) for r in rows)
+    with path.open("a", encoding="utf-8") as f:
+        f.write(text)
+    return len(text.encode("utf-8"))
+
+
+def write_rows(path: Path, rows):
+    """Replace the rows file atomically; returns the bytes written."""
+    text = "".join(_row_line(r) for r in rows)
+    tmp = path.with_name(path.name + ".tmp")
+    with tmp.open("w", encoding="utf-8") as f:
+        f.write(text)
+    tmp.replace(path)
+    return len(text.encode("utf-8"))
+
+
+def read_rows(path: Path, state, period=None, since=None, until=None):
+    """Closed rows from `path` plus the open buckets of `state`, sorted by start.
+
+    Filters: `period`, and buckets starting in [since, until) (epoch seconds).
+    A bucket written twice (e.g. after a crash before the header was saved)
+    is taken from its last, most complete copy.
+    """
+    by_key = {}
+    try:
+        with path.open("r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    continue  # torn last line
+                if isinstance(row, dict):
+                    by_key[(row.get("period"), row.get("start_epoch"))] = row
+    except OSError:
+        pass
+    for row in ((state or {}).get("open") or {}).values():
+        by_key[(row["period"], row["start_epoch"])] = row
+    rows = [
+        r for (p, start), r in by_key.items()
+        if (period is None or p == period) and start is not None
+        and (since is None or start >= since) and (until is None or start < until)
+    ]
+    rows.sort(key=lambda r: r["start_epoch"])
+    return rows
+
+
+def choose_period(since=None, until=None, first=None):
+    """"hour" for spans up to HOURLY_MAX_SPAN_S, else "day" (`first`: oldest data, if known)."""
+    start = since if since is not None else first
+    if start is None:
+        return "day"
+    return "hour" if (until or time.time()) - start <= HOURLY_MAX_SPAN_S else "day"
+
+
+def load_device_rollups(log_path: Path, period, since=None, until=None):
+    """Rollup rows of one device log; computed in memory if the log has none yet."""
+    import tasmota_scan
+
+    header = tasmota_scan.load_device_log(log_path, with_entries=False)
+    state = header.get("rollups")
+    if current(state):
+        return read_rows(rows_path(log_path, state), state, period, since, until)
+    entries = tasmota_scan.load_device_log(log_path).get("entries") or []
+    state, rows = rebuild(entries, epoch_of=tasmota_scan._entry_epoch)
+    by_key = {(r["period"], r["start_epoch"]): r for r in rows + list(state["open"].values())}
+    return [r for (p, start), r in sorted(by_key.items(), key=lambda kv: kv[0][1])
+            if p == period and (since is None or start >= since) and (until is None or start < until)]
+
+
+def _fleet(data_dir: Path, period, since=None, until=None):
+    """(label, device header, rows) for every device log in `data_dir` with rows."""
+    import tasmota_scan
+
+    for path in sorted(data_dir.glob("*.json")):
+        header = tasmota_scan.load_device_log(path, with_entries=False)
+        dev = header.get("device") or {}
+        label = tasmota_scan._clean_str(dev.get("hostname") or dev.get("name") or path.stem, default=path.stem)
+        rows = load_device_rollups(path, period, since, until)
+        if rows:
+            yield label, dev, rows
+
+
+def fleet_rollups(data_dir: Path, period, since=None, until=None):
+    """[(label, rows)] for every device log in `data_dir`."""
+    return [(label, rows) for label, _dev, rows in _fleet(data_dir, period, since, until)]
+
+
+def oldest_reading(data_dir: Path):
+    """Epoch of the earliest first_seen over all device logs (None: no data)."""
+    import tasmota_scan
+
+    oldest = None
+    for path in data_dir.glob("*.json"):
+        dev = tasmota_scan.load_device_log(path, with_entries=False).get("device") or {}
+        epoch = tasmota_scan._iso_epoch(dev.get("first_seen")) if dev.get("first_seen") else None
+        if epoch is not None and (oldest is None or epoch < oldest):
+            oldest = epoch
+    return oldest
+
+
+def prefer_rollups(data_dir: Path, since=None):
+    """True if a plot from `since` (None: all data) spans more than RAW_PLOT_MAX_SPAN_S."""
+    start = since if since is not None else oldest_reading(data_dir)
+    return start is not None and time.time() - start > RAW_PLOT_MAX_SPAN_S
+
+
+def cost_series(data_dir: Path, since=None, period=None):
+    """Cost since first seen per device from rollups: [(label, epochs[], eur[])].
+
+    The value of each bucket's last snapshot, with the same rules (and the
+    same baseline) as the raw series, so `since` only cuts the time axis.
+    """
+    import tasmota_scan
+    import tasmota_series
+
+    if period is None:
+        period = choose_period(since, first=oldest_reading(data_dir) if since is None else None)
+    series = []
+    for label, dev, rows in _fleet(data_dir, period, since):
+        baseline_kwh = tasmota_scan._safe_float(dev.get("baseline_total_kwh"))
+        points = [tasmota_series._entry_point(r["last_sample"], baseline_kwh) for r in rows if r.get("last_sample")]
+        points = [p for p in points if p is not None]
+        if points:
+            series.append((label, [epoch for epoch, _eur in points], [eur for _epoch, eur in points]))
+    return series
+
+
+def rebuild_fleet(data_dir: Path = None):
+    """Recompute the rollups of every device log from its raw entries; returns [(file name, rows)]."""
+    import tasmota_scan
+
+    data_dir = data_dir or tasmota_scan.DATA_DIR
+    results = []
+    for path in sorted(data_dir.glob("*.json")):
+        log = tasmota_scan.load_device_log(path)
+        if int(log.get("schema_version") or 1) < 2:
+            tasmota_scan.migrate_device_log(path, log)  # rebuilds them on the way
+        else:
+            tasmota_scan.rebuild_rollups(path, log)
+            tasmota_scan._write_header(path, log)
+        state = log.get("rollups") or {}
+        results.append((path.name, len(read_rows(rows_path(path, state), state))))
+    return results
+
+
+def main(argv=None) -> int:
+    import tasmota_scan
+
+    parser = argparse.ArgumentParser(description="Hourly/daily/monthly kWh and cost per device from the rollups.")
+    parser.add_argument("--period", choices=PERIODS, default="day")
+    parser.add_argument("--days", type=float, default=None, help="only the last N days (default: all)")
+    parser.add_argument("--rebuild", action="store_true", help="recompute all rollups from the raw snapshots")
+    args = parser.parse_args(argv)
+
+    tasmota_scan._ensure_utf8_stdout()
+    if args.rebuild:
+        for name, rows in rebuild_fleet():
+            print(f"🔁 {name}: {rows} rollup row(s)")
+        return 0
+
+    since = time.time() - args.days * 86400 if args.days else None
+    fleet = fleet_rollups(tasmota_scan.DATA_DIR, args.period, since)
+    if not fleet:
+        print(f"⚠️  No rollups in: {tasmota_scan.DATA_DIR}")
+        return 1
+    for label, rows in fleet:
+        print(f"\n📟 {label}")
+        print(f"  {'start':<25} {'kWh':>9} {'EUR':>8} {'avg W':>8} {'max W':>8} {'samples':>8}")
+        for r in rows:
+            avg = "-" if r["power_avg_w"] is None else f"{r['power_avg_w']:.1f}"
+            peak = "-" if r["power_max_w"] is None else f"{r['power_max_w']:.1f}"
+            print(f"  {r['start']:<25} {r['kwh']:9.3f} {r['cost_eur']:8.2f} {avg:>8} {peak:>8} {r['samples']:8d}")
+        print(f"  {'total':<25} {sum(r['kwh'] for r in rows):9.3f} {sum(r['cost_eur'] for r in rows):8.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -2,12 +2,68 @@ import requests
 import socket
 import json
 import sys
+import asyncio
+import argparse
+import ipaddress
+import itertools
+import queue
+import re
+import threading
+import time
 from datetime import datetime, timezone
+from functools import lru_cache
 from pathlib import Path
 from concurrent.futures import ThreadPoolExecutor
 
+import tasmota_http
+import tasmota_metrics
+import tasmota_rollups
+
 DATA_DIR = Path(__file__).with_name("data")
 SWITCH_CONTROL_HTML = Path(__file__).with_name("Tasmota_switch_control.html")
+# Internal indexes/state kept next to the device logs (not device logs themselves).
+META_DIR = DATA_DIR / "_meta"
+
+# Device log format: 1 = one JSON file with inline "entries" (legacy),
+# 2 = small JSON header + append-only "<stem>.jsonl" (one snapshot per line).
+SCHEMA_VERSION = 2
+
+# Additional snapshot stores written next to the device logs:
+# "columnar" (memory-mapped per-column files, see tasmota_columnar.py),
+# "sqlite" (data/tasmota.sqlite3, one batch per cycle, see tasmota_sqlite.py).
+# Set with --store on the scan, logger loop, MQTT and shard command lines.
+STORE_CHOICES = ("columnar", "sqlite")
+EXTRA_STORES = ()
+
+# Discovery: max. number of probes in flight and per-probe deadline (seconds).
+# A probe first only connects (DISCOVERY_CONNECT_TIMEOUT: empty addresses are
+# dropped fast), then reads at most PROBE_READ_LIMIT bytes of a small
+# `Status` reply and stops as soon as the device is identified.
+DISCOVERY_CONCURRENCY = 256
+DISCOVERY_TIMEOUT = 1.0
+DISCOVERY_CONNECT_TIMEOUT = 0.5
+PROBE_READ_LIMIT = 2048
+# Probe hosts from the neighbour table (Espressif/known MACs) first, see
+# tasmota_seed.py; DISCOVERY_MDNS also asks mDNS (waits MDNS_TIMEOUT).
+DISCOVERY_SEED = True
+DISCOVERY_MDNS = False
+
+# Telemetry: max. HTTP requests in flight overall and per device.
+FETCH_CONCURRENCY = 32
+FETCH_PER_HOST = 2
+
+# Telemetry fetch mode: "oneshot" (one `Status 0` request per device) or
+# "classic" (Status 0/5/11 + State + Status 8, five requests per device).
+FETCH_MODE = "oneshot"
+
+# Electricity price used for new snapshots. After a price change, stored
+# costs can be recomputed with: python tasmota_cost.py recompute --price X
+PRICE_EUR_PER_KWH = 0.329
+
+# Cost plot: max. points drawn per device line (None = one per pixel column of
+# the PNG, 0 = draw every snapshot) and how to pick them ("minmax" or "lttb").
+PLOT_MAX_POINTS = None
+PLOT_DOWNSAMPLE = "minmax"
 
 
 def _ensure_utf8_stdout():
@@ -142,67 +198,106 @@ def _parse_iso_ts(value):
         return None
 
 
-def generate_cost_plot_per_device(data_dir: Path, output_png: Path):
-    """Create one figure: cost (EUR) over time, one line per device."""
-    try:
-        import matplotlib.pyplot as plt
-        import matplotlib.dates as mdates
-    except ImportError:
-        print("⚠️  matplotlib is not installed. Install with: pip install -r requirements.txt")
-        return None
+@lru_cache(maxsize=4096)
+def _iso_epoch(value):
+    """Epoch seconds of an ISO timestamp (None if invalid); memoized."""
+    dt = _parse_iso_ts(value)
+    return dt.timestamp() if dt is not None else None
 
-    if not data_dir.exists():
-        print(f"⚠️  data folder not found: {data_dir}")
-        return None
 
-    series_by_device = []  # list of (label, times[], eur[])
+def _entry_epoch(entry):
+    """Epoch seconds of a snapshot: `ts_epoch`, or parsed from `ts` for legacy rows."""
+    epoch = entry.get("ts_epoch")
+    if isinstance(epoch, (int, float)) and not isinstance(epoch, bool):
+        return float(epoch)
+    ts = entry.get("ts")
+    return _iso_epoch(str(ts)) if ts else None
 
-    for path in sorted(data_dir.glob("*.json")):
-        try:
-            with path.open("r", encoding="utf-8") as f:
-                device_log = json.load(f)
-        except (OSError, json.JSONDecodeError):
+
+def _backfill_ts_epoch(entries):
+    """Add `ts_epoch` to entries that only carry the ISO `ts`; returns #updated."""
+    updated = 0
+    for entry in entries:
+        if "ts_epoch" in entry:
             continue
+        epoch = _entry_epoch(entry)
+        if epoch is not None:
+            entry["ts_epoch"] = int(epoch) if epoch.is_integer() else epoch
+            updated += 1
+    return updated
 
-        dev = device_log.get("device") or {}
-        label = dev.get("hostname") or dev.get("name") or path.stem
-        label = _clean_str(label, default=path.stem)
 
-        baseline_kwh = _safe_float(dev.get("baseline_total_kwh"))
-        entries = device_log.get("entries") or []
-        points = []
+def _load_plot_series(data_dir: Path, backend: str):
+    """Cost series from the JSON logs (cached), rollups, columnar or SQLite store (None on error).
 
-        for e in entries:
-            ts = _parse_iso_ts(e.get("ts"))
-            if ts is None:
-                continue
+    "auto": rollups when the history spans more than a week, else the JSON logs.
+    """
+    if backend == "auto":
+        backend = "rollups" if tasmota_rollups.prefer_rollups(data_dir) else "json"
+    if backend == "rollups":
+        import tasmota_series
+        return [
+            (label, tasmota_series.to_plot_times(times), eur)
+            for label, times, eur in tasmota_rollups.cost_series(data_dir)
+        ]
+    if backend == "columnar":
+        try:
+            import tasmota_columnar
+            return tasmota_columnar.load_cost_series(data_dir, data_dir / "_columns")
+        except ImportError:
+            print("⚠️  numpy is not installed. Install with: pip install -r requirements.txt")
+            return None
+    if backend == "sqlite":
+        import tasmota_sqlite
+        conn = tasmota_sqlite.connect(data_dir / "tasmota.sqlite3")
+        try:
+            return tasmota_sqlite.load_cost_series(conn)
+        finally:
+            conn.close()
+    import tasmota_series
+    return [
+        (label, tasmota_series.to_plot_times(times), eur)
+        for label, times, eur in tasmota_series.load_cost_series_cached(data_dir)
+    ]
 
-            cost_since = _safe_float(e.get("cost_since_first_seen_eur"))
-            if cost_since is None:
-                total_kwh = _safe_float(e.get("total_kwh"))
-                price = _safe_float(e.get("price_eur_per_kwh"))
-                if baseline_kwh is not None and total_kwh is not None and price is not None:
-                    cost_since = max(total_kwh - baseline_kwh, 0.0) * price
 
-            if cost_since is None:
-                continue
+def generate_cost_plot_per_device(data_dir: Path, output_png: Path, backend: str = "json",
+                                  max_points=None, downsample=None):
+    """Create one figure: cost (EUR) over time, one line per device.
 
-            points.append((ts, cost_since))
+    `backend` selects the source: "json" (device logs), "rollups", "auto"
+    (rollups for histories longer than a week), "columnar" or "sqlite".
+    Each line is downsampled to `max_points` (default: PLOT_MAX_POINTS, i.e.
+    the PNG width in pixels) with `downsample` ("minmax" or "lttb").
+    """
+    try:
+        import matplotlib.pyplot as plt
+        import matplotlib.dates as mdates
+    except ImportError:
+        print("⚠️  matplotlib is not installed. Install with: pip install -r requirements.txt")
+        return None
 
-        if not points:
-            continue
+    if not data_dir.exists():
+        print(f"⚠️  data folder not found: {data_dir}")
+        return None
 
-        points.sort(key=lambda x: x[0])
-        times = [p[0] for p in points]
-        eur = [p[1] for p in points]
-        series_by_device.append((label, times, eur))
+    series_by_device = _load_plot_series(data_dir, backend)
+    if series_by_device is None:
+        return None
 
     if not series_by_device:
         print(f"⚠️  No plottable cost data in: {data_dir}")
         return None
 
+    import tasmota_series
+
+    dpi = 150
     fig, ax = plt.subplots(figsize=(12, 6))
+    max_points = PLOT_MAX_POINTS if max_points is None else max_points
+    if max_points is None:
+        max_points = int(fig.get_figwidth() * dpi)
     for label, times, eur in series_by_device:
+        times, eur = tasmota_series.downsample_series(times, eur, max_points, downsample or PLOT_DOWNSAMPLE)
         ax.plot(times, eur, linewidth=2, label=label)
 
     ax.set_ylabel("EUR")
@@ -214,7 +309,7 @@ def generate_cost_plot_per_device(data_dir: Path, output_png: Path):
 
     output_png.parent.mkdir(parents=True, exist_ok=True)
     fig.tight_layout()
-    fig.savefig(output_png, dpi=150)
+    fig.savefig(output_png, dpi=dpi)
     print(f"📈 Plot saved: {output_png}")
 
     try:
@@ -224,43 +319,225 @@ def generate_cost_plot_per_device(data_dir: Path, output_png: Path):
     return output_png
 
 
-def load_device_log(path: Path):
-    """Load a per-device log file."""
+def _empty_device_log():
+    return {
+        "schema_version": SCHEMA_VERSION,
+        "price_eur_per_kwh_default": 0.329,
+        "device": {},
+        "entries": [],
+    }
+
+
+def _entries_path(path: Path, data=None):
+    """Path of the append-only entries file that belongs to header `path`."""
+    name = (data or {}).get("entries_file") or (path.stem + ".jsonl")
+    return path.with_name(name)
+
+
+def _read_entries(path: Path):
+    """Read newline-delimited snapshot records (a torn last line is skipped)."""
+    entries = []
+    try:
+        with path.open("r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if isinstance(entry, dict):
+                    entries.append(entry)
+    except OSError:
+        pass
+    return entries
+
+
+def _entry_line(entry):
+    return json.dumps(entry, ensure_ascii=False) + "\n"
+
+
+def _write_atomic(path: Path, text: str, kind: str = "rewrite"):
+    tmp = path.with_name(path.name + ".tmp")
+    with tmp.open("w", encoding="utf-8") as f:
+        f.write(text)
+    tmp.replace(path)
+    tasmota_metrics.add_storage_bytes(kind, len(text.encode("utf-8")))
+
+
+def load_device_log(path: Path, with_entries: bool = True):
+    """Load a per-device log file.
+
+    Schema 1 files hold the entries inline; schema 2 files are a small header
+    plus an append-only `<stem>.jsonl` with one snapshot per line. With
+    `with_entries=False` only the header is read (schema 2), so appending a
+    snapshot doesn't need to parse the history.
+    """
     if not path.exists():
-        return {
-            "schema_version": 1,
-            "price_eur_per_kwh_default": 0.329,
-            "device": {},
-            "entries": [],
-        }
+        return _empty_device_log()
     try:
         with path.open("r", encoding="utf-8") as f:
             data = json.load(f)
     except (OSError, json.JSONDecodeError):
-        data = {
-            "schema_version": 1,
-            "price_eur_per_kwh_default": 0.329,
-            "device": {},
-            "entries": [],
-        }
+        data = _empty_device_log()
 
     data.setdefault("schema_version", 1)
     data.setdefault("price_eur_per_kwh_default", 0.329)
     data.setdefault("device", {})
+    if int(data.get("schema_version") or 1) >= 2:
+        data["entries"] = _read_entries(_entries_path(path, data)) if with_entries else []
     data.setdefault("entries", [])
     return data
 
 
-def save_device_log(path: Path, data):
+def save_device_log(path: Path, data, raise_errors: bool = False):
+    """Write a complete log (header + all entries) in the append-only format.
+
+    Both files are replaced atomically. Used for merges and migrations; the
+    scan path only appends (see append_device_entries). Write errors are
+    ignored unless `raise_errors` (callers that delete sources afterwards).
+    """
     try:
         path.parent.mkdir(parents=True, exist_ok=True)
-        with path.open("w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-            f.write("\n")
+        data["schema_version"] = SCHEMA_VERSION
+        data["entries_file"] = _entries_path(path).name
+        entries = data.get("entries") or []
+        _write_atomic(_entries_path(path, data), "".join(_entry_line(e) for e in entries))
+        rebuild_rollups(path, data)
+        _write_header(path, data)
+    except OSError:
+        if raise_errors:
+            raise
+
+
+def rebuild_rollups(path: Path, data, entries=None):
+    """Recompute the rollups of log `path` from `entries` (default: data["entries"]) and write its rows file."""
+    file_name = (data.get("rollups") or {}).get("file") or tasmota_rollups.rows_path(path).name
+    if entries is None:
+        entries = data.get("entries") or []
+    state, rows = tasmota_rollups.rebuild(entries, file_name, epoch_of=_entry_epoch)
+    written = tasmota_rollups.write_rows(tasmota_rollups.rows_path(path, state), rows)
+    tasmota_metrics.add_storage_bytes("rollups", written)
+    data["rollups"] = state
+    data.pop("rollup_rows", None)
+
+
+def _ensure_rollups(path: Path, data):
+    """Backfill the rollups of a log written before they existed or by an older version (reads its history once)."""
+    if tasmota_rollups.current(data.get("rollups")):
+        return
+    if int(data.get("schema_version") or 1) >= 2:
+        entries_path = _entries_path(path, data)
+        if not entries_path.exists():
+            return
+        entries = _read_entries(entries_path)
+    elif path.exists():
+        entries = data.get("entries") or []
+    else:
+        return
+    try:
+        rebuild_rollups(path, data, entries)
     except OSError:
         pass
 
 
+def _write_header(path: Path, data):
+    header = {k: v for k, v in data.items() if k not in ("entries", "rollup_rows")}
+    _write_atomic(path, json.dumps(header, ensure_ascii=False, indent=2) + "\n", kind="header")
+
+
+def append_device_entries(path: Path, data, entries):
+    """Append `entries` to the log and update its header: O(1) per snapshot.
+
+    `data` must come from load_device_log(path, with_entries=False). A log
+    that is still in schema 1 (inline entries) is migrated on the way.
+    """
+    if int(data.get("schema_version") or 1) < 2 or not path.exists():
+        if path.exists():
+            migrate_device_log(path, data)
+        else:
+            save_device_log(path, data)
+        data["entries"] = []
+        return
+    try:
+        lines = "".join(_entry_line(e) for e in entries)
+        with _entries_path(path, data).open("a", encoding="utf-8") as f:
+            f.write(lines)
+        tasmota_metrics.add_storage_bytes("entries", len(lines.encode("utf-8")))
+        closed = data.pop("rollup_rows", None)
+        if closed:
+            written = tasmota_rollups.append_rows(tasmota_rollups.rows_path(path, data.get("rollups")), closed)
+            tasmota_metrics.add_storage_bytes("rollups", written)
+        _write_header(path, data)
+    except OSError:
+        pass
+    data["entries"] = []
+
+
+def migrate_device_log(path: Path, data=None):
+    """One-time migration of a schema 1 log to header + JSONL.
+
+    The original file is kept as `<name>.v1.bak`. Returns True if migrated.
+    """
+    if data is None:
+        data = load_device_log(path)
+    if int(data.get("schema_version") or 1) >= 2:
+        return False
+    try:
+        if path.exists():
+            backup = _archive_path(path, ".v1.bak")
+            backup.write_bytes(path.read_bytes())
+    except OSError:
+        return False
+    _backfill_ts_epoch(data.get("entries") or [])
+    save_device_log(path, data)
+    return True
+
+
+def _archive_device_log(path: Path):
+    """Rename a log (header, entries and rollup rows) out of the way as `.bak`."""
+    try:
+        data = load_device_log(path, with_entries=False)
+    except Exception:
+        data = {}
+    header_target = _archive_path(path)
+    if int(data.get("schema_version") or 1) >= 2:
+        entries = _entries_path(path, data)
+        if entries.exists():
+            entries_target = _archive_path(entries)
+            entries.rename(entries_target)
+            data["entries_file"] = entries_target.name
+            _write_header(path, data)
+        rollup_rows = tasmota_rollups.rows_path(path, data.get("rollups"))
+        if data.get("rollups") and rollup_rows.exists():
+            rollup_target = _archive_path(rollup_rows)
+            rollup_rows.rename(rollup_target)
+            data["rollups"]["file"] = rollup_target.name
+            _write_header(path, data)
+    path.rename(header_target)
+
+
+def _min_iso(a, b):
+    da = _iso_epoch(a) if a else None
+    db = _iso_epoch(b) if b else None
+    if da is None:
+        return b
+    if db is None:
+        return a
+    return a if da <= db else b
+
+
+def _max_iso(a, b):
+    da = _iso_epoch(a) if a else None
+    db = _iso_epoch(b) if b else None
+    if da is None:
+        return b
+    if db is None:
+        return a
+    return a if da >= db else b
+
+
 def _merge_device_logs(into: dict, other: dict):
     """Merge two per-device logs (in-place into `into`)."""
     if not isinstance(into, dict) or not isinstance(other, dict):
@@ -279,24 +556,6 @@ def _merge_device_logs(into: dict, other: dict):
     other_dev = other.get("device") or {}
 
     # Merge timestamps
-    def _min_iso(a, b):
-        da = _parse_iso_ts(a)
-        db = _parse_iso_ts(b)
-        if da is None:
-            return b
-        if db is None:
-            return a
-        return a if da <= db else b
-
-    def _max_iso(a, b):
-        da = _parse_iso_ts(a)
-        db = _parse_iso_ts(b)
-        if da is None:
-            return b
-        if db is None:
-            return a
-        return a if da >= db else b
-
     if other_dev.get("first_seen"):
         into_dev["first_seen"] = _min_iso(into_dev.get("first_seen"), other_dev.get("first_seen"))
     if other_dev.get("last_seen"):
@@ -334,8 +593,8 @@ def _merge_device_logs(into: dict, other: dict):
         if other_base_at:
             into_dev["baseline_set_at"] = other_base_at
     elif into_dev.get("baseline_total_kwh") is not None and other_dev.get("baseline_total_kwh") is not None:
-        da = _parse_iso_ts(into_base_at)
-        db = _parse_iso_ts(other_base_at)
+        da = _iso_epoch(into_base_at) if into_base_at else None
+        db = _iso_epoch(other_base_at) if other_base_at else None
         # If other baseline was set earlier, prefer it.
         if da is None and db is not None:
             into_dev["baseline_total_kwh"] = other_dev.get("baseline_total_kwh")
@@ -376,8 +635,13 @@ def _merge_device_logs(into: dict, other: dict):
                 if existing.get(k) is None and v is not None:
                     existing[k] = v
 
+    def _epoch_key(e: dict):
+        epoch = _entry_epoch(e)
+        return float("-inf") if epoch is None else epoch
+
     entries_out = list(merged.values())
-    entries_out.sort(key=lambda x: (_parse_iso_ts(x.get("ts")) or datetime.min.replace(tzinfo=timezone.utc)))
+    _backfill_ts_epoch(entries_out)
+    entries_out.sort(key=_epoch_key)
     into["entries"] = entries_out
     return into
 
@@ -396,6 +660,8 @@ def _merge_legacy_logs_into(canonical_path: Path, legacy_paths: list[Path]):
         return False
 
     main_log = load_device_log(canonical_path)
+    if canonical_path.exists() and int(main_log.get("schema_version") or 1) < 2:
+        migrate_device_log(canonical_path, main_log)  # keeps the schema 1 file as .v1.bak
     changed = False
     for legacy in legacy_paths:
         try:
@@ -411,14 +677,129 @@ def _merge_legacy_logs_into(canonical_path: Path, legacy_paths: list[Path]):
         # Archive legacy files so we don't keep producing duplicates.
         for legacy in legacy_paths:
             try:
-                legacy.rename(_archive_path(legacy))
+                _archive_device_log(legacy)
             except OSError:
                 pass
     return changed
 
 
-def log_device_snapshot(device_log, device_info, energy_data, preis_prokw, state_data=None):
-    ts = _now_iso_local()
+# -----------------------------------------------------------------------------
+# Data file manifest (data/_meta/manifest.json): stem -> canonical log, MAC,
+# legacy Hostname__*.json aliases and the entries file size after the last
+# append. The scan path looks legacy files up here instead of listing the
+# data folder per device. It is updated on every write and rebuilt (one
+# directory listing) when data/ was changed by something else, detected via
+# the folder's mtime.
+# -----------------------------------------------------------------------------
+
+_manifest = None  # (data_dir, manifest dict)
+
+
+def _manifest_path():
+    return DATA_DIR / META_DIR.name / "manifest.json"
+
+
+def _data_dir_mtime():
+    try:
+        return DATA_DIR.stat().st_mtime_ns
+    except OSError:
+        return None
+
+
+def _file_size(path: Path):
+    try:
+        return path.stat().st_size
+    except OSError:
+        return 0
+
+
+def rebuild_manifest():
+    """Index all logs in DATA_DIR (one directory listing)."""
+    global _manifest
+    devices = {}
+    for path in sorted(DATA_DIR.glob("*.json")) if DATA_DIR.exists() else []:
+        if "__" in path.stem:
+            base = path.stem.rsplit("__", 1)[0]
+            devices.setdefault(base, {"log": None, "legacy": []})["legacy"].append(path.name)
+            continue
+        data = load_device_log(path, with_entries=False)
+        entry = devices.setdefault(path.stem, {"log": None, "legacy": []})
+        entry["log"] = path.name
+        entry["mac"] = _normalize_mac((data.get("device") or {}).get("mac"))
+        if int(data.get("schema_version") or 1) >= 2:
+            entries_file = _entries_path(path, data)
+            entry["entries_file"] = entries_file.name
+            entry["entries_offset"] = _file_size(entries_file)
+    manifest = {
+        "schema_version": 1,
+        "built_at": _now_iso_local(),
+        "data_dir_mtime_ns": _data_dir_mtime(),
+        "devices": devices,
+    }
+    _manifest = (DATA_DIR, manifest)
+    return manifest
+
+
+def load_manifest():
+    """The manifest for DATA_DIR; rebuilt if missing or data/ changed behind our back."""
+    global _manifest
+    if _manifest is None or _manifest[0] != DATA_DIR:
+        try:
+            with _manifest_path().open("r", encoding="utf-8") as f:
+                _manifest = (DATA_DIR, json.load(f))
+        except (OSError, json.JSONDecodeError):
+            return rebuild_manifest()
+    manifest = _manifest[1]
+    if manifest.get("data_dir_mtime_ns") != _data_dir_mtime():
+        return rebuild_manifest()
+    return manifest
+
+
+def save_manifest():
+    """Persist the manifest; records data/'s mtime so the next load can trust it."""
+    if _manifest is None or _manifest[0] != DATA_DIR:
+        return
+    manifest = _manifest[1]
+    try:
+        _manifest_path().parent.mkdir(parents=True, exist_ok=True)
+        manifest["data_dir_mtime_ns"] = _data_dir_mtime()
+        _write_atomic(_manifest_path(), json.dumps(manifest, ensure_ascii=False, indent=2) + "\n", kind="manifest")
+    except OSError:
+        pass
+
+
+def _manifest_devices():
+    """Devices of the loaded manifest (no staleness check: our own writes change data/)."""
+    if _manifest is None or _manifest[0] != DATA_DIR:
+        return load_manifest()["devices"]
+    return _manifest[1]["devices"]
+
+
+def _legacy_log_paths(stem: str):
+    """Legacy Hostname__*.json files of `stem` according to the manifest."""
+    entry = _manifest_devices().get(stem) or {}
+    return [DATA_DIR / name for name in entry.get("legacy") or []]
+
+
+def _manifest_record(stem: str, path: Path, data):
+    """Update the manifest after `path` was written (legacy aliases are gone)."""
+    entries_file = _entries_path(path, data)
+    _manifest_devices()[stem] = {
+        "log": path.name,
+        "legacy": [],
+        "mac": _normalize_mac((data.get("device") or {}).get("mac")),
+        "entries_file": entries_file.name,
+        "entries_offset": _file_size(entries_file),
+    }
+
+
+def log_device_snapshot(device_log, device_info, energy_data, preis_prokw, state_data=None, now=None):
+    """Add one snapshot entry to `device_log` and update its device header.
+
+    `now` (aware datetime) is the time of the reading; default: current time.
+    """
+    now = (now or datetime.now(timezone.utc)).replace(microsecond=0)
+    ts = now.astimezone().isoformat(timespec="seconds")
 
     state_data = state_data or {}
     wifi_state = state_data.get("Wifi") or {}
@@ -473,6 +854,7 @@ def log_device_snapshot(device_log, device_info, energy_data, preis_prokw, state
 
     entry = {
         "ts": ts,
+        "ts_epoch": int(now.timestamp()),
         "device_time": device_time,
         "ip": ip,
         "hostname": state_data.get("Hostname"),
@@ -496,6 +878,10 @@ def log_device_snapshot(device_log, device_info, energy_data, preis_prokw, state
     }
 
     device_log.setdefault("entries", []).append(entry)
+
+    # Rollups: open buckets stay in the header, closed ones are appended with the entries.
+    rollups = device_log.setdefault("rollups", tasmota_rollups.new_state())
+    device_log.setdefault("rollup_rows", []).extend(tasmota_rollups.add_snapshot(rollups, entry))
     return entry
 
 def get_local_network():
@@ -505,23 +891,144 @@ def get_local_network():
     network_prefix = f"{ip_parts[0]}.{ip_parts[1]}.{ip_parts[2]}."
     return network_prefix
 
-def check_tasmota(ip):
-    url = f"http://{ip}/"
+_PROBE_PATH = "/cm?cmnd=Status"
+_STATUS_REPLY = re.compile(rb'"Status"\s*:\s*\{')
+
+
+def _is_tasmota_response(data: bytes):
+    """True if the (partial) reply to _PROBE_PATH identifies a Tasmota device."""
+    if b"Tasmota" in data:
+        return True
+    # {"Status":{"Module":..,"DeviceName":..,"FriendlyName":[..],"Topic":..}}
+    if _STATUS_REPLY.search(data) and b'"FriendlyName"' in data:
+        return True
+    # Web password set: {"WARNING":"Need user=<username>&password=<password>"}
+    return b"Need user=<username>" in data
+
+
+def _default_cidrs():
+    return [f"{get_local_network()}0/24"]
+
+
+def _range_hosts(spec):
+    """Hosts of a CIDR range, a single IP or an address range "first-last"."""
+    if "-" in spec:
+        first, last = (ipaddress.ip_address(part.strip()) for part in spec.split("-", 1))
+        return (ipaddress.ip_address(n) for n in range(int(first), int(last) + 1))
+    return ipaddress.ip_network(spec, strict=False).hosts()
+
+
+def _iter_cidr_hosts(cidrs, exclude=None):
+    """Yield host addresses (str) for CIDR ranges, address ranges or single IPs, lazily."""
+    seen = set() if len(cidrs) > 1 else None
+    exclude = set(exclude or ())
+    for cidr in cidrs:
+        for host in _range_hosts(str(cidr).strip()):
+            ip = str(host)
+            if ip in exclude:
+                continue
+            if seen is not None:
+                if ip in seen:
+                    continue
+                seen.add(ip)
+            yield ip
+
+
+async def _probe_tasmota_async(ip, timeout=DISCOVERY_TIMEOUT, connect_timeout=DISCOVERY_CONNECT_TIMEOUT):
+    """Probe one address for a Tasmota web server; the whole probe ends after `timeout`."""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(ip, 80), min(connect_timeout, timeout))
+    except (OSError, asyncio.TimeoutError):
+        return False
+
+    async def _identify():
+        request = f"GET {_PROBE_PATH} HTTP/1.0\r\nHost: {ip}\r\nConnection: close\r\n\r\n"
+        writer.write(request.encode("ascii"))
+        await writer.drain()
+        data = b""
+        while len(data) < PROBE_READ_LIMIT:
+            chunk = await reader.read(512)
+            if not chunk:
+                break
+            data += chunk
+            if _is_tasmota_response(data):
+                return True
+        return False
+
     try:
-        response = requests.get(url, timeout=1)
-        if "Tasmota" in response.text:
+        return await asyncio.wait_for(_identify(), max(deadline - loop.time(), 0.01))
+    except (OSError, asyncio.TimeoutError):
+        return False
+    finally:
+        writer.close()
+
+
+async def discover_tasmota_async(cidrs=None, concurrency=DISCOVERY_CONCURRENCY, timeout=DISCOVERY_TIMEOUT, exclude=None,
+                                 seeds=None):
+    """Probe every host in `cidrs` and yield Tasmota IPs as soon as they answer.
+
+    At most `concurrency` probes are in flight; hosts are generated lazily so
+    large ranges (/16 and up) don't need to be materialized. IPs in `exclude`
+    are skipped; `seeds` (likely devices) are probed before everything else.
+    """
+    exclude = set(exclude or ())
+    seeds = [ip for ip in dict.fromkeys(seeds or ()) if ip not in exclude]
+    hosts = itertools.chain(seeds, _iter_cidr_hosts(list(cidrs or _default_cidrs()), exclude=exclude | set(seeds)))
+    found = asyncio.Queue()
+    finished = object()
+
+    async def _worker():
+        for ip in hosts:
+            if await _probe_tasmota_async(ip, timeout):
+                await found.put(ip)
+
+    async def _run_workers():
+        try:
+            await asyncio.gather(*(_worker() for _ in range(max(1, int(concurrency)))))
+        finally:
+            found.put_nowait(finished)
+
+    runner = asyncio.ensure_future(_run_workers())
+    try:
+        while True:
+            ip = await found.get()
+            if ip is finished:
+                break
+            yield ip
+    finally:
+        if not runner.done():
+            runner.cancel()
+            await asyncio.gather(runner, return_exceptions=True)
+
+
+def discover_tasmota(cidrs=None, concurrency=DISCOVERY_CONCURRENCY, timeout=DISCOVERY_TIMEOUT, on_found=None, exclude=None,
+                     seeds=None):
+    """Blocking wrapper around discover_tasmota_async.
+
+    `on_found(ip)` is called for every device as soon as it is discovered.
+    Returns all found IPs, sorted by address.
+    """
+
+    async def _collect():
+        found = []
+        async for ip in discover_tasmota_async(cidrs, concurrency=concurrency, timeout=timeout, exclude=exclude,
+                                               seeds=seeds):
             print(f"🔍 Found Tasmota device: http://{ip}")
-            return ip
-    except requests.RequestException:
-        pass
-    return None
+            found.append(ip)
+            if on_found is not None:
+                on_found(ip)
+        return found
+
+    return sorted(asyncio.run(_collect()), key=ipaddress.ip_address)
 
 
 def get_state_data(ip):
     """Fetch current device state (POWER/Wifi/Uptime)."""
     url = f"http://{ip}/cm?cmnd=State"
     try:
-        response = requests.get(url, timeout=2)
+        response = tasmota_http.get(url, timeout=2)
         response.raise_for_status()
         return response.json()
     except (requests.RequestException, ValueError):
@@ -546,7 +1053,7 @@ def get_device_info(ip):
 
     try:
         # Base information
-        response = requests.get(info_url, timeout=2)
+        response = tasmota_http.get(info_url, timeout=2)
         data = response.json()
         status = data.get("Status", {})
 
@@ -559,14 +1066,14 @@ def get_device_info(ip):
         device_info['module'] = status.get("Module", 'N/A')
 
         # Network information
-        net_response = requests.get(status_url, timeout=2)
+        net_response = tasmota_http.get(status_url, timeout=2)
         net_data = net_response.json()
         net_status = net_data.get("StatusNET", {})
 
         device_info['mac'] = net_status.get("Mac", 'N/A')
 
         # WiFi information
-        wifi_response = requests.get(wifi_url, timeout=2)
+        wifi_response = tasmota_http.get(wifi_url, timeout=2)
         wifi_data = wifi_response.json()
         wifi_status = wifi_data.get("StatusSTS", {})
 
@@ -574,7 +1081,8 @@ def get_device_info(ip):
         device_info['wifi_rssi'] = wifi_status.get("Wifi", {}).get("RSSI", 'N/A')
         device_info['uptime'] = wifi_status.get("Uptime", 'N/A')
 
-    except requests.RequestException:
+    except (requests.RequestException, ValueError):
+        # The first failed call ends it: a stalled device isn't asked again.
         pass
 
     return device_info
@@ -592,22 +1100,100 @@ def get_energy_data(ip):
     }
 
     try:
-        response = requests.get(url, timeout=2)
+        response = tasmota_http.get(url, timeout=2)
         data = response.json()
-        energy = data.get("StatusSNS", {}).get("ENERGY", {})
-
-        energy_data['total'] = energy.get("Total", "N/A")
-        energy_data['power'] = energy.get("Power", "N/A")
-        energy_data['voltage'] = energy.get("Voltage", "N/A")
-        energy_data['current'] = energy.get("Current", "N/A")
-        energy_data['today'] = energy.get("Today", "N/A")
-        energy_data['yesterday'] = energy.get("Yesterday", "N/A")
+        _fill_energy_data(energy_data, data.get("StatusSNS", {}).get("ENERGY", {}))
 
-    except requests.RequestException:
+    except (requests.RequestException, ValueError):
         pass
 
     return energy_data
 
+
+def _fill_energy_data(energy_data, energy):
+    energy_data['total'] = energy.get("Total", "N/A")
+    energy_data['power'] = energy.get("Power", "N/A")
+    energy_data['voltage'] = energy.get("Voltage", "N/A")
+    energy_data['current'] = energy.get("Current", "N/A")
+    energy_data['today'] = energy.get("Today", "N/A")
+    energy_data['yesterday'] = energy.get("Yesterday", "N/A")
+    return energy_data
+
+
+def get_full_status(ip):
+    """Fetch the full status (`Status 0`) in a single request."""
+    url = f"http://{ip}/cm?cmnd=Status%200"
+    try:
+        response = tasmota_http.get(url, timeout=2)
+        response.raise_for_status()
+        return response.json()
+    except (requests.RequestException, ValueError):
+        return {}
+
+
+def parse_full_status(ip, data):
+    """Split a `Status 0` response into (device_info, state_data, energy_data).
+
+    The result has the same shape as get_device_info / get_state_data /
+    get_energy_data, so it can be used interchangeably.
+    """
+    data = data or {}
+    status = data.get("Status") or {}
+    net_status = data.get("StatusNET") or {}
+    sts = data.get("StatusSTS") or {}
+    firmware = data.get("StatusFWR") or {}
+    wifi = sts.get("Wifi") or {}
+
+    name = status.get("DeviceName", f"Unknown ({ip})")
+    friendly_name = (status.get("FriendlyName") or [""])[0]
+    device_info = {
+        'name': friendly_name or name,
+        'version': firmware.get("Version") or status.get("Version", 'N/A'),
+        'uptime': sts.get("Uptime", 'N/A'),
+        'wifi_ssid': wifi.get("SSId", 'N/A'),
+        'wifi_rssi': wifi.get("RSSI", 'N/A'),
+        'ip': ip,
+        'mac': net_status.get("Mac", 'N/A'),
+        'module': status.get("Module", 'N/A')
+    }
+
+    # StatusSTS is the `State` payload. `State` carries no Hostname, so the log
+    # name falls back to the FriendlyName exactly as in classic mode (copying
+    # StatusNET.Hostname here would move existing histories to a new file).
+    state_data = dict(sts)
+
+    energy_data = _fill_energy_data({}, (data.get("StatusSNS") or {}).get("ENERGY") or {})
+    return device_info, state_data, energy_data
+
+
+def fetch_telemetry(ip, mode=None):
+    """Fetch device_info/state_data/energy_data for one device (sequentially).
+
+    mode "oneshot" uses a single `Status 0` request, "classic" the five
+    separate status requests.
+    """
+    calls = _telemetry_calls(mode or FETCH_MODE)
+    result = {}
+    for fetch in calls:
+        result.update(fetch(ip))
+    return result
+
+
+def _telemetry_calls(mode):
+    """Return the fetch jobs for one device; each returns a partial result dict."""
+    if mode == "oneshot":
+        def _oneshot(ip):
+            device_info, state_data, energy_data = parse_full_status(ip, get_full_status(ip))
+            return {"device_info": device_info, "state_data": state_data, "energy_data": energy_data}
+        return [_oneshot]
+    if mode == "classic":
+        return [
+            lambda ip: {"device_info": get_device_info(ip)},
+            lambda ip: {"state_data": get_state_data(ip)},
+            lambda ip: {"energy_data": get_energy_data(ip)},
+        ]
+    raise ValueError(f"unknown fetch mode: {mode!r}")
+
 def print_device_details(device_info, energy_data, state_data=None, preis_prokw=0.329):
     """Print detailed device information."""
     state_data = state_data or {}
@@ -658,79 +1244,323 @@ def print_device_details(device_info, energy_data, state_data=None, preis_prokw=
         print(f"└{'─' * 60}┘")
         return 0
 
-def scan_network(plot: bool = True):
-    print("🔍 Starting network scan for Tasmota devices...")
-    network_prefix = get_local_network()
-    possible_ips = [f"{network_prefix}{i}" for i in range(1, 255)]
-
-    tasmota_devices = []
-    total_kosten = 0
-    with ThreadPoolExecutor(max_workers=20) as executor:
-        results = executor.map(check_tasmota, possible_ips)
-        tasmota_devices = [ip for ip in results if ip]
+def _update_switch_ui(devices):
+    """Update the hardcoded web UI so it matches the scan result."""
+    try:
+        devices_for_ui = [d for d in devices if d.get("ip")]
+        devices_for_ui.sort(key=lambda d: str(d.get("hostname") or ""))
+        _rewrite_switch_control_html(devices_for_ui, SWITCH_CONTROL_HTML)
+    except Exception:
+        pass
 
-    if tasmota_devices:
-        print(f"\n🎯 Found {len(tasmota_devices)} Tasmota device(s):")
-        print("=" * 70)
 
-        devices_for_ui = []
-        device_count = 0
-        for device in tasmota_devices:
-            device_count += 1
-            print(f"\n📱 Device {device_count} of {len(tasmota_devices)}:")
+def _submit_telemetry(executor, ip, host_slots, on_done, mode=None):
+    """Fetch the telemetry of one device as separate jobs on `executor`.
 
+    `host_slots` is a semaphore limiting requests in flight to this host.
+    `on_done(ip, result, error)` is called once all jobs have finished.
+    """
+    calls = _telemetry_calls(mode or FETCH_MODE)
+    pending = [len(calls)]
+    lock = threading.Lock()
+    futures = []
+    started = time.perf_counter()
+
+    def _call(fetch):
+        with host_slots:
+            return fetch(ip)
+
+    def _collect(_future):
+        with lock:
+            pending[0] -= 1
+            if pending[0]:
+                return
+        result = {}
+        error = None
+        for future in futures:
             try:
-                device_info = get_device_info(device)
-                state_data = get_state_data(device)
-                energy_data = get_energy_data(device)
-                kosten = print_device_details(device_info, energy_data, state_data=state_data)
-                total_kosten += kosten
-
-                hostname = state_data.get("Hostname") or device_info.get("name")
-                mac = _normalize_mac(device_info.get("mac"))
-                stem = _safe_filename(hostname, fallback=(mac or device_info.get("ip") or "device"))
-
-                # Canonical log filename is ALWAYS Hostname.json (no __MAC).
-                # Any legacy Hostname__*.json files are merged and archived.
-                device_log_path = DATA_DIR / f"{stem}.json"
-                legacy_paths = list(DATA_DIR.glob(f"{stem}__*.json"))
-                _merge_legacy_logs_into(device_log_path, legacy_paths)
-
-                device_log = load_device_log(device_log_path)
-                log_device_snapshot(device_log, device_info, energy_data, preis_prokw=0.329, state_data=state_data)
-                save_device_log(device_log_path, device_log)
-
-                devices_for_ui.append({
-                    "ip": device_info.get("ip"),
-                    "hostname": state_data.get("Hostname") or device_info.get("name"),
-                })
+                result.update(future.result())
             except Exception as exc:
-                print(f"⚠️  Error while querying {device}: {exc}")
-                continue
+                error = exc
+        elapsed = time.perf_counter() - started
+        tasmota_metrics.observe_phase("device_fetch", elapsed)
+        tasmota_metrics.observe_device_fetch(ip, elapsed, ok=error is None)
+        on_done(ip, result, error)
+
+    for fetch in calls:
+        futures.append(executor.submit(_call, fetch))
+    for future in futures:
+        future.add_done_callback(_collect)
+
+
+def _device_log_stem(device_info, state_data):
+    """(hostname, mac, stem) of a device; the log is data/<stem>.json."""
+    hostname = state_data.get("Hostname") or device_info.get("name")
+    mac = _normalize_mac(device_info.get("mac"))
+    return hostname, mac, _safe_filename(hostname, fallback=(mac or device_info.get("ip") or "device"))
 
-        # Update the hardcoded web UI so it matches the scan result.
+
+def append_snapshots(stem, readings):
+    """Log readings of one device with a single append.
+
+    `readings` is a list of (device_info, state_data, energy_data, now); `now`
+    may be None (current time). Returns (log path, header, new entries).
+    """
+    # Canonical log filename is ALWAYS Hostname.json (no __MAC).
+    # Any legacy Hostname__*.json files are merged and archived.
+    device_log_path = DATA_DIR / f"{stem}.json"
+    legacy_paths = [p for p in _legacy_log_paths(stem) if p.exists()]
+    _merge_legacy_logs_into(device_log_path, legacy_paths)
+
+    device_log = load_device_log(device_log_path, with_entries=False)
+    _ensure_rollups(device_log_path, device_log)
+    entries = [
+        log_device_snapshot(device_log, device_info, energy_data, preis_prokw=PRICE_EUR_PER_KWH,
+                            state_data=state_data, now=now)
+        for device_info, state_data, energy_data, now in readings
+    ]
+    append_device_entries(device_log_path, device_log, entries)
+    _manifest_record(stem, device_log_path, device_log)
+    if entries:
+        tasmota_metrics.record_reading(stem, (device_log.get("device") or {}).get("mac"), entries[-1])
+
+    if "columnar" in EXTRA_STORES:
+        import tasmota_columnar
+        tasmota_columnar.append_entries(stem, entries, DATA_DIR / "_columns")
+    return device_log_path, device_log, entries
+
+
+def _persist_device(device_info, state_data, energy_data, now=None):
+    """Print one device, merge legacy logs and append a snapshot to its log."""
+    kosten = print_device_details(device_info, energy_data, state_data=state_data, preis_prokw=PRICE_EUR_PER_KWH)
+
+    hostname, mac, stem = _device_log_stem(device_info, state_data)
+    with tasmota_metrics.timed("log_write"):
+        device_log_path, device_log, (entry,) = append_snapshots(stem, [(device_info, state_data, energy_data, now)])
+
+    device = {
+        "ip": device_info.get("ip"),
+        "hostname": hostname,
+        "mac": mac,
+        "log": device_log_path.name,
+        "power_w": entry.get("power_w"),
+        "power_state": entry.get("power_state"),
+    }
+    return kosten, device, (stem, device_log.get("device") or {}, [entry])
+
+
+def _persist_stage(results_queue, summary):
+    """Log writer: consume fetched telemetry from `results_queue` until None."""
+    device_count = 0
+    while True:
+        item = results_queue.get()
+        if item is None:
+            return
+        ip, result, error = item
+        device_count += 1
+        print(f"\n📱 Device {device_count}:")
         try:
-            devices_for_ui = [d for d in devices_for_ui if d.get("ip")]
-            devices_for_ui.sort(key=lambda d: str(d.get("hostname") or ""))
-            _rewrite_switch_control_html(devices_for_ui, SWITCH_CONTROL_HTML)
-        except Exception:
-            pass
+            if error is not None:
+                raise error
+            device_info = result["device_info"]
+            if not _normalize_mac(device_info.get("mac")) and not result["state_data"]:
+                print(f"⚠️  No telemetry from {ip}, skipped.")
+                continue
+            # "received" (epoch): reading time of telemetry fetched elsewhere (shard workers).
+            received = result.get("received")
+            now = datetime.fromtimestamp(received, timezone.utc) if received is not None else None
+            kosten, device, snapshot = _persist_device(device_info, result["state_data"], result["energy_data"], now=now)
+            summary["total_kosten"] += kosten
+            summary["devices"].append(device)
+            summary["snapshots"].append(snapshot)
+        except Exception as exc:
+            print(f"⚠️  Error while querying {ip}: {exc}")
+
+
+def scan_network(
+    plot: bool = True,
+    cidrs=None,
+    concurrency: int = DISCOVERY_CONCURRENCY,
+    fetch_concurrency: int = FETCH_CONCURRENCY,
+    fetch_per_host: int = FETCH_PER_HOST,
+    fetch_mode: str = None,
+    targets=None,
+    exclude=None,
+    rewrite_ui: bool = True,
+    seed: bool = None,
+):
+    """Scan `cidrs` (default: local /24) for Tasmota devices and log them.
+
+    Runs as a pipeline: discovery streams IPs into a pool of telemetry jobs
+    (bounded globally and per host), and a single writer thread persists
+    each device as soon as its telemetry is complete.
+
+    With `targets` (list of IPs) discovery is skipped and exactly these
+    devices are polled. `exclude` lists IPs the sweep should skip.
+    `rewrite_ui=False` leaves the switch-control HTML untouched. `seed`
+    (default DISCOVERY_SEED) probes neighbour-table candidates first.
+    Returns the logged devices as dicts (ip, hostname, mac, log, power_w,
+    power_state).
+    """
+    if targets is not None:
+        targets = list(targets)
+        print(f"🔍 Polling {len(targets)} known device(s)...")
+    else:
+        cidrs = list(cidrs or _default_cidrs())
+        print(f"🔍 Starting network scan for Tasmota devices in: {', '.join(cidrs)}")
+
+    started = time.perf_counter()
+    tasmota_http.reset_stats()
+    with tasmota_metrics.timed("manifest_load"):
+        load_manifest()
+    summary = {"total_kosten": 0, "devices": [], "snapshots": []}
+    results_queue = queue.Queue()
+    writer = threading.Thread(target=_persist_stage, args=(results_queue, summary), daemon=True)
+    writer.start()
+
+    def _on_fetched(ip, result, error):
+        results_queue.put((ip, result, error))
+
+    try:
+        fetch_fleet(_on_fetched, cidrs=cidrs, targets=targets, exclude=exclude, concurrency=concurrency,
+                    fetch_concurrency=fetch_concurrency, fetch_per_host=fetch_per_host, fetch_mode=fetch_mode,
+                    seed=seed)
+    finally:
+        results_queue.put(None)
+        writer.join()
+        with tasmota_metrics.timed("manifest_save"):
+            save_manifest()
+    devices = _finish_scan(summary, plot=plot, rewrite_ui=rewrite_ui)
+    tasmota_metrics.observe_phase("cycle", time.perf_counter() - started)
+    return devices
+
+
+def fetch_fleet(
+    on_fetched,
+    cidrs=None,
+    targets=None,
+    exclude=None,
+    concurrency: int = DISCOVERY_CONCURRENCY,
+    fetch_concurrency: int = FETCH_CONCURRENCY,
+    fetch_per_host: int = FETCH_PER_HOST,
+    fetch_mode: str = None,
+    seed: bool = None,
+):
+    """Discover (or take `targets`) and fetch telemetry; nothing is written.
+
+    `on_fetched(ip, result, error)` is called from a pool thread per device.
+    """
+    seeds = None
+    if targets is None and (DISCOVERY_SEED if seed is None else seed):
+        import tasmota_seed
+        cidrs = list(cidrs or _default_cidrs())
+        seeds, skip = tasmota_seed.seed_discovery(cidrs, mdns=DISCOVERY_MDNS)
+        exclude = list(exclude or ()) + skip
+
+    # "fetch" ends when the last telemetry job is done; discovery overlaps with it.
+    with tasmota_metrics.timed("fetch"), ThreadPoolExecutor(max_workers=max(1, int(fetch_concurrency))) as executor:
+        def _on_found(ip):
+            host_slots = threading.BoundedSemaphore(max(1, int(fetch_per_host)))
+            _submit_telemetry(executor, ip, host_slots, on_fetched, mode=fetch_mode)
+
+        if targets is not None:
+            for ip in targets:
+                _on_found(ip)
+        else:
+            with tasmota_metrics.timed("discovery"):
+                discover_tasmota(cidrs, concurrency=concurrency, on_found=_on_found, exclude=exclude, seeds=seeds)
+
+
+def _finish_scan(summary, plot=True, rewrite_ui=True):
+    """Store batch, HTML update, summary and plot after a scan cycle."""
+    if "sqlite" in EXTRA_STORES and summary["snapshots"]:
+        # One transaction per cycle.
+        import tasmota_sqlite
+        with tasmota_metrics.timed("sqlite"):
+            tasmota_sqlite.append_snapshot_batch(summary["snapshots"], DATA_DIR / "tasmota.sqlite3")
+    tasmota_metrics.record_http(tasmota_http.get_stats())
+    tasmota_metrics.record_hosts(tasmota_http.host_states())
+    tasmota_metrics.record_cycle(summary["devices"])
+
+    tasmota_devices = summary["devices"]
+    if tasmota_devices:
+        total_kosten = summary["total_kosten"]
+
+        if rewrite_ui:
+            with tasmota_metrics.timed("html"):
+                _update_switch_ui(tasmota_devices)
 
         print(f"\n{'=' * 70}")
+        print(f"🎯 Found {len(tasmota_devices)} Tasmota device(s)")
         print(f"💸 TOTAL COST (all devices): {total_kosten:.2f} EUR")
         print(f"📊 Device count: {len(tasmota_devices)}")
         if len(tasmota_devices) > 0:
             print(f"💡 Average cost per device: {total_kosten/len(tasmota_devices):.2f} EUR")
+        print(f"🔗 HTTP: {tasmota_http.format_stats()}")
+        print(f"🩺 Devices: {tasmota_http.format_host_states()}")
         print(f"💾 Logs saved in: {DATA_DIR}")
         if plot:
-            generate_cost_plot_per_device(DATA_DIR, Path(__file__).with_name("tasmota_cost_plot.png"))
+            backend = next((b for b in ("sqlite", "columnar") if b in EXTRA_STORES), "auto")
+            with tasmota_metrics.timed("plot"):
+                generate_cost_plot_per_device(DATA_DIR, Path(__file__).with_name("tasmota_cost_plot.png"),
+                                              backend=backend)
         print("=" * 70)
     else:
         print("❌ No Tasmota devices found.")
+        if any(s["state"] != "closed" for s in tasmota_http.host_states().values()):
+            print(f"🩺 Devices: {tasmota_http.format_host_states()}")
+    return tasmota_devices
+
+def enable_stores(stores):
+    """Also write snapshots to these stores (see EXTRA_STORES)."""
+    global EXTRA_STORES
+    for store in stores or ():
+        if store not in STORE_CHOICES:
+            raise ValueError(f"Unknown store: {store!r} (choose from {', '.join(STORE_CHOICES)})")
+        if store not in EXTRA_STORES:
+            EXTRA_STORES = (*EXTRA_STORES, store)
+
+
+def add_store_argument(parser):
+    parser.add_argument("--store", action="append", choices=STORE_CHOICES, default=[],
+                        help="also write snapshots to this store (repeatable)")
+
+
+def _parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Scan the network for Tasmota devices and log energy data.")
+    parser.add_argument("cidrs", nargs="*", help="CIDR ranges, address ranges (first-last) or IPs to scan (default: local /24)")
+    parser.add_argument("--concurrency", type=int, default=DISCOVERY_CONCURRENCY,
+                        help=f"max. discovery probes in flight (default: {DISCOVERY_CONCURRENCY})")
+    parser.add_argument("--fetch-mode", choices=("oneshot", "classic"), default=FETCH_MODE,
+                        help=f"telemetry requests per device (default: {FETCH_MODE})")
+    parser.add_argument("--no-keepalive", action="store_true",
+                        help="open a new connection per request (for comparing against pooled keep-alive)")
+    add_store_argument(parser)
+    parser.add_argument("--no-plot", action="store_true", help="don't generate the cost plot")
+    parser.add_argument("--rebuild-manifest", action="store_true",
+                        help="re-index data/ (data/_meta/manifest.json) before scanning")
+    parser.add_argument("--no-seed", action="store_true",
+                        help="don't probe neighbour-table candidates first (plain sweep)")
+    parser.add_argument("--mdns", action="store_true", help="also seed discovery from mDNS (_http._tcp)")
+    return parser.parse_args(argv)
+
 
 if __name__ == "__main__":
     _ensure_utf8_stdout()
+    args = _parse_args()
+    tasmota_http.KEEPALIVE = not args.no_keepalive
+    enable_stores(args.store)
+    DISCOVERY_SEED = DISCOVERY_SEED and not args.no_seed
+    DISCOVERY_MDNS = DISCOVERY_MDNS or args.mdns
+    if args.rebuild_manifest:
+        rebuild_manifest()
+        save_manifest()
     print("🚀 Tasmota Network Scanner started")
     print("📡 Scanning local network for Tasmota devices...\n")
-    scan_network(plot=True)
+    scan_network(
+        plot=not args.no_plot,
+        cidrs=args.cidrs or None,
+        concurrency=args.concurrency,
+        fetch_mode=args.fetch_mode,
+    )
     input("\n✅ Scan finished!")
@@ -0,0 +1,141 @@
+import heapq
+import random
+import time
+
+# Per-device polling scheduler for the logger loop.
+#
+# Every device has its own interval, adapted after each poll:
+#   - power changing  -> interval halves (down to MIN_INTERVAL)
+#   - steady          -> interval relaxes back to the base interval
+#   - OFF / idle      -> IDLE_INTERVAL
+#   - no answer       -> exponential backoff (up to MAX_BACKOFF)
+# Due times live on the monotonic clock and advance from the previous due
+# time, not from "now", so polls don't drift by the time a cycle takes. Each
+# device keeps a fixed random phase offset (jitter), which spreads the
+# requests of the fleet instead of waking every plug in the same second.
+
+MIN_INTERVAL = 60
+IDLE_INTERVAL = 30 * 60
+MAX_BACKOFF = 60 * 60
+
+# "Changing": |delta| above POWER_CHANGE_W and POWER_CHANGE_RATIO of the last reading.
+POWER_CHANGE_W = 5.0
+POWER_CHANGE_RATIO = 0.2
+IDLE_POWER_W = 1.0
+
+# Phase offset per device: up to this fraction of the base interval.
+JITTER = 0.1
+# Devices due within this many seconds are polled in the same batch.
+BATCH_WINDOW = 2.0
+
+
+class PollScheduler:
+    """Due times and adaptive intervals for a set of devices (keyed by MAC)."""
+
+    def __init__(self, base_interval=10 * 60, clock=time.monotonic, rng=None):
+        self.base_interval = float(base_interval)
+        self.clock = clock
+        self.rng = rng or random.Random()
+        self._devices = {}
+        self._heap = []  # (due, version, key); stale versions are skipped
+
+    def __contains__(self, key):
+        return key in self._devices
+
+    def __len__(self):
+        return len(self._devices)
+
+    def add(self, key, now=None):
+        """Schedule a new device: first poll within its jitter window."""
+        if key in self._devices:
+            return
+        now = self.clock() if now is None else now
+        offset = self.rng.uniform(0.0, JITTER * self.base_interval)
+        state = {"anchor": now, "offset": offset, "interval": self.base_interval,
+                 "failures": 0, "power_w": None, "version": 0}
+        self._devices[key] = state
+        self._push(key, state)
+
+    def remove(self, key):
+        self._devices.pop(key, None)
+
+    def _push(self, key, state):
+        state["version"] += 1
+        heapq.heappush(self._heap, (state["anchor"] + state["offset"], state["version"], key))
+
+    def _skip_stale(self):
+        while self._heap:
+            due, version, key = self._heap[0]
+            state = self._devices.get(key)
+            if state is not None and state["version"] == version:
+                return due
+            heapq.heappop(self._heap)
+        return None
+
+    def next_due(self):
+        """Monotonic time of the next poll (None if nothing is scheduled)."""
+        return self._skip_stale()
+
+    def pop_due(self, now=None):
+        """Keys due now (plus those due within BATCH_WINDOW), removed from the queue."""
+        now = self.clock() if now is None else now
+        due_keys = []
+        while True:
+            due = self._skip_stale()
+            if due is None or due > now + BATCH_WINDOW:
+                return due_keys
+            _due, _version, key = heapq.heappop(self._heap)
+            due_keys.append(key)
+
+    def record(self, key, ok, power_w=None, power_state=None, now=None):
+        """Adapt the device's interval to a poll result and schedule the next poll."""
+        state = self._devices.get(key)
+        if state is None:
+            return None
+        now = self.clock() if now is None else now
+        state["interval"] = self._next_interval(state, ok, power_w, power_state)
+        if ok:
+            state["failures"] = 0
+            state["power_w"] = power_w if power_w is not None else state["power_w"]
+
+        # Drift-free: advance from the previous due time; skip slots that
+        # already passed (a late poll doesn't cause a burst of catch-up polls).
+        anchor = state["anchor"] + state["interval"]
+        if anchor + state["offset"] <= now:
+            missed = int((now - anchor - state["offset"]) // state["interval"]) + 1
+            anchor += missed * state["interval"]
+        state["anchor"] = anchor
+        self._push(key, state)
+        return state["interval"]
+
+    def _next_interval(self, state, ok, power_w, power_state):
+        if not ok:
+            state["failures"] += 1
+            return min(self.base_interval * 2 ** state["failures"], max(MAX_BACKOFF, self.base_interval))
+
+        idle = str(power_state or "").upper() == "OFF" or (power_w is not None and power_w < IDLE_POWER_W)
+        if idle:
+            return max(IDLE_INTERVAL, self.base_interval)
+
+        last = state["power_w"]
+        if power_w is not None and last is not None:
+            delta = abs(power_w - last)
+            if delta > POWER_CHANGE_W and delta > POWER_CHANGE_RATIO * max(abs(last), 1.0):
+                return max(MIN_INTERVAL, min(state["interval"], self.base_interval) / 2)
+
+        # Steady: relax back towards the base interval.
+        interval = state["interval"]
+        if interval < self.base_interval:
+            return min(self.base_interval, interval * 2)
+        return self.base_interval
+
+    def failures(self, key):
+        state = self._devices.get(key)
+        return state["failures"] if state else 0
+
+    def summary(self):
+        """Counts of scheduled intervals, for the status line."""
+        fast = sum(1 for s in self._devices.values() if s["interval"] < self.base_interval)
+        slow = sum(1 for s in self._devices.values() if s["interval"] > self.base_interval and not s["failures"])
+        backoff = sum(1 for s in self._devices.values() if s["failures"])
+        return {"devices": len(self._devices), "fast": fast, "slow": slow, "backoff": backoff}
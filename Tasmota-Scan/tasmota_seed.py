@@ -0,0 +1,270 @@
+import argparse
+import ipaddress
+import re
+import socket
+import struct
+import subprocess
+import time
+from pathlib import Path
+
+import tasmota_scan
+
+# Seeded discovery: probe the addresses that are most likely Tasmota first.
+#
+# The OS neighbour table (/proc/net/arp, `ip neigh`, `arp -a`) lists the hosts
+# that talked recently, with their MACs. Entries with an Espressif MAC (the
+# ESP8266/ESP32 chips Tasmota runs on) or a MAC already known from the logs
+# become seeds; optionally, hosts answering an mDNS query for _http._tcp are
+# added too. Seeds are probed first, the brute-force sweep covers the rest,
+# including neighbours with any other MAC: the OUI list is not exhaustive and
+# randomized MACs say nothing about the chip, so they are only probed later.
+# SKIP_FOREIGN_NEIGHBORS = True leaves them out of the sweep (only for
+# networks where every plug has a listed OUI or is already in the logs).
+#
+# All parsers take the table text, so they work on saved fixtures:
+#   python tasmota_seed.py 192.168.1.0/24 --arp-file arp.txt
+
+# Espressif Systems OUIs (from the IEEE registry; not exhaustive, known MACs cover the rest).
+ESPRESSIF_OUIS = frozenset({
+    "08:3A:8D", "08:3A:F2", "08:B6:1F", "0C:8B:95", "0C:B8:15", "0C:DC:7E", "10:06:1C", "10:52:1C",
+    "10:91:A8", "10:97:BD", "18:FE:34", "1C:9D:C2", "24:0A:C4", "24:4C:AB", "24:62:AB", "24:6F:28",
+    "24:A1:60", "24:B2:DE", "24:D7:EB", "24:DC:C3", "2C:3A:E8", "2C:F4:32", "30:83:98", "30:AE:A4",
+    "30:C6:F7", "34:85:18", "34:86:5D", "34:94:54", "34:AB:95", "34:B4:72", "3C:61:05", "3C:71:BF",
+    "40:22:D8", "40:4C:CA", "40:91:51", "40:F5:20", "44:17:93", "48:27:E2", "48:31:B7", "48:3F:DA",
+    "48:55:19", "48:E7:29", "4C:11:AE", "4C:75:25", "4C:EB:D6", "50:02:91", "54:43:B2", "58:BF:25", "58:CF:79", "5C:CF:7F", "60:01:94", "60:55:F9", "64:B7:08", "68:67:25", "68:C6:3A",
+    "70:03:9F", "70:04:1D", "70:B8:F6", "78:21:84", "78:E3:6D", "7C:87:CE", "7C:9E:BD", "7C:DF:A1",
+    "80:64:6F", "80:7D:3A", "84:0D:8E", "84:CC:A8", "84:F3:EB", "84:F7:03", "84:FC:E6", "8C:4B:14",
+    "8C:AA:B5", "8C:CE:4E", "90:38:0C", "90:97:D5", "94:3C:C6", "94:B5:55", "94:B9:7E", "94:E6:86",
+    "98:CD:AC", "98:F4:AB", "9C:9C:1F", "A0:20:A6", "A0:76:4E", "A0:A3:B3", "A4:7B:9D", "A4:CF:12",
+    "A4:E5:7C", "A8:03:2A", "A8:42:E3", "A8:48:FA", "AC:0B:FB", "AC:67:B2", "B0:A7:32", "B0:B2:1C",
+    "B4:8A:0A", "B4:E6:2D", "B8:D6:1A", "B8:F0:09", "BC:DD:C2", "BC:FF:4D", "C0:49:EF", "C4:4F:33",
+    "C4:5B:BE", "C4:DD:57", "C8:2B:96", "C8:2E:18", "C8:C9:A3", "C8:F0:9E", "CC:50:E3", "CC:7B:5C",
+    "CC:8D:A2", "CC:DB:A7", "D0:EF:76", "D4:8A:FC", "D4:D4:DA", "D8:13:2A", "D8:A0:1D", "D8:BC:38",
+    "D8:BF:C0", "D8:F1:5B", "DC:06:75", "DC:4F:22", "DC:54:75", "DC:DA:0C", "E0:5A:1B", "E0:98:06",
+    "E4:65:B8", "E8:06:90", "E8:31:CD", "E8:68:E7", "E8:6B:EA", "E8:9F:6D", "E8:DB:84", "EC:62:60",
+    "EC:64:C9", "EC:94:CB", "EC:DA:3B", "EC:FA:BC", "F0:08:D1", "F0:9E:9E", "F4:12:FA", "F4:CF:A2",
+    "FC:B4:67", "FC:E8:C0", "FC:F5:C4",
+})
+
+SKIP_FOREIGN_NEIGHBORS = False
+MDNS_ADDRESS = ("224.0.0.251", 5353)
+MDNS_TIMEOUT = 1.0
+
+_MAC_RE = re.compile(r"([0-9A-Fa-f]{1,2}[:-]){5}[0-9A-Fa-f]{1,2}")
+_IP_RE = re.compile(r"\b(\d{1,3}(?:\.\d{1,3}){3})\b")
+
+
+def _canonical_mac(mac):
+    """'a-b-cc-dd-ee-ff' / 'a:b:...' -> '0A:0B:CC:DD:EE:FF' (None for empty/broadcast)."""
+    parts = re.split(r"[:-]", str(mac).strip())
+    if len(parts) != 6:
+        return None
+    mac = ":".join(p.zfill(2) for p in parts).upper()
+    if mac in ("00:00:00:00:00:00", "FF:FF:FF:FF:FF:FF"):
+        return None
+    return mac
+
+
+def is_espressif(mac):
+    mac = _canonical_mac(mac) if mac else None
+    return bool(mac) and mac[:8] in ESPRESSIF_OUIS
+
+
+def parse_proc_net_arp(text):
+    """[(ip, mac)] of Linux /proc/net/arp (incomplete entries skipped)."""
+    neighbors = []
+    for line in text.splitlines()[1:]:
+        fields = line.split()
+        if len(fields) < 4 or fields[2] == "0x0":
+            continue
+        mac = _canonical_mac(fields[3])
+        if mac:
+            neighbors.append((fields[0], mac))
+    return neighbors
+
+
+def parse_ip_neigh(text):
+    """[(ip, mac)] of `ip neigh` output (FAILED/INCOMPLETE entries have no lladdr)."""
+    neighbors = []
+    for line in text.splitlines():
+        fields = line.split()
+        if "lladdr" not in fields or fields[-1] in ("FAILED", "INCOMPLETE"):
+            continue
+        mac = _canonical_mac(fields[fields.index("lladdr") + 1])
+        if mac and fields:
+            neighbors.append((fields[0], mac))
+    return neighbors
+
+
+def parse_arp_a(text):
+    """[(ip, mac)] of `arp -a` (Windows: "ip  aa-bb-..  dynamic", BSD/macOS: "? (ip) at aa:b:..")."""
+    neighbors = []
+    for line in text.splitlines():
+        ip = _IP_RE.search(line)
+        mac = _MAC_RE.search(line)
+        if ip and mac:
+            mac = _canonical_mac(mac.group(0))
+            if mac:
+                neighbors.append((ip.group(1), mac))
+    return neighbors
+
+
+def _run(command):
+    try:
+        return subprocess.run(command, capture_output=True, text=True, timeout=5).stdout
+    except (OSError, subprocess.SubprocessError):
+        return ""
+
+
+def read_neighbor_table(arp_path: Path = Path("/proc/net/arp")):
+    """[(ip, mac)] from the OS neighbour table; empty if none is readable."""
+    try:
+        neighbors = parse_proc_net_arp(arp_path.read_text(encoding="utf-8", errors="replace"))
+    except OSError:
+        neighbors = []
+    if not neighbors:
+        neighbors = parse_ip_neigh(_run(["ip", "neigh"]))
+    if not neighbors:
+        neighbors = parse_arp_a(_run(["arp", "-a"]))
+    return neighbors
+
+
+def _mdns_query(service):
+    header = struct.pack("!HHHHHH", 0, 0, 1, 0, 0, 0)
+    name = b"".join(bytes([len(label)]) + label.encode("ascii") for label in service.split(".")) + b"\0"
+    return header + name + struct.pack("!HH", 12, 1)  # PTR, IN
+
+
+def mdns_responders(service="_http._tcp.local", timeout=MDNS_TIMEOUT):
+    """IPs of hosts answering an mDNS query for `service` (Tasmota: SetOption55 1)."""
+    found = set()
+    try:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    except OSError:
+        return found
+    with sock:
+        try:
+            # Sent from an ephemeral port: responders answer us by unicast.
+            sock.sendto(_mdns_query(service), MDNS_ADDRESS)
+        except OSError:
+            return found
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            sock.settimeout(remaining)
+            try:
+                data, (ip, _port) = sock.recvfrom(4096)
+            except OSError:
+                break
+            # Any response with answers (ANCOUNT > 0) counts; the probe confirms.
+            if len(data) >= 12 and struct.unpack("!H", data[6:8])[0] > 0:
+                found.add(ip)
+    return found
+
+
+def _networks(cidrs):
+    ranges = []
+    for spec in cidrs:
+        spec = str(spec).strip()
+        if "-" in spec:
+            first, last = (ipaddress.ip_address(p.strip()) for p in spec.split("-", 1))
+            ranges.append((int(first), int(last)))
+        else:
+            network = ipaddress.ip_network(spec, strict=False)
+            ranges.append((int(network.network_address), int(network.broadcast_address)))
+    return ranges
+
+
+def _in_ranges(ip, ranges):
+    try:
+        n = int(ipaddress.ip_address(ip))
+    except ValueError:
+        return False
+    return any(lo <= n <= hi for lo, hi in ranges)
+
+
+def plan_discovery(cidrs, neighbors=(), known_macs=(), mdns_ips=()):
+    """(seeds, skip, counts): addresses to probe first, neighbours to leave out of the sweep.
+
+    `skip` stays empty unless SKIP_FOREIGN_NEIGHBORS is set.
+    """
+    ranges = _networks(cidrs)
+    known = {tasmota_scan._normalize_mac(m) for m in known_macs if m}
+    seeds, skip = [], []
+    seen = set()
+    counts = {"espressif": 0, "known": 0, "mdns": 0, "foreign": 0}
+    for ip, mac in neighbors:
+        if not _in_ranges(ip, ranges) or ip in seen:
+            continue
+        seen.add(ip)
+        if mac in known:
+            counts["known"] += 1
+            seeds.append(ip)
+        elif is_espressif(mac):
+            counts["espressif"] += 1
+            seeds.append(ip)
+        else:
+            counts["foreign"] += 1
+            skip.append(ip)
+    for ip in sorted(mdns_ips, key=ipaddress.ip_address):
+        if _in_ranges(ip, ranges) and ip not in seeds:  # mDNS: few hosts
+            counts["mdns"] += 1
+            seeds.append(ip)
+            if ip in skip:
+                skip.remove(ip)
+                counts["foreign"] -= 1
+    return seeds, (skip if SKIP_FOREIGN_NEIGHBORS else []), counts
+
+
+def known_macs():
+    """MACs of all devices with a log (from the data folder manifest)."""
+    return {d.get("mac") for d in tasmota_scan.load_manifest()["devices"].values() if d.get("mac")}
+
+
+def seed_discovery(cidrs, mdns=False):
+    """plan_discovery() from this host's neighbour table (+ mDNS); prints a summary line."""
+    neighbors = read_neighbor_table()
+    mdns_ips = mdns_responders() if mdns else ()
+    seeds, skip, counts = plan_discovery(cidrs, neighbors, known_macs(), mdns_ips)
+    if neighbors or mdns_ips:
+        print(f"🌱 Seeded {len(seeds)} candidate(s) from {len(neighbors)} neighbour(s): "
+              f"{counts['espressif']} Espressif, {counts['known']} known, {counts['mdns']} mDNS; "
+              + (f"{len(skip)} non-ESP host(s) left out of the sweep" if SKIP_FOREIGN_NEIGHBORS
+                 else f"{counts['foreign']} other host(s) probed after them"))
+    return seeds, skip
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Show the discovery seeds from the neighbour table / mDNS.")
+    parser.add_argument("cidrs", nargs="*", help="ranges to match (default: local /24)")
+    parser.add_argument("--arp-file", type=Path, default=None,
+                        help="neighbour table fixture (/proc/net/arp, `ip neigh` or `arp -a` output)")
+    parser.add_argument("--mdns", action="store_true", help="also query mDNS (_http._tcp.local)")
+    args = parser.parse_args(argv)
+
+    tasmota_scan._ensure_utf8_stdout()
+    cidrs = args.cidrs or tasmota_scan._default_cidrs()
+    if args.arp_file is not None:
+        text = args.arp_file.read_text(encoding="utf-8", errors="replace")
+        neighbors = parse_proc_net_arp(text) or parse_ip_neigh(text) or parse_arp_a(text)
+    else:
+        neighbors = read_neighbor_table()
+    mdns_ips = mdns_responders() if args.mdns else ()
+    seeds, skip, counts = plan_discovery(cidrs, neighbors, known_macs(), mdns_ips)
+    print(f"🌱 {len(neighbors)} neighbour(s), {len(seeds)} seed(s) in {', '.join(cidrs)}: "
+          f"{counts['espressif']} Espressif, {counts['known']} known, {counts['mdns']} mDNS, "
+          f"{counts['foreign']} other")
+    macs = dict(neighbors)
+    for ip in seeds:
+        print(f"  ✅ {ip:<16} {macs.get(ip, 'mDNS')}")
+    for ip, mac in neighbors:
+        if ip not in seeds and _in_ranges(ip, _networks(cidrs)):
+            print(f"  {'⏭️ ' if ip in skip else '🔎'} {ip:<16} {mac} "
+                  f"({'not ESP, skipped' if ip in skip else 'probed by the sweep'})")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,346 @@
+import json
+from array import array
+from pathlib import Path
+
+import tasmota_scan
+
+# Parsed cost series for plotting, cached in data/_meta/plot_cache.json.
+#
+# Per device log (keyed by file name) the cache keeps epoch times + cost
+# values and how far the entries file has been parsed (byte offset, inode,
+# size, mtime) as plain JSON; a cache that can't be read is rebuilt. On the next
+# run only bytes appended since then are parsed. A log that was rewritten
+# (merge/migration: new inode or smaller size) or whose baseline changed is
+# parsed again from the start. Schema 1 logs (one JSON file) are re-parsed
+# only when their size/mtime changes.
+
+CACHE_VERSION = 2
+# Pickled cache of older versions; removed when the JSON cache is written.
+_LEGACY_CACHE = "plot_cache.pkl"
+
+
+def _cache_path(data_dir: Path):
+    return data_dir / "_meta" / "plot_cache.json"
+
+
+def _load_cache(path: Path):
+    """{file name: _Series}; empty (full re-parse) if the cache is missing or unusable."""
+    try:
+        with path.open("r", encoding="utf-8") as f:
+            cache = json.load(f)
+        if isinstance(cache, dict) and cache.get("version") == CACHE_VERSION:
+            return {name: _Series.from_dict(item) for name, item in cache["devices"].items()}
+    except Exception:
+        pass  # missing, torn or from another version: rebuild
+    return {}
+
+
+def _save_cache(path: Path, devices):
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        cache = {"version": CACHE_VERSION, "devices": {name: item.to_dict() for name, item in devices.items()}}
+        tmp = path.with_name(path.name + ".tmp")
+        with tmp.open("w", encoding="utf-8") as f:
+            json.dump(cache, f, separators=(",", ":"))
+        tmp.replace(path)
+        path.with_name(_LEGACY_CACHE).unlink(missing_ok=True)
+    except OSError:
+        pass
+
+
+def clear_cache(data_dir: Path):
+    for path in (_cache_path(data_dir), _cache_path(data_dir).with_name(_LEGACY_CACHE)):
+        try:
+            path.unlink()
+        except OSError:
+            pass
+
+
+def _signature(path: Path):
+    try:
+        st = path.stat()
+    except OSError:
+        return None
+    return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+
+def _entry_point(entry, baseline_kwh):
+    """(epoch, cost) of one entry, or None (same rules as the plotters)."""
+    epoch = tasmota_scan._entry_epoch(entry)
+    if epoch is None:
+        return None
+
+    cost_since = tasmota_scan._safe_float(entry.get("cost_since_first_seen_eur"))
+    if cost_since is None:
+        total_kwh = tasmota_scan._safe_float(entry.get("total_kwh"))
+        price = tasmota_scan._safe_float(entry.get("price_eur_per_kwh"))
+        if baseline_kwh is not None and total_kwh is not None and price is not None:
+            cost_since = max(total_kwh - baseline_kwh, 0.0) * price
+    if cost_since is None:
+        return None
+    return epoch, cost_since
+
+
+def _read_appended(path: Path, offset: int):
+    """Parse complete lines after `offset`; returns (entries, new_offset)."""
+    try:
+        with path.open("rb") as f:
+            f.seek(offset)
+            chunk = f.read()
+    except OSError:
+        return [], offset
+    end = chunk.rfind(b"\n") + 1  # a torn last line is picked up once complete
+    entries = []
+    for line in chunk[:end].splitlines():
+        if not line.strip():
+            continue
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            continue
+        if isinstance(entry, dict):
+            entries.append(entry)
+    return entries, offset + end
+
+
+class _Series:
+    """Cached, incrementally extended cost series of one device log."""
+
+    def __init__(self):
+        self.header_sig = None
+        self.label = None
+        self.baseline_kwh = None
+        self.schema = 1
+        self.entries_path = None
+        self.entries_file = None  # entries_path.name as loaded from the cache
+        self.entries_sig = None
+        self.offset = 0
+        self.times = array("d")
+        self.eur = array("d")
+
+    def to_dict(self):
+        return {
+            "header_sig": self.header_sig,
+            "label": self.label,
+            "baseline_kwh": self.baseline_kwh,
+            "schema": self.schema,
+            "entries_file": self.entries_path.name if self.entries_path else None,
+            "entries_sig": self.entries_sig,
+            "offset": self.offset,
+            "times": self.times.tolist(),
+            "eur": self.eur.tolist(),
+        }
+
+    @classmethod
+    def from_dict(cls, item):
+        series = cls()
+        series.header_sig = tuple(item["header_sig"]) if item["header_sig"] else None
+        series.label = item["label"]
+        series.baseline_kwh = item["baseline_kwh"]
+        series.schema = int(item["schema"])
+        series.entries_file = item["entries_file"]
+        series.entries_sig = tuple(item["entries_sig"]) if item["entries_sig"] else None
+        series.offset = int(item["offset"])
+        series.times = array("d", item["times"])
+        series.eur = array("d", item["eur"])
+        if len(series.times) != len(series.eur):
+            raise ValueError("corrupt series")
+        return series
+
+    def reset(self):
+        self.entries_sig = None
+        self.offset = 0
+        self.times = array("d")
+        self.eur = array("d")
+
+    def add(self, entries):
+        points = [p for p in (_entry_point(e, self.baseline_kwh) for e in entries) if p is not None]
+        if not points:
+            return
+        if self.times and points[0][0] < self.times[-1] or any(
+                b[0] < a[0] for a, b in zip(points, points[1:])):
+            merged = sorted(list(zip(self.times, self.eur)) + points, key=lambda p: p[0])
+            self.times = array("d", (p[0] for p in merged))
+            self.eur = array("d", (p[1] for p in merged))
+            return
+        self.times.extend(p[0] for p in points)
+        self.eur.extend(p[1] for p in points)
+
+    def update(self, path: Path):
+        """Bring the series up to date with `path`; returns True if changed."""
+        changed = False
+        header_sig = _signature(path)
+        full_log = None
+        if self.entries_path is None and self.entries_file:
+            self.entries_path = path.with_name(self.entries_file)
+        if header_sig != self.header_sig or self.entries_path is None:
+            log = tasmota_scan.load_device_log(path, with_entries=False)
+            dev = log.get("device") or {}
+            label = tasmota_scan._clean_str(dev.get("hostname") or dev.get("name") or path.stem, default=path.stem)
+            baseline_kwh = tasmota_scan._safe_float(dev.get("baseline_total_kwh"))
+            schema = int(log.get("schema_version") or 1)
+            if baseline_kwh != self.baseline_kwh or schema != self.schema:
+                self.reset()
+            self.header_sig, self.label, self.baseline_kwh, self.schema = header_sig, label, baseline_kwh, schema
+            self.entries_path = tasmota_scan._entries_path(path, log) if schema >= 2 else path
+            full_log = log if schema < 2 else None
+            changed = True
+
+        entries_sig = _signature(self.entries_path)
+        if entries_sig == self.entries_sig:
+            return changed
+
+        if self.schema < 2:
+            # Schema 1: the whole file is one JSON document.
+            self.reset()
+            log = full_log or tasmota_scan.load_device_log(path)
+            self.add(log.get("entries") or [])
+        else:
+            rewritten = (
+                entries_sig is None
+                or self.entries_sig is None
+                or entries_sig[0] != self.entries_sig[0]
+                or entries_sig[1] < self.offset
+            )
+            if rewritten:
+                self.reset()
+            if entries_sig is not None:
+                entries, self.offset = _read_appended(self.entries_path, self.offset)
+                self.add(entries)
+        self.entries_sig = entries_sig
+        return True
+
+
+def load_cost_series_cached(data_dir: Path):
+    """(label, times_epoch[], eur[]) per device from the JSON logs, incrementally.
+
+    Points follow _entry_point() and are sorted by time; only entries
+    appended since the last call are parsed. Times are float epoch seconds (UTC).
+    """
+    cache_path = _cache_path(data_dir)
+    devices = _load_cache(cache_path)
+    changed = False
+    series = []
+    seen = set()
+
+    for path in sorted(data_dir.glob("*.json")):
+        seen.add(path.name)
+        item = devices.get(path.name)
+        if item is None:
+            item = devices[path.name] = _Series()
+        changed |= item.update(path)
+        if item.times:
+            series.append((item.label, item.times, item.eur))
+
+    for name in set(devices) - seen:
+        del devices[name]
+        changed = True
+    if changed:
+        _save_cache(cache_path, devices)
+    return series
+
+
+def to_plot_times(times):
+    """Epoch seconds -> values matplotlib can plot (datetime64 or datetimes)."""
+    try:
+        import numpy as np
+    except ImportError:
+        from datetime import datetime, timezone
+        return [datetime.fromtimestamp(t, timezone.utc) for t in times]
+    epoch_us = np.asarray(times, dtype="f8") * 1e6
+    return epoch_us.astype("int64").astype("datetime64[us]")
+
+
+# -----------------------------------------------------------------------------
+# Downsampling for plotting: cut a series to about one point per pixel column
+# while keeping its visual shape.
+#   "lttb":   Largest-Triangle-Three-Buckets (keeps the most "visible" point
+#             of each bucket; smooth curves look identical).
+#   "minmax": per pixel column keep the min and the max point (spikes and
+#             steps are never lost).
+# -----------------------------------------------------------------------------
+
+DOWNSAMPLE_METHODS = ("minmax", "lttb")
+
+
+def _epoch_seconds(times):
+    """float64 epoch seconds for epoch floats, datetime64 arrays or datetimes."""
+    import numpy as np
+
+    arr = np.asarray(times)
+    if np.issubdtype(arr.dtype, np.datetime64):
+        return arr.astype("datetime64[us]").astype("int64") / 1e6
+    if arr.dtype == object:
+        return np.array([t.timestamp() for t in times], dtype="f8")
+    return arr.astype("f8")
+
+
+def _lttb_indices(x, y, n_out):
+    import numpy as np
+
+    n = len(x)
+    # n_out - 2 buckets between the fixed first and last point.
+    edges = np.linspace(1, n - 1, n_out - 1).astype("int64")
+    counts = np.diff(np.r_[edges, n])
+    # Third point of each triangle: average of the next bucket (last: the end point).
+    avg_x = np.r_[(np.add.reduceat(x, edges) / counts)[1:-1], x[-1]]
+    avg_y = np.r_[(np.add.reduceat(y, edges) / counts)[1:-1], y[-1]]
+
+    keep = np.empty(n_out, dtype="int64")
+    keep[0], keep[-1] = 0, n - 1
+    prev = 0
+    for b in range(n_out - 2):
+        lo, hi = edges[b], edges[b + 1]
+        px, py = x[prev], y[prev]
+        # Twice the triangle area (prev, candidate, next average), up to sign.
+        area = np.abs((px - avg_x[b]) * (y[lo:hi] - py) - (px - x[lo:hi]) * (avg_y[b] - py))
+        prev = lo + int(area.argmax())
+        keep[b + 1] = prev
+    return keep
+
+
+def _minmax_indices(x, y, n_buckets):
+    import numpy as np
+
+    span = x[-1] - x[0]
+    if span <= 0:
+        bucket = np.zeros(len(x), dtype="int64")
+    else:
+        bucket = np.minimum(((x - x[0]) / span * n_buckets).astype("int64"), n_buckets - 1)
+    # Sorted by (bucket, y): first of a bucket is its min, last its max.
+    order = np.lexsort((y, bucket))
+    sorted_buckets = bucket[order]
+    starts = np.flatnonzero(np.r_[True, sorted_buckets[1:] != sorted_buckets[:-1]])
+    ends = np.r_[starts[1:], len(order)] - 1
+    keep = np.unique(np.concatenate(([0, len(x) - 1], order[starts], order[ends])))
+    return keep
+
+
+def downsample_indices(times, values, max_points, method="minmax"):
+    """Indices of the points to draw (sorted), or None to draw everything."""
+    if not max_points or len(values) <= max_points:
+        return None
+    if method not in DOWNSAMPLE_METHODS:
+        raise ValueError(f"unknown downsample method: {method!r}")
+    try:
+        import numpy as np
+    except ImportError:
+        return None
+
+    x = _epoch_seconds(times)
+    y = np.asarray(values, dtype="f8")
+    if method == "minmax":
+        return _minmax_indices(x, y, max(max_points // 2, 1))
+    return _lttb_indices(x, y, max(max_points, 3))
+
+
+def downsample_series(times, values, max_points, method="minmax"):
+    """(times, values) cut to about `max_points` points (0/None: unchanged)."""
+    keep = downsample_indices(times, values, max_points, method)
+    if keep is None:
+        return times, values
+    return _take(times, keep), _take(values, keep)
+
+
+def _take(seq, keep):
+    return seq[keep] if hasattr(seq, "dtype") else [seq[i] for i in keep]
@@ -0,0 +1,383 @@
+import argparse
+import ipaddress
+import json
+import multiprocessing
+import queue
+import socket
+import socketserver
+import threading
+import time
+from pathlib import Path
+
+import tasmota_http
+import tasmota_scan
+
+# Sharded scanning: one coordinator, many workers (local processes or other
+# hosts, e.g. one per site/VLAN).
+#
+# The coordinator splits the address ranges (and known-device lists) into
+# shards and hands them out over a small protocol: one JSON object per line
+# over TCP. A worker only discovers and fetches; it streams every device's
+# telemetry back as soon as it is complete. The coordinator persists all
+# devices with the normal single writer (legacy logs merged with the
+# _merge_device_logs rules), so the store looks exactly like after a local
+# scan. A shard whose worker dies is handed to another worker.
+#
+#   coordinator -> worker  {"cmd": "scan", "shard": 3, "cidrs": [...] | "targets": [...], ...}
+#   worker -> coordinator  {"type": "device", "ip": ..., "device_info": ..., "state_data": ...,
+#                           "energy_data": ..., "received": <epoch>}
+#                          {"type": "error", "ip": ..., "error": "..."}
+#                          {"type": "done", "shard": 3, "devices": 5, "seconds": 1.2, "http": {...}}
+#
+# The protocol has no encryption; --token only keeps strangers out. Run
+# workers on trusted networks.
+#
+#   python tasmota_shard.py worker --listen 0.0.0.0:8765
+#   python tasmota_shard.py scan 10.1.0.0/22 10.2.0.0/22 --worker pi-site-a:8765 --worker pi-site-b:8765
+#   python tasmota_shard.py scan 10.0.0.0/20 --local-workers 4
+
+DEFAULT_PORT = 8765
+# Addresses per shard: small enough to spread a range over the workers.
+SHARD_HOSTS = 256
+TARGETS_PER_SHARD = 32
+# A shard is tried on at most this many workers.
+MAX_ATTEMPTS = 3
+CONNECT_TIMEOUT = 5.0
+# A worker must report within this time (discovery of one shard + telemetry).
+SHARD_TIMEOUT = 120.0
+
+
+class ShardError(Exception):
+    pass
+
+
+def _split_network(spec, shard_hosts):
+    """Yield "first-last" host ranges (or the spec itself) of at most `shard_hosts` addresses."""
+    spec = str(spec).strip()
+    if "-" in spec:
+        first, last = (ipaddress.ip_address(part.strip()) for part in spec.split("-", 1))
+    else:
+        network = ipaddress.ip_network(spec, strict=False)
+        if network.num_addresses <= shard_hosts:
+            yield spec
+            return
+        # Same hosts as network.hosts(): without network/broadcast address (IPv4).
+        first = next(iter(network.hosts()))
+        last = network.broadcast_address - 1 if network.version == 4 else network.broadcast_address
+    for lo in range(int(first), int(last) + 1, shard_hosts):
+        hi = min(lo + shard_hosts - 1, int(last))
+        yield f"{ipaddress.ip_address(lo)}-{ipaddress.ip_address(hi)}"
+
+
+def plan_shards(cidrs=None, targets=None, shard_hosts=SHARD_HOSTS, targets_per_shard=TARGETS_PER_SHARD):
+    """Split ranges and/or target IPs into shard dicts {"shard", "cidrs"|"targets"}."""
+    shards = []
+    small = []
+    small_hosts = 0
+    for spec in cidrs or ():
+        for part in _split_network(spec, shard_hosts):
+            if "-" in part:
+                shards.append({"cidrs": [part]})
+                continue
+            # Small networks and single IPs share a shard.
+            size = ipaddress.ip_network(part, strict=False).num_addresses
+            if small and small_hosts + size > shard_hosts:
+                shards.append({"cidrs": small})
+                small, small_hosts = [], 0
+            small.append(part)
+            small_hosts += size
+    if small:
+        shards.append({"cidrs": small})
+
+    targets = list(targets or ())
+    for i in range(0, len(targets), max(1, targets_per_shard)):
+        shards.append({"targets": targets[i:i + targets_per_shard]})
+    for n, shard in enumerate(shards):
+        shard["shard"] = n
+    return shards
+
+
+def _send(wfile, message):
+    wfile.write((json.dumps(message, ensure_ascii=False) + "\n").encode("utf-8"))
+    wfile.flush()
+
+
+def _decode(line):
+    try:
+        message = json.loads(line)
+    except (UnicodeDecodeError, ValueError):
+        return None
+    return message if isinstance(message, dict) else None
+
+
+# -----------------------------------------------------------------------------
+# Worker
+# -----------------------------------------------------------------------------
+
+class _WorkerHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            request = _decode(line)
+            if request is None:
+                continue
+            if self.server.token and request.get("token") != self.server.token:
+                _send(self.wfile, {"type": "failed", "error": "bad token"})
+                return
+            if request.get("cmd") == "ping":
+                _send(self.wfile, {"type": "pong"})
+            elif request.get("cmd") == "scan":
+                self._scan(request)
+            else:
+                _send(self.wfile, {"type": "failed", "error": f"unknown command: {request.get('cmd')!r}"})
+
+    def _scan(self, request):
+        started = time.perf_counter()
+        lock = threading.Lock()
+        devices = [0]
+
+        def _on_fetched(ip, result, error):
+            if error is not None:
+                message = {"type": "error", "ip": ip, "error": str(error)}
+            else:
+                message = dict(result, type="device", ip=ip, received=time.time())
+                devices[0] += 1
+            with lock:
+                _send(self.wfile, message)
+
+        # One shard at a time per process: the HTTP counters belong to this shard.
+        with self.server.scan_lock:
+            tasmota_http.reset_stats()
+            try:
+                tasmota_scan.fetch_fleet(
+                    _on_fetched,
+                    cidrs=request.get("cidrs"),
+                    targets=request.get("targets"),
+                    exclude=request.get("exclude"),
+                    concurrency=request.get("concurrency") or tasmota_scan.DISCOVERY_CONCURRENCY,
+                    fetch_mode=request.get("fetch_mode"),
+                    seed=request.get("seed"),
+                )
+            except Exception as exc:
+                _send(self.wfile, {"type": "failed", "shard": request.get("shard"), "error": str(exc)})
+                return
+            stats = tasmota_http.get_stats()
+        _send(self.wfile, {"type": "done", "shard": request.get("shard"), "devices": devices[0],
+                           "seconds": time.perf_counter() - started, "http": stats})
+
+
+class WorkerServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, address, token=None):
+        super().__init__(address, _WorkerHandler)
+        self.token = token
+        self.scan_lock = threading.Lock()
+
+
+def serve_worker(host="127.0.0.1", port=DEFAULT_PORT, token=None, ready=None):
+    """Run a worker until interrupted; `ready` (queue) receives the bound port."""
+    with WorkerServer((host, port), token=token) as server:
+        bound = server.server_address[1]
+        if ready is not None:
+            ready.put(bound)
+        else:
+            print(f"🛠️  Shard worker listening on {host}:{bound}")
+        server.serve_forever()
+
+
+def start_local_workers(count, token=None):
+    """Start `count` worker processes on 127.0.0.1; returns (processes, addresses)."""
+    ctx = multiprocessing.get_context("spawn")
+    ready = ctx.Queue()
+    processes = []
+    for _ in range(max(1, int(count))):
+        process = ctx.Process(target=serve_worker, args=("127.0.0.1", 0, token, ready), daemon=True)
+        process.start()
+        processes.append(process)
+    addresses = [("127.0.0.1", ready.get(timeout=30)) for _ in processes]
+    return processes, addresses
+
+
+# -----------------------------------------------------------------------------
+# Coordinator
+# -----------------------------------------------------------------------------
+
+def _parse_address(value):
+    host, _, port = str(value).rpartition(":")
+    if not host:
+        return value, DEFAULT_PORT
+    return host, int(port)
+
+
+def run_shard(address, shard, on_message, token=None):
+    """Send one shard to the worker at `address`; calls on_message per reply until done."""
+    with socket.create_connection(address, timeout=CONNECT_TIMEOUT) as sock:
+        sock.settimeout(SHARD_TIMEOUT)
+        with sock.makefile("rwb") as stream:
+            _send(stream, dict(shard, cmd="scan", token=token))
+            for line in stream:
+                message = _decode(line)
+                if message is None:
+                    continue
+                if message.get("type") == "failed":
+                    raise ShardError(message.get("error"))
+                if message.get("type") == "done":
+                    return message
+                on_message(message)
+    raise ShardError("connection closed before the shard was done")
+
+
+def scan_sharded(
+    workers,
+    cidrs=None,
+    targets=None,
+    exclude=None,
+    token=None,
+    shard_hosts: int = SHARD_HOSTS,
+    concurrency: int = tasmota_scan.DISCOVERY_CONCURRENCY,
+    fetch_mode: str = None,
+    plot: bool = True,
+    rewrite_ui: bool = True,
+):
+    """Like scan_network(), but discovery/fetching is spread over `workers` ((host, port) list).
+
+    Devices are persisted here (one writer); a device reported twice in one
+    run (overlapping ranges, multi-homed) is only logged once.
+    """
+    if targets is None and not cidrs:
+        cidrs = tasmota_scan._default_cidrs()
+    shards = plan_shards(cidrs, targets, shard_hosts=shard_hosts)
+    print(f"🧩 {len(shards)} shard(s) on {len(workers)} worker(s)")
+
+    tasmota_http.reset_stats()
+    tasmota_scan.load_manifest()
+    summary = {"total_kosten": 0, "devices": [], "snapshots": []}
+    results_queue = queue.Queue()
+    writer = threading.Thread(target=tasmota_scan._persist_stage, args=(results_queue, summary), daemon=True)
+    writer.start()
+
+    pending = queue.Queue()
+    for shard in shards:
+        pending.put((shard, 0))
+    remaining = [len(shards)]
+    remaining_lock = threading.Lock()
+    failed = []
+    seen_lock = threading.Lock()
+    seen = set()
+
+    def _on_message(message):
+        if message.get("type") == "error":
+            results_queue.put((message.get("ip"), {}, ShardError(message.get("error"))))
+            return
+        ip = message.get("ip")
+        mac = tasmota_scan._normalize_mac((message.get("device_info") or {}).get("mac"))
+        with seen_lock:
+            key = mac or ip
+            if key in seen:
+                return
+            seen.add(key)
+        results_queue.put((ip, message, None))
+
+    def _shard_finished(shard=None):
+        with remaining_lock:
+            remaining[0] -= 1
+            if shard is not None:
+                failed.append(shard)
+
+    def _drive(address):
+        label = f"{address[0]}:{address[1]}"
+        while remaining[0] > 0:
+            try:
+                shard, attempts = pending.get(timeout=0.2)
+            except queue.Empty:
+                continue
+            request = dict(shard, exclude=exclude, concurrency=concurrency, fetch_mode=fetch_mode)
+            try:
+                done = run_shard(address, request, _on_message, token=token)
+            except (OSError, ShardError) as exc:
+                print(f"⚠️  Worker {label}: shard {shard['shard']} failed ({exc})")
+                if attempts + 1 < MAX_ATTEMPTS:
+                    pending.put((shard, attempts + 1))
+                else:
+                    _shard_finished(shard)
+                if isinstance(exc, OSError):
+                    return  # worker unreachable: leave its shards to the others
+                continue
+            tasmota_http.add_stats(done.get("http") or {})
+            _shard_finished()
+
+    started = time.perf_counter()
+    drivers = [threading.Thread(target=_drive, args=(address,), daemon=True) for address in workers]
+    try:
+        for driver in drivers:
+            driver.start()
+        for driver in drivers:
+            driver.join()
+    finally:
+        results_queue.put(None)
+        writer.join()
+        tasmota_scan.save_manifest()
+
+    while not pending.empty():
+        failed.append(pending.get()[0])
+    if failed:
+        print(f"❌ {len(failed)} shard(s) not scanned: "
+              + ", ".join(",".join(s.get("cidrs") or s.get("targets")) for s in failed))
+    print(f"🧩 Sharded scan: {len(shards) - len(failed)}/{len(shards)} shard(s) in "
+          f"{time.perf_counter() - started:.1f} s")
+    return tasmota_scan._finish_scan(summary, plot=plot, rewrite_ui=rewrite_ui)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Sharded Tasmota scanning: coordinator and workers.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    worker = sub.add_parser("worker", help="serve shards (discover + fetch, no storage)")
+    worker.add_argument("--listen", default=f"127.0.0.1:{DEFAULT_PORT}", help="host:port (default: %(default)s)")
+    worker.add_argument("--token", default=None, help="shared secret the coordinator must send")
+    scan = sub.add_parser("scan", help="split a scan over workers and store the results")
+    scan.add_argument("cidrs", nargs="*", help="CIDR ranges, address ranges or IPs (default: local /24)")
+    scan.add_argument("--worker", dest="workers", action="append", default=[], help="host:port (repeatable)")
+    scan.add_argument("--local-workers", type=int, default=0, help="start N worker processes on this machine")
+    scan.add_argument("--targets", default=None, help="file with known device IPs (one per line) instead of ranges")
+    scan.add_argument("--token", default=None)
+    scan.add_argument("--shard-hosts", type=int, default=SHARD_HOSTS, help="addresses per shard")
+    scan.add_argument("--concurrency", type=int, default=tasmota_scan.DISCOVERY_CONCURRENCY,
+                      help="probes in flight per worker")
+    scan.add_argument("--no-plot", action="store_true")
+    tasmota_scan.add_store_argument(scan)
+    args = parser.parse_args(argv)
+
+    tasmota_scan._ensure_utf8_stdout()
+    if args.command == "worker":
+        host, port = _parse_address(args.listen)
+        try:
+            serve_worker(host, port, token=args.token)
+        except KeyboardInterrupt:
+            pass
+        return 0
+
+    tasmota_scan.enable_stores(args.store)
+    workers = [_parse_address(w) for w in args.workers]
+    processes = []
+    if args.local_workers:
+        processes, local = start_local_workers(args.local_workers, token=args.token)
+        workers.extend(local)
+    if not workers:
+        print("❌ No workers: use --worker host:port and/or --local-workers N")
+        return 2
+    targets = None
+    if args.targets:
+        targets = [line.strip() for line in Path(args.targets).read_text(encoding="utf-8").splitlines() if line.strip()]
+    try:
+        Path(tasmota_scan.DATA_DIR).mkdir(parents=True, exist_ok=True)
+        scan_sharded(workers, cidrs=args.cidrs or None, targets=targets, token=args.token,
+                     shard_hosts=args.shard_hosts, concurrency=args.concurrency, plot=not args.no_plot)
+    finally:
+        for process in processes:
+            process.terminate()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
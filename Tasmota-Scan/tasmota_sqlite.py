@@ -0,0 +1,286 @@
+import argparse
+import json
+import sqlite3
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import tasmota_scan
+
+# Optional SQLite snapshot store (data/tasmota.sqlite3).
+#
+# One `snapshots` row per device and scan, indexed on (device, ts_epoch) and
+# ts_epoch, so "cost for all devices last week" is a range query instead of
+# parsing every log. The database runs in WAL mode; scan_network() writes one
+# batch (one transaction) per cycle. `device` is the log file stem.
+
+DB_PATH = tasmota_scan.DATA_DIR / "tasmota.sqlite3"
+
+SNAPSHOT_COLUMNS = (
+    "ip",
+    "hostname",
+    "power_state",
+    "total_kwh",
+    "today_kwh",
+    "yesterday_kwh",
+    "power_w",
+    "voltage_v",
+    "current_a",
+    "price_eur_per_kwh",
+    "cost_total_eur",
+    "cost_since_first_seen_eur",
+    "wifi_signal_dbm",
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS devices (
+    device TEXT PRIMARY KEY,
+    mac TEXT,
+    hostname TEXT,
+    name TEXT,
+    baseline_total_kwh REAL,
+    baseline_set_at TEXT,
+    first_seen TEXT,
+    last_seen TEXT
+);
+CREATE TABLE IF NOT EXISTS snapshots (
+    device TEXT NOT NULL,
+    ts_epoch REAL NOT NULL,
+    ts TEXT NOT NULL,
+    dedup_key TEXT NOT NULL,
+    ip TEXT,
+    hostname TEXT,
+    power_state TEXT,
+    total_kwh REAL,
+    today_kwh REAL,
+    yesterday_kwh REAL,
+    power_w REAL,
+    voltage_v REAL,
+    current_a REAL,
+    price_eur_per_kwh REAL,
+    cost_total_eur REAL,
+    cost_since_first_seen_eur REAL,
+    wifi_signal_dbm REAL,
+    entry TEXT NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS snapshots_device_key ON snapshots (device, dedup_key);
+CREATE INDEX IF NOT EXISTS snapshots_device_ts ON snapshots (device, ts_epoch);
+CREATE INDEX IF NOT EXISTS snapshots_ts ON snapshots (ts_epoch);
+"""
+
+
+def connect(db_path: Path = DB_PATH):
+    db_path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(str(db_path))
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(_SCHEMA)
+    return conn
+
+
+def _dedup_key(entry):
+    """Same identity as _merge_device_logs: (ts, ip, total_kwh rounded)."""
+    total = entry.get("total_kwh")
+    if isinstance(total, float):
+        total = round(total, 6)
+    return json.dumps([(entry.get("ts") or "").strip(), (entry.get("ip") or "").strip(), total])
+
+
+def _snapshot_row(device, entry):
+    epoch = tasmota_scan._entry_epoch(entry)
+    if epoch is None:
+        return None
+    values = [entry.get(col) for col in SNAPSHOT_COLUMNS]
+    return (device, epoch, entry.get("ts"), _dedup_key(entry), *values,
+            json.dumps(entry, ensure_ascii=False))
+
+
+def _device_row(device, dev):
+    return (
+        device,
+        dev.get("mac"),
+        dev.get("hostname"),
+        dev.get("name"),
+        tasmota_scan._safe_float(dev.get("baseline_total_kwh")),
+        dev.get("baseline_set_at"),
+        dev.get("first_seen"),
+        dev.get("last_seen"),
+    )
+
+
+def write_batch(conn, batch):
+    """Insert one cycle's snapshots: batch = [(device, device_dict, [entries])].
+
+    Runs as a single transaction; duplicates (same ts/ip/total) are ignored.
+    Returns the number of new rows.
+    """
+    device_rows = []
+    snapshot_rows = []
+    for device, dev, entries in batch:
+        device_rows.append(_device_row(device, dev or {}))
+        for entry in entries:
+            row = _snapshot_row(device, entry)
+            if row is not None:
+                snapshot_rows.append(row)
+
+    placeholders = ", ".join("?" for _ in range(len(SNAPSHOT_COLUMNS) + 5))
+    with conn:
+        conn.executemany("INSERT OR REPLACE INTO devices VALUES (?, ?, ?, ?, ?, ?, ?, ?)", device_rows)
+        before = conn.total_changes
+        conn.executemany(
+            f"INSERT OR IGNORE INTO snapshots (device, ts_epoch, ts, dedup_key, {', '.join(SNAPSHOT_COLUMNS)}, entry) "
+            f"VALUES ({placeholders})",
+            snapshot_rows,
+        )
+        return conn.total_changes - before
+
+
+def import_device_logs(conn, data_dir: Path = None):
+    """Import data/*.json logs; files of the same device (MAC) are merged first.
+
+    Files are grouped by MAC (or stem when the MAC is unknown) and combined
+    with _merge_device_logs, so duplicates are resolved the same way as
+    during a scan. The canonical (non-legacy) stem is used as device name.
+    """
+    data_dir = data_dir or tasmota_scan.DATA_DIR
+    groups = {}
+    for path in sorted(data_dir.glob("*.json")):
+        log = tasmota_scan.load_device_log(path)
+        mac = tasmota_scan._normalize_mac((log.get("device") or {}).get("mac"))
+        groups.setdefault(mac or f"stem:{path.stem}", []).append((path, log))
+
+    batch = []
+    for members in groups.values():
+        # Canonical Hostname.json first (merge target), legacy Hostname__MAC.json after.
+        members.sort(key=lambda m: ("__" in m[0].stem, m[0].stem))
+        device, merged = members[0][0].stem, members[0][1]
+        for _path, log in members[1:]:
+            tasmota_scan._merge_device_logs(merged, log)
+        batch.append((device, merged.get("device") or {}, merged.get("entries") or []))
+    return write_batch(conn, batch), len(batch)
+
+
+def _range_args(since=None, until=None):
+    lo = since.timestamp() if since is not None else float("-inf")
+    hi = until.timestamp() if until is not None else float("inf")
+    return lo, hi
+
+
+def load_cost_series(conn, since=None, until=None):
+    """(label, times[], eur[]) per device for snapshots in [since, until)."""
+    lo, hi = _range_args(since, until)
+    devices = {
+        row[0]: row[1:]
+        for row in conn.execute("SELECT device, hostname, name, baseline_total_kwh FROM devices")
+    }
+    rows = conn.execute(
+        "SELECT device, ts_epoch, cost_since_first_seen_eur, total_kwh, price_eur_per_kwh FROM snapshots "
+        "WHERE ts_epoch >= ? AND ts_epoch < ? ORDER BY device, ts_epoch",
+        (lo, hi),
+    )
+
+    series = {}
+    for device, ts_epoch, cost_since, total_kwh, price in rows:
+        hostname, name, baseline_kwh = devices.get(device, (None, None, None))
+        if cost_since is None and None not in (baseline_kwh, total_kwh, price):
+            cost_since = max(total_kwh - baseline_kwh, 0.0) * price
+        if cost_since is None:
+            continue
+        label = tasmota_scan._clean_str(hostname or name or device, default=device)
+        times, eur = series.setdefault(device, (label, [], []))[1:]
+        times.append(datetime.fromtimestamp(ts_epoch, timezone.utc))
+        eur.append(cost_since)
+    return list(series.values())
+
+
+# Energy between consecutive readings in range, with the reset rule of
+# tasmota_cost.interval_costs(): a drop of total_kwh is a counter reset and the
+# new reading is the energy since the reset; billed at the closing price.
+_INTERVALS = """
+    WITH r AS (
+        SELECT device, total_kwh, price_eur_per_kwh AS price,
+            LAG(total_kwh) OVER (PARTITION BY device ORDER BY ts_epoch) AS prev_kwh
+        FROM snapshots
+        WHERE ts_epoch >= :lo AND ts_epoch < :hi AND total_kwh IS NOT NULL
+    ), i AS (
+        SELECT device, price,
+            CASE WHEN prev_kwh IS NULL THEN 0.0
+                 WHEN total_kwh >= prev_kwh THEN total_kwh - prev_kwh
+                 ELSE total_kwh END AS kwh
+        FROM r
+    )
+    SELECT device, SUM(kwh), SUM(kwh * price), SUM(CASE WHEN price IS NULL THEN kwh ELSE 0.0 END)
+    FROM i GROUP BY device
+"""
+
+
+def cost_report(conn, since=None, until=None):
+    """Per device: samples, kWh and cost in [since, until) (counter resets handled)."""
+    lo, hi = _range_args(since, until)
+    params = {"lo": lo, "hi": hi}
+    in_range = "s.device = d.device AND s.ts_epoch >= :lo AND s.ts_epoch < :hi"
+    query = f"""
+        SELECT d.device, COALESCE(d.hostname, d.name, d.device),
+            (SELECT COUNT(*) FROM snapshots s WHERE {in_range}),
+            (SELECT s.price_eur_per_kwh FROM snapshots s WHERE {in_range} AND s.price_eur_per_kwh IS NOT NULL
+                ORDER BY s.ts_epoch DESC LIMIT 1)
+        FROM devices d ORDER BY 2
+    """
+    intervals = {row[0]: row[1:] for row in conn.execute(_INTERVALS, params)}
+    report = []
+    for device, label, samples, price in conn.execute(query, params):
+        if not samples:
+            continue
+        kwh, cost, unpriced_kwh = intervals.get(device, (None, None, None))
+        if kwh is not None and unpriced_kwh:
+            # Snapshots without a price: the last price in range, as before.
+            cost = (cost or 0.0) + unpriced_kwh * price if price is not None else None
+        report.append({"device": device, "label": label, "samples": samples, "kwh": kwh, "cost_eur": cost})
+    return report
+
+
+def append_snapshot_batch(batch, db_path: Path = DB_PATH):
+    """Write one scan cycle's batch to the database at `db_path`."""
+    if not batch:
+        return 0
+    conn = connect(db_path)
+    try:
+        return write_batch(conn, batch)
+    finally:
+        conn.close()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="SQLite snapshot store.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("import", help="import data/*.json logs (merging duplicates)")
+    report = sub.add_parser("report", help="kWh and cost per device for a time range")
+    report.add_argument("--days", type=float, default=7.0, help="range: the last N days (default: 7)")
+    parser.add_argument("--db", type=Path, default=DB_PATH)
+    args = parser.parse_args(argv)
+
+    tasmota_scan._ensure_utf8_stdout()
+    conn = connect(args.db)
+    try:
+        if args.command == "import":
+            started = time.perf_counter()
+            rows, devices = import_device_logs(conn)
+            print(f"📦 Imported {rows} snapshot(s) for {devices} device(s) into {args.db} "
+                  f"({time.perf_counter() - started:.1f} s)")
+        else:
+            since = datetime.fromtimestamp(time.time() - args.days * 86400, timezone.utc)
+            rows = cost_report(conn, since=since)
+            print(f"💸 Last {args.days:g} day(s) since {since.astimezone().isoformat(timespec='minutes')}:")
+            for r in rows:
+                kwh = f"{r['kwh']:.3f} kWh" if r["kwh"] is not None else "n/a"
+                cost = f"{r['cost_eur']:.2f} EUR" if r["cost_eur"] is not None else "n/a"
+                print(f"  {r['label']:<28} {r['samples']:>6} samples  {kwh:>14}  {cost:>12}")
+            total = sum(r["cost_eur"] or 0.0 for r in rows)
+            print(f"  {'TOTAL':<28} {'':>14}  {'':>14}  {total:>8.2f} EUR")
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,104 @@
+from __future__ import annotations
+
+import argparse
+import contextlib
+import io
+import json
+import math
+import random
+import shutil
+import tempfile
+import time
+import warnings
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import matplotlib
+
+matplotlib.use("Agg")
+
+import matplotlib.pyplot as plt  # noqa: E402
+
+import tasmota_scan  # noqa: E402
+import tasmota_series  # noqa: E402
+
+# -----------------------------------------------------------------------------
+# Plot render benchmark: every raw point vs. LTTB / min-max downsampling.
+# Writes synthetic device logs (10-minute snapshots) to a temp folder, warms
+# the plot cache once and then times generate_cost_plot_per_device().
+#
+#   python -m tools.bench_plot --devices 8 --days 365
+# -----------------------------------------------------------------------------
+
+
+def _write_logs(data_dir: Path, devices: int, days: float, seed: int = 1) -> int:
+    rng = random.Random(seed)
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    rows = int(days * 24 * 6)
+    for d in range(devices):
+        stem = f"plug-{d}"
+        header = {
+            "schema_version": tasmota_scan.SCHEMA_VERSION,
+            "device": {"hostname": stem, "baseline_total_kwh": 0.0},
+            "entries_file": f"{stem}.jsonl",
+        }
+        (data_dir / f"{stem}.json").write_text(json.dumps(header), encoding="utf-8")
+        total = 0.0
+        with (data_dir / f"{stem}.jsonl").open("w", encoding="utf-8") as f:
+            for i in range(rows):
+                ts = start + timedelta(minutes=10 * i)
+                # Daily load curve plus random spikes.
+                watts = 40 + 30 * math.sin(i / 144 * 2 * math.pi) + (400 if rng.random() < 0.01 else 0)
+                total += watts / 6000
+                entry = {"ts": ts.isoformat(), "total_kwh": round(total, 3), "power_w": round(watts),
+                         "price_eur_per_kwh": 0.329, "cost_since_first_seen_eur": round(total * 0.329, 4)}
+                f.write(json.dumps(entry) + "\n")
+    return rows
+
+
+def _render(data_dir: Path, max_points, method: str, fmt: str):
+    out = data_dir / f"plot_{method}_{max_points}.{fmt}"
+    started = time.perf_counter()
+    with warnings.catch_warnings(), contextlib.redirect_stdout(io.StringIO()):
+        warnings.simplefilter("ignore")  # Agg: "cannot show the figure"
+        tasmota_scan.generate_cost_plot_per_device(data_dir, out, max_points=max_points, downsample=method)
+    elapsed = time.perf_counter() - started
+    plt.close("all")
+    return elapsed, out.stat().st_size
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Render time of the cost plot with and without downsampling.")
+    parser.add_argument("--devices", type=int, default=8)
+    parser.add_argument("--days", type=float, default=365.0, help="history per device (10-minute snapshots)")
+    parser.add_argument("--max-points", type=int, default=None, help="default: PNG width in pixels")
+    parser.add_argument("--format", choices=("png", "svg", "pdf"), default="png",
+                        help="output format (vector formats store every vertex)")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per variant (best is reported)")
+    args = parser.parse_args()
+
+    data_dir = Path(tempfile.mkdtemp(prefix="tasmota_bench_plot_"))
+    try:
+        rows = _write_logs(data_dir, args.devices, args.days)
+        tasmota_series.load_cost_series_cached(data_dir)  # warm the cache: time rendering, not parsing
+
+        print(f"📊 {args.devices} device(s) x {rows} points ({args.days:g} days, 10-minute snapshots)")
+        variants = [("all points", 0, "minmax"), ("minmax", args.max_points, "minmax"), ("lttb", args.max_points, "lttb")]
+        results = {}
+        for name, max_points, method in variants:
+            runs = [_render(data_dir, max_points, method, args.format) for _ in range(args.repeat)]
+            elapsed = min(r[0] for r in runs)
+            size = runs[-1][1]
+            results[name] = elapsed
+            print(f"  {name:<11} {elapsed:7.2f} s  {args.format.upper()} {size / 1024:9.1f} KiB")
+
+        base = results["all points"]
+        for name in ("minmax", "lttb"):
+            print(f"⚡ {name}: {base / max(results[name], 1e-9):.1f}x faster than drawing every point")
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
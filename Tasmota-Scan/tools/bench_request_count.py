@@ -0,0 +1,112 @@
+from __future__ import annotations
+
+import argparse
+import time
+from urllib.parse import parse_qs, urlparse
+
+import tasmota_http
+import tasmota_scan
+
+# -----------------------------------------------------------------------------
+# Request-count benchmark: "classic" (5 requests/device) vs. "oneshot"
+# (1 request/device). HTTP is replaced by canned Tasmota payloads with a fixed
+# per-request latency, so no devices are needed.
+#
+#   python -m tools.bench_request_count --devices 40 --latency 0.05
+# -----------------------------------------------------------------------------
+
+
+def _payloads(ip: str) -> dict:
+    n = int(ip.rsplit(".", 1)[-1])
+    status = {"DeviceName": f"Plug {n}", "FriendlyName": [f"Plug {n}"], "Module": 8, "Topic": f"tasmota_{n}"}
+    net = {"Hostname": f"plug-{n}", "IPAddress": ip, "Mac": f"54:32:04:00:00:{n:02X}"}
+    sts = {
+        "Time": "2026-01-01T12:00:00",
+        "Uptime": "1T02:03:04",
+        "UptimeSec": 93784,
+        "POWER": "ON",
+        "Wifi": {"SSId": "iot", "RSSI": 72, "Signal": -64},
+    }
+    sns = {
+        "Time": "2026-01-01T12:00:00",
+        "ENERGY": {"Total": 100.0 + n, "Yesterday": 1.2, "Today": 0.4, "Power": 35, "Voltage": 231, "Current": 0.18},
+    }
+    return {
+        "status 0": {"Status": status, "StatusFWR": {"Version": "13.4.0(tasmota)"},
+                     "StatusNET": net, "StatusSTS": sts, "StatusSNS": sns},
+        "status 5": {"StatusNET": net},
+        "status 11": {"StatusSTS": sts},
+        "status 8": {"StatusSNS": sns},
+        "state": dict(sts),  # a real State reply has no Hostname
+    }
+
+
+class _FakeResponse:
+    def __init__(self, data: dict):
+        self._data = data
+        self.text = ""
+
+    def raise_for_status(self):
+        return None
+
+    def json(self):
+        return self._data
+
+
+class _FakeSession:
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    def get(self, url, timeout=None, **_kwargs):
+        time.sleep(self.latency)
+        parsed = urlparse(url)
+        cmnd = parse_qs(parsed.query).get("cmnd", [""])[0].lower()
+        return _FakeResponse(_payloads(parsed.hostname).get(cmnd, {}))
+
+
+def _run(mode: str, ips: list[str], latency: float):
+    original = tasmota_http._session
+    tasmota_http._session = _FakeSession(latency)
+    tasmota_http.reset_stats()
+    try:
+        started = time.perf_counter()
+        results = [tasmota_scan.fetch_telemetry(ip, mode=mode) for ip in ips]
+        elapsed = time.perf_counter() - started
+    finally:
+        tasmota_http._session = original
+    return tasmota_http.get_stats()["requests"], elapsed, results
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Compare HTTP requests per cycle: classic vs. oneshot fetch.")
+    parser.add_argument("--devices", type=int, default=40)
+    parser.add_argument("--latency", type=float, default=0.05, help="simulated seconds per request")
+    args = parser.parse_args()
+
+    ips = [f"10.0.0.{i}" for i in range(1, args.devices + 1)]
+    rows = {}
+    for mode in ("classic", "oneshot"):
+        rows[mode] = _run(mode, ips, args.latency)
+
+    print(f"📊 {args.devices} device(s), {args.latency * 1000:.0f} ms per request (sequential)")
+    for mode, (count, elapsed, _results) in rows.items():
+        print(f"  {mode:<8} {count:>6} requests  {count / len(ips):.1f}/device  {elapsed:7.2f} s")
+
+    classic_count, classic_s, classic_results = rows["classic"]
+    oneshot_count, oneshot_s, oneshot_results = rows["oneshot"]
+    print(f"⚡ Requests: {classic_count / max(oneshot_count, 1):.1f}x fewer, "
+          f"time: {classic_s / max(oneshot_s, 1e-9):.1f}x faster")
+
+    # Both modes must produce the same fields the logger uses.
+    for classic, oneshot in zip(classic_results, oneshot_results):
+        if classic["energy_data"] != oneshot["energy_data"] or \
+                classic["device_info"]["mac"] != oneshot["device_info"]["mac"] or \
+                tasmota_scan._device_log_stem(classic["device_info"], classic["state_data"]) != \
+                tasmota_scan._device_log_stem(oneshot["device_info"], oneshot["state_data"]):
+            print("❌ oneshot result differs from classic result")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,204 @@
+from __future__ import annotations
+
+import argparse
+import contextlib
+import io
+import json
+import platform
+import shutil
+import subprocess
+import tempfile
+import time
+import warnings
+from datetime import datetime
+from pathlib import Path
+
+import matplotlib
+
+matplotlib.use("Agg")
+
+import matplotlib.pyplot as plt  # noqa: E402
+
+import tasmota_http  # noqa: E402
+import tasmota_scan  # noqa: E402
+from tools.fake_fleet import FakeFleet  # noqa: E402
+
+# -----------------------------------------------------------------------------
+# Scan benchmark suite against a simulated fleet (tools/fake_fleet.py).
+#
+# Per fleet size: discovery of the fleet's address range, telemetry fetch of
+# every device, persistence (one snapshot per device and cycle) and the cost
+# plot. Each run is appended to a JSONL file with the git revision, so a
+# regression shows up as a number; the table compares with the previous run
+# of the same size and settings.
+#
+#   sudo python -m tools.bench_scan --sizes 10 100 1000 --dead 0.02
+# -----------------------------------------------------------------------------
+
+PHASES = ("discovery", "fetch", "persist", "plot")
+
+
+def _git_revision():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5,
+                             cwd=Path(__file__).parent)
+        return out.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def _reset_http():
+    tasmota_http.close_session()
+    tasmota_http.reset_stats()
+    tasmota_http.reset_hosts()
+
+
+@contextlib.contextmanager
+def _quiet():
+    with warnings.catch_warnings(), contextlib.redirect_stdout(io.StringIO()):
+        warnings.simplefilter("ignore")
+        yield
+
+
+def _timed(fn):
+    started = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - started, result
+
+
+def bench_size(size: int, args, data_dir: Path) -> dict:
+    fleet = FakeFleet(size, port=args.port, latency=args.latency, jitter=args.jitter, loss=args.loss,
+                      dead=args.dead, empty=args.empty, seed=args.seed)
+    fleet.start()
+    row = {"devices": size, "dead": len(fleet.ips) - len(fleet.live_ips)}
+    try:
+        _reset_http()
+        with _quiet():
+            seconds, found = _timed(lambda: tasmota_scan.discover_tasmota(
+                [fleet.range], concurrency=args.concurrency))
+        row["discovery"] = seconds
+        row["found"] = len(found)
+
+        _reset_http()
+        results = []
+        with _quiet():
+            seconds, _ = _timed(lambda: tasmota_scan.fetch_fleet(
+                lambda ip, result, error: results.append((ip, result, error)), targets=fleet.ips, seed=False))
+        row["fetch"] = seconds
+        row["fetched"] = sum(1 for _ip, r, e in results if e is None and tasmota_scan._normalize_mac(
+            (r.get("device_info") or {}).get("mac")))
+        row["http"] = tasmota_http.get_stats()
+
+        persist = []
+        for _cycle in range(args.cycles):
+            with _quiet():
+                seconds, _ = _timed(lambda: _persist_all(results))
+            persist.append(seconds)
+        row["persist"] = persist[-1]
+        row["persist_first"] = persist[0]
+        row["log_bytes"] = sum(p.stat().st_size for p in data_dir.glob("*.json*"))
+
+        png = data_dir / "bench_plot.png"
+        with _quiet():
+            seconds, _ = _timed(lambda: tasmota_scan.generate_cost_plot_per_device(data_dir, png))
+        plt.close("all")
+        row["plot"] = seconds
+    finally:
+        fleet.stop()
+    return row
+
+
+def _persist_all(results):
+    tasmota_scan.load_manifest()
+    for _ip, result, error in results:
+        if error is None and tasmota_scan._normalize_mac((result.get("device_info") or {}).get("mac")):
+            tasmota_scan._persist_device(result["device_info"], result["state_data"], result["energy_data"])
+    tasmota_scan.save_manifest()
+
+
+def _settings(args) -> dict:
+    return {k: getattr(args, k) for k in ("latency", "jitter", "loss", "dead", "empty", "cycles", "concurrency")}
+
+
+def _previous(output: Path, settings: dict) -> dict:
+    """Last recorded row per fleet size with the same settings."""
+    rows = {}
+    try:
+        with output.open("r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    run = json.loads(line)
+                except ValueError:
+                    continue
+                if run.get("settings") == settings:
+                    for row in run.get("results") or []:
+                        rows[row["devices"]] = row
+    except OSError:
+        pass
+    return rows
+
+
+def _delta(now, before):
+    if not before:
+        return ""
+    change = (now - before) / before * 100
+    return f" ({change:+.0f}%)"
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark scan phases against a simulated Tasmota fleet.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--port", type=int, default=80, help="fleet port (discovery probes port 80)")
+    parser.add_argument("--latency", type=float, default=0.03)
+    parser.add_argument("--jitter", type=float, default=0.02)
+    parser.add_argument("--loss", type=float, default=0.0)
+    parser.add_argument("--dead", type=float, default=0.0)
+    parser.add_argument("--empty", type=int, default=16, help="addresses without a device in the swept range")
+    parser.add_argument("--cycles", type=int, default=3, help="persist cycles (the last one is reported)")
+    parser.add_argument("--concurrency", type=int, default=tasmota_scan.DISCOVERY_CONCURRENCY)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", type=Path, default=Path("bench_scan_results.jsonl"),
+                        help="results are appended here (default: %(default)s)")
+    args = parser.parse_args()
+
+    tasmota_scan._ensure_utf8_stdout()
+    settings = _settings(args)
+    previous = _previous(args.output, settings)
+    original_data_dir = tasmota_scan.DATA_DIR
+    results = []
+    try:
+        for size in args.sizes:
+            data_dir = Path(tempfile.mkdtemp(prefix="tasmota_bench_scan_"))
+            tasmota_scan.DATA_DIR = data_dir
+            try:
+                row = bench_size(size, args, data_dir)
+            except OSError as exc:
+                print(f"❌ Fleet of {size}: {exc} (port {args.port} needs root or CAP_NET_BIND_SERVICE)")
+                return 2
+            finally:
+                shutil.rmtree(data_dir, ignore_errors=True)
+            results.append(row)
+            before = previous.get(size) or {}
+            print(f"📊 {size} device(s) ({row['dead']} dead): found {row['found']}, fetched {row['fetched']}")
+            for phase in PHASES:
+                print(f"  {phase:<10} {row[phase]:8.2f} s{_delta(row[phase], before.get(phase))}")
+            print(f"  🔗 {tasmota_http.format_stats(row['http'])}")
+    finally:
+        tasmota_scan.DATA_DIR = original_data_dir
+        _reset_http()
+
+    run = {
+        "at": datetime.now().astimezone().isoformat(timespec="seconds"),
+        "revision": _git_revision(),
+        "python": platform.python_version(),
+        "settings": settings,
+        "results": results,
+    }
+    with args.output.open("a", encoding="utf-8") as f:
+        f.write(json.dumps(run) + "\n")
+    print(f"💾 Results appended to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
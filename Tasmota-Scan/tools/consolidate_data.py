@@ -0,0 +1,319 @@
+from __future__ import annotations
+
+import argparse
+import heapq
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import tasmota_scan
+
+# -----------------------------------------------------------------------------
+# Bulk consolidation of device logs.
+#
+# Groups every log in data/ (plus data folders copied from other scanner
+# hosts, --import) by MAC, or by hostname when the MAC is unknown, and merges
+# each group into the canonical data/<Hostname>.json + .jsonl:
+#   - entries: streaming k-way merge (heapq.merge) of the already time-sorted
+#     inputs, de-duplicated on the fly with the same key as a scan merge
+#     (ts, ip, total_kwh); a source that turns out to be unsorted is sorted
+#     in memory instead
+#   - header: merged with tasmota_scan._merge_device_logs
+#   - output written to temp files and replaced atomically; merged sources in
+#     data/ are archived as *.bak (imported folders are never modified)
+# Groups are independent and run in parallel on all CPU cores.
+#
+#   python -m tools.consolidate_data --dry-run
+#   python -m tools.consolidate_data --import /mnt/pi2/data --workers 4
+# -----------------------------------------------------------------------------
+
+_NO_EPOCH = float("-inf")
+
+
+class _Unsorted(Exception):
+    pass
+
+
+def _read_member(path: Path) -> dict:
+    header = tasmota_scan.load_device_log(path, with_entries=False)
+    dev = header.get("device") or {}
+    return {
+        "path": path,
+        "mac": tasmota_scan._normalize_mac(dev.get("mac")),
+        "hostname": dev.get("hostname") or dev.get("name"),
+        "last_seen": dev.get("last_seen"),
+    }
+
+
+def _group_key_for_hostname(hostname) -> str | None:
+    return f"host:{str(hostname).strip().lower()}" if hostname else None
+
+
+def group_logs(data_dir: Path, import_dirs=()) -> dict:
+    """{group key: [member dicts]} for all logs; MAC first, hostname as fallback."""
+    members = []
+    for folder in [data_dir, *import_dirs]:
+        members.extend(_read_member(p) for p in sorted(folder.glob("*.json")))
+
+    mac_by_hostname = {}
+    for m in members:
+        key = _group_key_for_hostname(m["hostname"])
+        if m["mac"] and key:
+            mac_by_hostname.setdefault(key, set()).add(m["mac"])
+
+    groups = {}
+    for m in members:
+        if m["mac"]:
+            key = m["mac"]
+        else:
+            host_key = _group_key_for_hostname(m["hostname"])
+            macs = mac_by_hostname.get(host_key) or set()
+            # A MAC-less log joins a MAC group only if the hostname is unambiguous.
+            key = next(iter(macs)) if len(macs) == 1 else (host_key or f"stem:{m['path'].stem.split('__')[0]}")
+        groups.setdefault(key, []).append(m)
+    return groups
+
+
+def _target_path(data_dir: Path, members: list) -> Path:
+    """data/<Hostname>.json (newest hostname of the group), like a scan would write."""
+    newest = members[0]
+    for m in members[1:]:
+        if tasmota_scan._max_iso(newest["last_seen"], m["last_seen"]) != newest["last_seen"]:
+            newest = m
+    fallback = newest["mac"] or newest["path"].stem.split("__")[0]
+    return data_dir / f"{tasmota_scan._safe_filename(newest['hostname'], fallback=fallback)}.json"
+
+
+def _epoch_key(entry: dict) -> float:
+    epoch = tasmota_scan._entry_epoch(entry)
+    return _NO_EPOCH if epoch is None else epoch
+
+
+def _iter_sorted(path: Path, header: dict):
+    """Entries of one log in time order; raises _Unsorted if they aren't."""
+    if int(header.get("schema_version") or 1) >= 2:
+        entries = _iter_jsonl(tasmota_scan._entries_path(path, header))
+    else:
+        entries = iter(tasmota_scan.load_device_log(path).get("entries") or [])
+    last = _NO_EPOCH
+    for entry in entries:
+        epoch = _epoch_key(entry)
+        if epoch < last:
+            raise _Unsorted(path)
+        last = epoch
+        yield epoch, entry
+
+
+def _iter_jsonl(path: Path):
+    try:
+        with path.open("r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if isinstance(entry, dict):
+                    yield entry
+    except OSError:
+        return
+
+
+def _iter_in_memory(path: Path, header: dict):
+    entries = tasmota_scan.load_device_log(path).get("entries") or []
+    return iter(sorted(((_epoch_key(e), e) for e in entries), key=lambda x: x[0]))
+
+
+def _entry_key(e: dict):
+    """Same identity as _merge_device_logs."""
+    total = e.get("total_kwh")
+    if isinstance(total, float):
+        total = round(total, 6)
+    return ((e.get("ts") or "").strip(), (e.get("ip") or "").strip(), total)
+
+
+def merge_entries(streams):
+    """k-way merge of (epoch, entry) streams, de-duplicated; yields entries.
+
+    Duplicates have the same `ts`, so they are adjacent in the merged stream:
+    only the entries of the current timestamp are held in memory. Missing
+    fields of the first copy are filled from later copies.
+    """
+    run_epoch = None
+    run = {}
+    for epoch, entry in heapq.merge(*streams, key=lambda x: x[0]):
+        if epoch != run_epoch:
+            yield from run.values()
+            run_epoch, run = epoch, {}
+        key = _entry_key(entry)
+        existing = run.get(key)
+        if existing is None:
+            run[key] = dict(entry)
+            continue
+        for k, v in entry.items():
+            if existing.get(k) is None and v is not None:
+                existing[k] = v
+    yield from run.values()
+
+
+def _write_merged(sources, out) -> int:
+    """Write the merged entries to `out` (None: count only); returns #entries."""
+    written = 0
+    for entry in merge_entries(sources):
+        tasmota_scan._backfill_ts_epoch([entry])
+        if out is not None:
+            out.write(tasmota_scan._entry_line(entry))
+        written += 1
+    return written
+
+
+def consolidate_group(target: Path, paths: list, data_dir: Path, dry_run: bool = False) -> dict:
+    """Merge one group of logs into `target`. Runs in a worker process."""
+    started = time.perf_counter()
+    paths = sorted(paths, key=lambda p: (p != target, "__" in p.stem, str(p)))
+    headers = [tasmota_scan.load_device_log(p, with_entries=False) for p in paths]
+
+    merged = dict(headers[0], entries=[])
+    for header in headers[1:]:
+        tasmota_scan._merge_device_logs(merged, dict(header, entries=[]))
+    merged.pop("entries", None)
+    merged["schema_version"] = tasmota_scan.SCHEMA_VERSION
+    merged["entries_file"] = target.stem + ".jsonl"
+    entries_path = target.with_name(merged["entries_file"])
+    tmp_entries = entries_path.with_name(entries_path.name + ".tmp")
+
+    # Stream first; a source found out of order is re-read sorted in memory.
+    unsorted = []
+    while True:
+        sources = [
+            _iter_in_memory(p, h) if p in unsorted else _iter_sorted(p, h)
+            for p, h in zip(paths, headers)
+        ]
+        try:
+            if dry_run:
+                written = _write_merged(sources, None)
+            else:
+                target.parent.mkdir(parents=True, exist_ok=True)
+                with tmp_entries.open("w", encoding="utf-8") as out:
+                    written = _write_merged(sources, out)
+            break
+        except _Unsorted as exc:
+            unsorted.append(exc.args[0])
+        except BaseException:
+            tmp_entries.unlink(missing_ok=True)
+            raise
+
+    entries_in = sum(_count_entries(p, h) for p, h in zip(paths, headers))
+    archived = []
+    if not dry_run:
+        tmp_entries.replace(entries_path)
+        merged.pop("rollups", None)  # recomputed from the merged history
+        tasmota_scan._ensure_rollups(target, merged)
+        tasmota_scan._write_header(target, merged)
+        for p in paths:
+            if p != target and p.parent == data_dir:
+                tasmota_scan._archive_device_log(p)
+                archived.append(p.name)
+
+    return {
+        "target": target.name,
+        "sources": [str(p) for p in paths],
+        "entries_in": entries_in,
+        "entries_out": written,
+        "sorted_in_memory": [p.name for p in unsorted],
+        "archived": archived,
+        "seconds": time.perf_counter() - started,
+    }
+
+
+def _count_entries(path: Path, header: dict) -> int:
+    if int(header.get("schema_version") or 1) >= 2:
+        try:
+            with tasmota_scan._entries_path(path, header).open("rb") as f:
+                return sum(1 for line in f if line.strip())
+        except OSError:
+            return 0
+    return len(tasmota_scan.load_device_log(path).get("entries") or [])
+
+
+def plan(data_dir: Path, import_dirs=()):
+    """([(target, [paths])] for groups that need work, [(target, [paths])] skipped)."""
+    groups = list(group_logs(data_dir, import_dirs).values())
+    in_data_dir = {m["path"] for members in groups for m in members if m["path"].parent == data_dir}
+    jobs, conflicts = [], []
+    claimed = set()
+    for members in groups:
+        target = _target_path(data_dir, members)
+        paths = [m["path"] for m in members]
+        if paths == [target]:
+            claimed.add(target)
+            continue  # single canonical log, nothing to merge
+        if (target in in_data_dir and target not in paths) or target in claimed:
+            # Same hostname, different MAC: leave both devices alone.
+            conflicts.append((target, paths))
+            continue
+        claimed.add(target)
+        jobs.append((target, paths))
+    return sorted(jobs, key=lambda job: str(job[0])), conflicts
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Merge all device logs by MAC/hostname, in parallel.")
+    parser.add_argument("data_dir", nargs="?", type=Path, default=tasmota_scan.DATA_DIR)
+    parser.add_argument("--import", dest="import_dirs", action="append", type=Path, default=[],
+                        help="data folder of another scanner host to merge in (repeatable, read-only)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="parallel processes")
+    parser.add_argument("--dry-run", action="store_true", help="only report what would be merged")
+    args = parser.parse_args()
+
+    tasmota_scan._ensure_utf8_stdout()
+    for folder in [args.data_dir, *args.import_dirs]:
+        if not folder.exists():
+            print(f"❌ data folder not found: {folder}")
+            return 2
+
+    started = time.perf_counter()
+    jobs, conflicts = plan(args.data_dir, args.import_dirs)
+    for target, paths in conflicts:
+        print(f"⚠️  {target.name} belongs to another device (MAC), skipped: {', '.join(p.name for p in paths)}")
+    if not jobs:
+        print("✅ Nothing to consolidate: one log per device.")
+        return 0
+
+    results = []
+    failed = 0
+    with ProcessPoolExecutor(max_workers=max(1, args.workers)) as pool:
+        futures = [
+            pool.submit(consolidate_group, target, paths, args.data_dir, args.dry_run)
+            for target, paths in jobs
+        ]
+        for (target, _paths), future in zip(jobs, futures):
+            try:
+                results.append(future.result())
+            except Exception as exc:
+                failed += 1
+                print(f"❌ {target.name}: {exc} (sources left untouched)")
+
+    verb = "would merge" if args.dry_run else "merged"
+    for r in results:
+        dropped = r["entries_in"] - r["entries_out"]
+        print(f"{'🔎' if args.dry_run else '✅'} {r['target']}: {verb} {len(r['sources'])} file(s), "
+              f"{r['entries_in']} -> {r['entries_out']} entries ({dropped} duplicate(s))")
+        for source in r["sources"]:
+            print(f"    {source}")
+        if r["sorted_in_memory"]:
+            print(f"    ℹ️  unsorted, sorted in memory: {', '.join(r['sorted_in_memory'])}")
+
+    print(f"📦 {len(results)} group(s) {verb}, {failed} failed "
+          f"({time.perf_counter() - started:.1f} s, {args.workers} worker(s))")
+    if results and not args.dry_run:
+        print("ℹ️  Rebuild the optional stores: python tasmota_columnar.py import / python tasmota_sqlite.py import")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,276 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import ipaddress
+import json
+import random
+import threading
+import time
+from urllib.parse import parse_qs, urlsplit
+
+# -----------------------------------------------------------------------------
+# Simulated Tasmota fleet on loopback addresses.
+#
+# One asyncio server listens on 0.0.0.0:<port>; the local address a client
+# connected to selects the device (127.0.0.0/8 is all loopback on Linux, so
+# no aliases are needed). Every device answers like Tasmota 13:
+#   /                      web UI page (~5 KB, "Tasmota" in the footer)
+#   /cm?cmnd=Status        /cm?cmnd=Status 0|5|8|11    /cm?cmnd=State
+# with keep-alive, a configurable latency + jitter, "lost" requests (never
+# answered, the client times out) and dead devices (connect, then silence).
+# Addresses in the range without a device close the connection at once.
+# Energy counters advance with each device's power draw in real time.
+#
+#   sudo python -m tools.fake_fleet --devices 200 --latency 0.03 --jitter 0.02 --dead 0.05
+#
+# Discovery probes port 80, so a full scan needs --port 80 (root or
+# CAP_NET_BIND_SERVICE); with another port, poll "ip:port" targets.
+# -----------------------------------------------------------------------------
+
+DEFAULT_BASE = "127.20.0.1"
+
+_WEB_PAGE = (
+    "<!DOCTYPE html><html lang=\"en\"><head><meta charset='utf-8'><title>{name} - Main Menu</title>"
+    "<script>var x=null,lt,to,tp,pc='';function la(p){{}}</script>"
+    + "<style>div,fieldset,input,select{{padding:5px;font-size:1em;}}</style>" * 20
+    + "</head><body><div id=but3d style=\"display: block;\"></div>"
+    + "<p></p><form action='' method='get'><button>Toggle</button></form>" * 10
+    + "<div style='text-align:right;font-size:11px;'><hr/>"
+    "<a href='https://bit.ly/tasmota' target='_blank' style='color:#aaa;'>Tasmota 13.4.0 by Theo Arends</a>"
+    "</div></body></html>"
+)
+
+
+class FakeDevice:
+    def __init__(self, n: int, ip: str, rng: random.Random, dead: bool = False):
+        self.n = n
+        self.ip = ip
+        self.dead = dead
+        self.hostname = f"fake-{n:04d}"
+        self.mac = "54:32:04:{:02X}:{:02X}:{:02X}".format((n >> 16) & 0xFF, (n >> 8) & 0xFF, n & 0xFF)
+        self.power_w = round(rng.uniform(0.5, 400.0), 1)
+        self.power_on = rng.random() > 0.2
+        self.total_kwh = round(rng.uniform(1.0, 900.0), 3)
+        self.started = time.time()
+
+    def _energy(self):
+        elapsed_h = (time.time() - self.started) / 3600
+        power = self.power_w if self.power_on else 0.0
+        total = self.total_kwh + power * elapsed_h / 1000
+        return {
+            "TotalStartTime": "2024-01-01T00:00:00",
+            "Total": round(total, 3),
+            "Yesterday": round(power * 24 / 1000, 3),
+            "Today": round(power * (time.localtime().tm_hour + 1) / 1000, 3),
+            "Power": power,
+            "ApparentPower": power,
+            "ReactivePower": 0,
+            "Factor": 1.0 if power else 0.0,
+            "Voltage": 230,
+            "Current": round(power / 230, 3),
+        }
+
+    def _sts(self):
+        uptime = int(time.time() - self.started) + 3600
+        return {
+            "Time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "Uptime": f"{uptime // 86400}T{time.strftime('%H:%M:%S', time.gmtime(uptime % 86400))}",
+            "UptimeSec": uptime,
+            "Heap": 25,
+            "POWER": "ON" if self.power_on else "OFF",
+            "Wifi": {"AP": 1, "SSId": "iot", "BSSId": "AA:BB:CC:00:11:22", "Channel": 6,
+                     "Mode": "11n", "RSSI": 60 + self.n % 40, "Signal": -80 + self.n % 40},
+        }
+
+    def payload(self, cmnd: str):
+        """JSON reply to a console command (None: unknown page)."""
+        status = {"Module": 8, "DeviceName": f"Fake {self.n}", "FriendlyName": [f"Fake {self.n}"],
+                  "Topic": f"tasmota_{self.mac.replace(':', '')[-6:]}", "Power": int(self.power_on)}
+        net = {"Hostname": self.hostname, "IPAddress": self.ip, "Gateway": "127.0.0.1",
+               "Subnetmask": "255.0.0.0", "Mac": self.mac}
+        sns = {"Time": time.strftime("%Y-%m-%dT%H:%M:%S"), "ENERGY": self._energy()}
+        cmnd = " ".join(cmnd.lower().split())
+        if cmnd == "status":
+            return {"Status": status}
+        if cmnd == "status 0":
+            return {"Status": status, "StatusFWR": {"Version": "13.4.0(tasmota)", "Core": "2_7_4_9"},
+                    "StatusNET": net, "StatusSTS": self._sts(), "StatusSNS": sns}
+        if cmnd == "status 5":
+            return {"StatusNET": net}
+        if cmnd == "status 8":
+            return {"StatusSNS": sns}
+        if cmnd == "status 11":
+            return {"StatusSTS": self._sts()}
+        if cmnd == "state":
+            return self._sts()
+        if cmnd.startswith("power"):
+            arg = cmnd[5:].strip()
+            if arg in ("toggle", "2"):
+                self.power_on = not self.power_on
+            elif arg in ("on", "1"):
+                self.power_on = True
+            elif arg in ("off", "0"):
+                self.power_on = False
+            return {"POWER": "ON" if self.power_on else "OFF"}
+        return {"Command": "Unknown"}
+
+
+class FakeFleet:
+    """N fake devices on consecutive loopback addresses, served from a background thread."""
+
+    def __init__(self, devices: int, base: str = DEFAULT_BASE, port: int = 80, latency: float = 0.03,
+                 jitter: float = 0.02, loss: float = 0.0, dead: float = 0.0, empty: int = 0, seed: int = 1):
+        rng = random.Random(seed)
+        first = int(ipaddress.ip_address(base))
+        self.port = port
+        self.latency = latency
+        self.jitter = jitter
+        self.loss = loss
+        self.rng = rng
+        self.devices = {}
+        for n in range(devices):
+            ip = str(ipaddress.ip_address(first + n))
+            self.devices[ip] = FakeDevice(n, ip, rng, dead=rng.random() < dead)
+        # `empty` addresses after the devices: part of range(), no device.
+        self.range = f"{base}-{ipaddress.ip_address(first + devices + empty - 1)}"
+        self.requests = 0
+        self._loop = None
+        self._server = None
+        self._thread = None
+
+    @property
+    def ips(self):
+        return list(self.devices)
+
+    @property
+    def live_ips(self):
+        return [ip for ip, d in self.devices.items() if not d.dead]
+
+    async def _handle(self, reader, writer):
+        local_ip = writer.get_extra_info("sockname")[0]
+        device = self.devices.get(local_ip)
+        try:
+            if device is None:
+                return  # no device at this address: close
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    return
+                while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    pass  # headers
+                self.requests += 1
+                if device.dead or self.rng.random() < self.loss:
+                    await asyncio.sleep(3600)  # never answered
+                delay = max(self.latency + self.rng.uniform(-self.jitter, self.jitter), 0.0)
+                if delay:
+                    await asyncio.sleep(delay)
+                parts = request_line.decode("latin-1").split()
+                target = parts[1] if len(parts) > 1 else "/"
+                close = request_line.rstrip().endswith(b"HTTP/1.0")
+                writer.write(self._response(device, target, close))
+                await writer.drain()
+                if close:
+                    return
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+    def _response(self, device, target, close):
+        url = urlsplit(target)
+        if url.path == "/cm":
+            cmnd = parse_qs(url.query).get("cmnd", [""])[0]
+            body = json.dumps(device.payload(cmnd), separators=(",", ":")).encode()
+            content_type = "application/json"
+        else:
+            body = _WEB_PAGE.format(name=f"Fake {device.n}").encode()
+            content_type = "text/html"
+        headers = (f"HTTP/1.1 200 OK\r\nContent-Type: {content_type}\r\nContent-Length: {len(body)}\r\n"
+                   f"Connection: {'close' if close else 'keep-alive'}\r\n\r\n")
+        return headers.encode("ascii") + body
+
+    def start(self):
+        """Start serving in a daemon thread; raises OSError if the port can't be bound."""
+        ready = threading.Event()
+        errors = []
+
+        def _run():
+            self._loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self._loop)
+            try:
+                self._server = self._loop.run_until_complete(
+                    asyncio.start_server(self._handle, "0.0.0.0", self.port, backlog=4096, reuse_address=True))
+            except OSError as exc:
+                errors.append(exc)
+                ready.set()
+                return
+            ready.set()
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=_run, daemon=True)
+        self._thread.start()
+        ready.wait()
+        if errors:
+            raise errors[0]
+        return self
+
+    def stop(self):
+        if self._loop is None:
+            return
+
+        async def _close():
+            self._server.close()
+            for task in asyncio.all_tasks():
+                if task is not asyncio.current_task():
+                    task.cancel()
+
+        asyncio.run_coroutine_threadsafe(_close(), self._loop).result(5)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(5)
+        self._loop = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Serve a simulated Tasmota fleet on loopback addresses.")
+    parser.add_argument("--devices", type=int, default=50)
+    parser.add_argument("--base", default=DEFAULT_BASE, help="first device address (default: %(default)s)")
+    parser.add_argument("--port", type=int, default=80)
+    parser.add_argument("--latency", type=float, default=0.03, help="seconds per reply")
+    parser.add_argument("--jitter", type=float, default=0.02, help="+/- seconds")
+    parser.add_argument("--loss", type=float, default=0.0, help="fraction of requests never answered")
+    parser.add_argument("--dead", type=float, default=0.0, help="fraction of devices that never answer")
+    parser.add_argument("--empty", type=int, default=0, help="addresses without a device after the fleet")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    fleet = FakeFleet(args.devices, base=args.base, port=args.port, latency=args.latency, jitter=args.jitter,
+                      loss=args.loss, dead=args.dead, empty=args.empty, seed=args.seed)
+    try:
+        fleet.start()
+    except OSError as exc:
+        print(f"❌ Cannot listen on port {args.port}: {exc} (port 80 needs root or CAP_NET_BIND_SERVICE)")
+        return 2
+    dead = len(fleet.ips) - len(fleet.live_ips)
+    print(f"🧪 {len(fleet.ips)} fake device(s) ({dead} dead) on {fleet.range}, port {args.port}")
+    print(f"   python tasmota_scan.py {fleet.range} --no-plot --no-seed")
+    print("⛔ Stop with Ctrl+C")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        fleet.stop()
+        print(f"📨 {fleet.requests} request(s) served")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -3,6 +3,7 @@ from __future__ import annotations
 import json
 from pathlib import Path
 
+import tasmota_rollups
 import tasmota_scan
 
 # -----------------------------------------------------------------------------
@@ -24,16 +25,13 @@ def _read_json(path: Path) -> dict:
             "entries": [],
         }
     with path.open("r", encoding="utf-8") as f:
-        return json.load(f)
+        json.load(f)  # raise on a corrupt file instead of merging an empty log
+    return tasmota_scan.load_device_log(path)
 
 
 def _write_json_atomic(path: Path, data: dict) -> None:
-    path.parent.mkdir(parents=True, exist_ok=True)
-    tmp = path.with_name(path.name + ".tmp")
-    with tmp.open("w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
-        f.write("\n")
-    tmp.replace(path)
+    # Header + JSONL entries, both replaced atomically; raises if the write fails.
+    tasmota_scan.save_device_log(path, data, raise_errors=True)
 
 
 def main() -> int:
@@ -53,12 +51,19 @@ def main() -> int:
     try:
         main_data = _read_json(p1)
         other_data = _read_json(p2)
+        other_entries = tasmota_scan._entries_path(p2, other_data)
+        other_rollups = tasmota_rollups.rows_path(p2, other_data.get("rollups"))
 
         tasmota_scan._merge_device_logs(main_data, other_data)
         _write_json_atomic(p1, main_data)
 
         # Only delete after successful write.
         p2.unlink()
+        if other_entries.exists() and other_entries != tasmota_scan._entries_path(p1, main_data):
+            other_entries.unlink()
+        # Its rollups are part of the merged (rebuilt) ones now.
+        if other_rollups.exists() and other_rollups != tasmota_rollups.rows_path(p1, main_data.get("rollups")):
+            other_rollups.unlink()
         print(f"✅ Merged into: {p1}")
         print(f"🗑️  Deleted source: {p2}")
         return 0
@@ -0,0 +1,49 @@
+from __future__ import annotations
+
+import argparse
+from pathlib import Path
+
+import tasmota_scan
+
+# -----------------------------------------------------------------------------
+# One-time migration of schema 1 device logs (one JSON file with all entries,
+# rewritten on every scan) to schema 2 (small JSON header + append-only
+# "<stem>.jsonl"). Originals are kept as "<name>.v1.bak".
+# Entries written before `ts_epoch` existed get it backfilled from `ts`.
+#
+#   python -m tools.migrate_logs [data_dir]
+# -----------------------------------------------------------------------------
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Migrate device logs to the append-only JSONL format.")
+    parser.add_argument("data_dir", nargs="?", type=Path, default=tasmota_scan.DATA_DIR)
+    args = parser.parse_args()
+
+    if not args.data_dir.exists():
+        print(f"❌ data folder not found: {args.data_dir}")
+        return 2
+
+    migrated = 0
+    backfilled = 0
+    skipped = 0
+    for path in sorted(args.data_dir.glob("*.json")):
+        data = tasmota_scan.load_device_log(path)
+        if tasmota_scan.migrate_device_log(path, data):
+            migrated += 1
+            print(f"✅ {path.name}: {len(data.get('entries') or [])} entries -> {tasmota_scan._entries_path(path).name}")
+            continue
+        updated = tasmota_scan._backfill_ts_epoch(data.get("entries") or [])
+        if updated:
+            tasmota_scan.save_device_log(path, data)
+            backfilled += 1
+            print(f"🕒 {path.name}: ts_epoch added to {updated} entries")
+        else:
+            skipped += 1
+
+    print(f"📦 Migrated: {migrated}, ts_epoch backfilled: {backfilled}, already up to date: {skipped}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())